@@ -0,0 +1,75 @@
+"""プロバイダー呼び出しの並行性を確認する負荷テスト（ローカルのスタブを使用）
+
+同期クライアントを async 関数内で呼ぶ従来の方式と、非同期プロバイダーを比較する。
+並行リクエストが重なって処理されているか、その間イベントループが応答できるか
+（/health 相当の遅延）を表示する。
+
+使い方 (backend ディレクトリで実行):
+    python -m benchmarks.bench_concurrency [同時リクエスト数] [レイテンシ秒]
+"""
+import asyncio
+import sys
+import time
+
+from betterways.providers import Provider
+
+
+class StubProvider(Provider):
+    """一定時間待ってから応答するスタブ"""
+
+    name = "stub"
+
+    def __init__(self, latency: float, max_concurrency: int):
+        super().__init__(max_concurrency)
+        self.latency = latency
+
+    async def _generate(self, prompt, system):
+        await asyncio.sleep(self.latency)
+        return f"echo: {prompt}"
+
+
+class BlockingStubProvider(StubProvider):
+    """同期クライアントを直接呼んでいた従来の挙動を再現するスタブ"""
+
+    async def _generate(self, prompt, system):
+        time.sleep(self.latency)
+        return f"echo: {prompt}"
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.01):
+    """イベントループの最大遅延を計測する"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(provider: Provider, requests: int):
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(provider.generate(f"req {i}") for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lag = await lag_task
+    print(
+        f"  {type(provider).__name__:<22} {requests} reqs  wall {elapsed:6.2f}s  "
+        f"max loop lag {lag * 1000:8.1f} ms"
+    )
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+
+    print(f"latency {latency}s per call, serial time would be {requests * latency:.2f}s")
+    await run(BlockingStubProvider(latency, max_concurrency=requests), requests)
+    for limit in (1, 4, requests):
+        print(f" max_concurrency={limit}")
+        await run(StubProvider(latency, max_concurrency=limit), requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""HTTP 接続の使い回しを確認するベンチマーク（ローカルのスタブを使用）
+
+リクエストごとにクライアントを作る場合と、接続プールを持つ OpenAIProvider
+（ウォームアップ無し / 有り）で、開いた接続数とレイテンシを比べる。
+スタブは新しい接続ごとに --handshake 秒待つ（TLS ハンドシェイクの模擬）。
+
+使い方 (backend ディレクトリで実行):
+    python -m benchmarks.bench_connections [リクエスト数] [同時実行数] [handshake秒]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+from betterways.providers import OpenAIProvider
+from betterways.transport import HTTPSettings, build_async_client
+
+from .stub_server import StubServer
+
+
+def report(label: str, server: StubServer, latencies, concurrency: int):
+    first_batch = max(latencies[:concurrency])
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"  {label:<26} connections {server.connections:3d} / {server.requests:3d} reqs  "
+        f"first batch {first_batch * 1000:6.1f} ms  "
+        f"p50 {statistics.median(latencies) * 1000:6.1f} ms  p99 {p99 * 1000:6.1f} ms"
+    )
+
+
+async def timed(call):
+    start = time.perf_counter()
+    await call()
+    return time.perf_counter() - start
+
+
+async def run_batches(call, requests: int, concurrency: int):
+    """concurrency 件ずつ、requests 件を順に投げる"""
+    latencies = []
+    for offset in range(0, requests, concurrency):
+        batch = min(concurrency, requests - offset)
+        latencies.extend(await asyncio.gather(*(timed(call) for _ in range(batch))))
+    return latencies
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    handshake = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    settings = HTTPSettings(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with StubServer(latency=0.01, handshake=handshake) as server:
+        print(f"{requests} requests, {concurrency} concurrent, simulated handshake {handshake * 1000:.0f} ms")
+        url = f"{server.base_url}/chat/completions"
+        payload = {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]}
+
+        async def new_client_per_request():
+            async with httpx.AsyncClient() as client:
+                await client.post(url, json=payload)
+
+        latencies = await run_batches(new_client_per_request, requests, concurrency)
+        report("new client per request", server, latencies, concurrency)
+
+        server.reset()
+        async with build_async_client(settings) as client:
+            latencies = await run_batches(lambda: client.post(url, json=payload), requests, concurrency)
+        report("pooled httpx client", server, latencies, concurrency)
+
+        for warm in (False, True):
+            server.reset()
+            provider = OpenAIProvider(
+                api_key="stub", max_concurrency=concurrency, http_settings=settings, base_url=server.base_url
+            )
+            if warm:
+                # warm_up() 1回で開くのは1接続なので、同時実行数分を並行に呼ぶ
+                await asyncio.gather(*(provider.warm_up() for _ in range(concurrency)))
+                server.reset()
+            latencies = await run_batches(lambda: provider.generate("hi"), requests, concurrency)
+            report(f"OpenAIProvider ({'warm' if warm else 'cold'})", server, latencies, concurrency)
+            await provider.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""音声長取得のベンチマーク（ヘッダー解析 vs librosa.load）
+
+使い方 (backend ディレクトリで実行):
+    python -m benchmarks.bench_duration                 # 合成WAVで計測
+    python -m benchmarks.bench_duration path/to/a.mp3   # 任意のファイルで計測
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+
+from betterways.audio_probe import probe_duration
+
+# 合成WAVの長さ（分）
+DEFAULT_MINUTES = [1, 5, 20]
+
+
+def make_wav(minutes: float, sample_rate: int = 44100, channels: int = 2) -> str:
+    """無音の16bit PCM WAVを作成する"""
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    frames = int(minutes * 60 * sample_rate)
+    block = b"\0" * (2 * channels * sample_rate)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        for _ in range(frames // sample_rate):
+            w.writeframes(block)
+    return path
+
+
+def measure(label: str, func, path: str):
+    tracemalloc.start()
+    start = time.perf_counter()
+    duration = func(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<14} {elapsed * 1000:10.1f} ms  peak {peak / 1024 / 1024:8.1f} MiB  -> {duration:.2f}s")
+
+
+def librosa_load_duration(path: str) -> float:
+    import librosa
+
+    y, sr = librosa.load(path)
+    return librosa.get_duration(y=y, sr=sr)
+
+
+def run(path: str):
+    print(f"{os.path.basename(path)} ({os.path.getsize(path) / 1024 / 1024:.1f} MiB)")
+    measure("header probe", probe_duration, path)
+    try:
+        measure("librosa.load", librosa_load_duration, path)
+    except ImportError:
+        print("  librosa が未インストールのため比較をスキップしました")
+
+
+def main():
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            run(path)
+        return
+
+    for minutes in DEFAULT_MINUTES:
+        path = make_wav(minutes)
+        try:
+            run(path)
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
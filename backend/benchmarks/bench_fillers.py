@@ -0,0 +1,72 @@
+"""フィラー語検出のマイクロベンチマーク（パターンごとの re.findall ループ vs 1回の走査）
+
+1回の走査側は位置と表示名ごとの件数も求めた上での時間。
+
+使い方 (backend ディレクトリで実行):
+    python -m benchmarks.bench_fillers [文字数]
+"""
+import random
+import re
+import sys
+import timeit
+
+from betterways.fillers import get_detector
+
+# 従来の analyze_speech_patterns と同じパターン
+LEGACY_PATTERNS = [
+    r'えー+と?', r'あー+', r'うー+ん?', r'その+', r'なんか', r'ちょっと',
+    r'um+', r'uh+', r'like', r'you know',
+]
+
+FILLER_PHRASES = ["えーと、", "あー、", "その、", "なんか", "うーん、", "um, ", "like ", "you know, "]
+CONTENT_PHRASES = [
+    "本日はお集まりいただきありがとうございます。", "まず最初に", "今回のプロジェクトについて",
+    "ちょっと説明します。", "結論から言うと", "売上は前年比で伸びています。",
+    "次のスライドをご覧ください。", "顧客満足度の調査結果では", "三つのポイントがあります。",
+]
+
+
+def make_transcript(length: int, filler_ratio: float) -> str:
+    """filler_ratio の割合でフィラーを挟んだ文字起こし風のテキスト"""
+    rng = random.Random(0)
+    parts = []
+    total = 0
+    while total < length:
+        phrases = FILLER_PHRASES if rng.random() < filler_ratio else CONTENT_PHRASES
+        phrase = rng.choice(phrases)
+        parts.append(phrase)
+        total += len(phrase)
+    return "".join(parts)
+
+
+def legacy(transcript: str):
+    filler_words = []
+    for pattern in LEGACY_PATTERNS:
+        filler_words.extend(re.findall(pattern, transcript, re.IGNORECASE))
+    return filler_words
+
+
+def best_of(func, number: int = 5, repeat: int = 5) -> float:
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    detector = get_detector()
+
+    for filler_ratio in (0.02, 0.05, 0.15):
+        transcript = make_transcript(length, filler_ratio)
+        legacy_count = len(legacy(transcript))
+        detected = detector.detect(transcript)
+        legacy_time = best_of(lambda: legacy(transcript))
+        single_time = best_of(lambda: detector.detect(transcript))
+        print(
+            f"{len(transcript)} chars, filler ratio {filler_ratio:.0%}: "
+            f"legacy {legacy_count} / single pass {detected['filler_count']} fillers"
+        )
+        print(f"  legacy loop  {legacy_time * 1000:8.2f} ms")
+        print(f"  single pass  {single_time * 1000:8.2f} ms  ({legacy_time / single_time:.1f}x, incl. positions)")
+
+
+if __name__ == "__main__":
+    main()
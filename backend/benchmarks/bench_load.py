@@ -0,0 +1,340 @@
+"""エンドポイントごとの負荷試験（実際の API を使わず、ローカルのスタブに接続する）
+
+Whisper・チャット・Gemini を模擬するスタブ（stub_server）を別スレッドで起動し、
+すべてのルーターを載せたアプリ（create_app）をプロセス内で（httpx の ASGITransport 経由で）呼ぶ。
+シナリオごとに、スループット・レイテンシ（p50 / p90 / p99）・エラー数・イベントループの遅れ・
+RSS のピークを測り、JSON に保存する。前回の JSON を --compare で渡すと差分を表示する。
+
+シナリオ:
+- analyze_speech:<音声>  POST /api/analyze-speech（fixtures の合成音声。リクエストごとに内容を変えてキャッシュを効かせない）
+- chat:<provider>        POST /api/chat
+- ai:<llm>               GET /ai/{llm}/{role}/{prompt}（no-store で毎回生成）
+- ai:cached              同じプロンプトを繰り返す（キャッシュのヒット）
+
+使い方 (backend ディレクトリで実行):
+    python -m benchmarks.bench_load
+    python -m benchmarks.bench_load --requests 50 --concurrency 8 --only analyze_speech
+    python -m benchmarks.bench_load --latency 0.2 --transcription-latency 0.5 --fail-rate 0.05
+    python -m benchmarks.bench_load --output before.json
+    python -m benchmarks.bench_load --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import NamedTuple
+
+import httpx
+
+from .fixtures import DEFAULT_DIRECTORY, ensure_fixtures, fixture_by_name, unique_variant
+from .stub_server import StubServer, running_in_thread
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+# イベントループの遅れと RSS を測る間隔（秒）
+SAMPLE_INTERVAL = 0.01
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class Scenario(NamedTuple):
+    name: str
+    # GET / POST と、リクエスト番号から httpx.request の引数を作る関数
+    method: str
+    request: object
+    # 200 でも失敗を本文で返すエンドポイント（/api/chat）の判定
+    check: object = None
+
+
+def current_rss() -> int:
+    """現在の RSS（バイト）。/proc が無い環境ではプロセス開始以来のピーク"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS はバイト、Linux は KB
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class LoopMonitor:
+    """一定間隔で sleep し、予定より遅れて起きた時間（イベントループの遅れ）と RSS を記録する"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.lags = []
+        self.peak_rss = 0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def start(self):
+        self.lags = []
+        self.peak_rss = current_rss()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def milliseconds(values) -> dict:
+    return {
+        "p50": round(percentile(values, 0.5) * 1000, 2),
+        "p90": round(percentile(values, 0.9) * 1000, 2),
+        "p99": round(percentile(values, 0.99) * 1000, 2),
+        "max": round(max(values, default=0.0) * 1000, 2),
+        "mean": round(statistics.fmean(values) * 1000, 2) if values else 0.0,
+    }
+
+
+def chat_ok(response: httpx.Response) -> bool:
+    return "error" not in response.json()
+
+
+def build_scenarios(fixture_paths: dict[str, str]) -> list[Scenario]:
+    scenarios = []
+    for name, path in fixture_paths.items():
+        fixture = fixture_by_name(name)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        def request(index, data=data, fixture=fixture):
+            upload = (fixture.filename, unique_variant(data, index), fixture.content_type)
+            return {"url": "/api/analyze-speech", "files": {"file": upload}, "data": {"provider": "openai"}}
+
+        scenarios.append(Scenario(f"analyze_speech:{name}", "POST", request))
+
+    for provider in ("openai", "google"):
+        scenarios.append(Scenario(
+            f"chat:{provider}",
+            "POST",
+            lambda index, provider=provider: {
+                "url": "/api/chat",
+                "params": {"provider": provider},
+                "json": {"role": "user", "content": f"スピーチの練習方法を教えて ({index})"},
+            },
+            chat_ok,
+        ))
+
+    for llm in ("openai", "gemini"):
+        scenarios.append(Scenario(
+            f"ai:{llm}",
+            "GET",
+            lambda index, llm=llm: {
+                "url": f"/ai/{llm}/teacher/発表のコツを教えて{index}",
+                "headers": {"Cache-Control": "no-store"},
+            },
+        ))
+    scenarios.append(Scenario("ai:cached", "GET", lambda index: {"url": "/ai/openai/teacher/発表のコツを教えて"}))
+    return scenarios
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int, stub) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+    monitor = LoopMonitor()
+    stub_requests = stub.requests
+    rss_before = current_rss()
+
+    async def one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, **scenario.request(index))
+                ok = response.status_code == 200 and (scenario.check is None or scenario.check(response))
+                status = "ok" if ok else str(response.status_code if response.status_code != 200 else "error")
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - start
+    await monitor.stop()
+
+    return {
+        "name": scenario.name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": statuses.pop("ok", 0),
+        "errors": dict(statuses),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "latency_ms": milliseconds(latencies),
+        "event_loop_lag_ms": milliseconds(monitor.lags),
+        "peak_rss_mb": round(monitor.peak_rss / 2 ** 20, 1),
+        "rss_growth_mb": round((current_rss() - rss_before) / 2 ** 20, 1),
+        "upstream_requests": stub.requests - stub_requests,
+    }
+
+
+def print_result(result: dict):
+    errors = ", ".join(f"{status}×{count}" for status, count in result["errors"].items()) or "-"
+    print(
+        f"  {result['name']:<28} {result['throughput_rps']:7.2f} req/s  "
+        f"p50 {result['latency_ms']['p50']:8.1f} ms  p99 {result['latency_ms']['p99']:8.1f} ms  "
+        f"lag p99 {result['event_loop_lag_ms']['p99']:6.1f} ms  "
+        f"rss {result['peak_rss_mb']:7.1f} MB  errors {errors}"
+    )
+
+
+def print_comparison(previous: dict, current: dict):
+    """スループットと p99 の前回比（%）"""
+    before = {result["name"]: result for result in previous["scenarios"]}
+    print(f"compared with {previous['meta'].get('timestamp', '?')} ({previous['meta'].get('commit', '?')})")
+    for result in current["scenarios"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+
+        def change(new, base):
+            return f"{(new - base) / base * 100:+6.1f}%" if base else "   n/a"
+
+        print(
+            f"  {result['name']:<28} throughput {change(result['throughput_rps'], old['throughput_rps'])}  "
+            f"p99 {change(result['latency_ms']['p99'], old['latency_ms']['p99'])}  "
+            f"peak rss {change(result['peak_rss_mb'], old['peak_rss_mb'])}"
+        )
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def use_stub(stub: StubServer):
+    """アプリ（get_services）が読む前に、接続先とキーをスタブに向ける"""
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": stub.base_url,
+        "GOOGLE_API_KEY": "stub",
+        "GEMINI_BASE_URL": stub.gemini_url,
+    })
+    # 前回の実行の結果をディスクのキャッシュから読まないようにする（メモリのキャッシュは使う）
+    os.environ.pop("CACHE_SQLITE_PATH", None)
+    # すべてのリクエストが同じクライアントから来るので、レート制限は外す（デコード・文字起こしのゲートは残す）
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+
+async def run(args, stub: StubServer) -> dict:
+    use_stub(stub)
+    from betterways.app import create_app
+
+    app = create_app(["speech", "chat", "ai"], ["*"])
+    fixture_paths = ensure_fixtures(args.fixtures_dir)
+    scenarios = [
+        scenario for scenario in build_scenarios(fixture_paths)
+        if not args.only or any(scenario.name.startswith(prefix) for prefix in args.only)
+    ]
+
+    results = []
+    async with app.router.lifespan_context(app):
+        # 重い依存の読み込み（ウォームアップ）が終わってから測る
+        while not app.state.warm_up.ready:
+            await asyncio.sleep(0.05)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for scenario in scenarios:
+                requests = max(1, args.requests // 4) if scenario.name.startswith("analyze_speech:long") else args.requests
+                result = await run_scenario(client, scenario, requests, args.concurrency, stub)
+                print_result(result)
+                results.append(result)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stub": {
+                "latency": stub.latency,
+                "route_latency": stub.route_latency,
+                "latency_per_mb": stub.latency_per_mb,
+                "fail_rate": stub.fail_rate,
+                "fail_status": stub.fail_status,
+            },
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20, help="シナリオごとのリクエスト数（long 音声はその 1/4）")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--only", nargs="*", help="名前がこれで始まるシナリオだけを実行（例: analyze_speech chat:openai）")
+    parser.add_argument("--latency", type=float, default=0.05, help="スタブの基本レイテンシ（秒）")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="チャット・Gemini の追加レイテンシ（秒）")
+    parser.add_argument("--transcription-latency", type=float, default=0.3, help="文字起こしの追加レイテンシ（秒）")
+    parser.add_argument("--latency-per-mb", type=float, default=0.1, help="文字起こしの音声 1MB あたりの追加レイテンシ（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="スタブが失敗を返す割合")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--fixtures-dir", default=DEFAULT_DIRECTORY)
+    parser.add_argument("--output", help=f"結果の JSON（既定: {RESULTS_DIRECTORY}/load-<日時>.json）")
+    parser.add_argument("--compare", help="前回の結果の JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub = StubServer(
+        latency=args.latency,
+        handshake=0,
+        fail_rate=args.fail_rate,
+        fail_status=args.fail_status,
+        route_latency={
+            "chat": args.chat_latency,
+            "gemini": args.chat_latency,
+            "transcriptions": args.transcription_latency,
+        },
+        latency_per_mb=args.latency_per_mb,
+        seed=0,
+    )
+    # スタブは別スレッドで動かし、測定するイベントループにはアプリの処理だけを載せる
+    with running_in_thread(stub):
+        report = asyncio.run(run(args, stub))
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"load-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"saved {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""音響特徴（ポーズ・F0・音量・話速）の計算時間のベンチマーク
+
+1〜60分の合成音声（ピッチと音量が揺れる有声音と無音の繰り返し）で analyze_prosody を計測する。
+比較のため、RMS とポーズの検出をフレームごとの Python ループで行った場合も短い音声で測る。
+
+使い方 (backend ディレクトリで実行):
+    python -m benchmarks.bench_prosody            # 1, 5, 15, 30, 60 分
+    python -m benchmarks.bench_prosody 1 10       # 分数を指定
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from betterways.prosody import FRAME_SECONDS, MIN_PAUSE_SECONDS, SILENCE_TOP_DB, analyze_prosody
+from betterways.segmentation import SAMPLE_RATE
+
+DEFAULT_MINUTES = [1, 5, 15, 30, 60]
+# Python ループ版はこの長さまでだけ測る
+LOOP_MAX_MINUTES = 5
+
+
+def make_voiced(minutes: float, sr: int = SAMPLE_RATE):
+    """1〜4秒の有声音（100〜200Hz で揺れる倍音、4Hz の音量変化）と 0.1〜1.5秒の無音を交互に並べた信号"""
+    rng = np.random.default_rng(0)
+    lengths = []
+    total = 0
+    target = int(minutes * 60 * sr)
+    while total < target:
+        speech, pause = int(rng.uniform(1, 4) * sr), int(rng.uniform(0.1, 1.5) * sr)
+        lengths.append((speech, pause))
+        total += speech + pause
+
+    voiced = np.zeros(total, dtype=bool)
+    offset = 0
+    for speech, pause in lengths:
+        voiced[offset:offset + speech] = True
+        offset += speech + pause
+
+    t = np.arange(total) / sr
+    f0 = 150 + 50 * np.sin(2 * np.pi * 0.2 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    y = (np.sin(phase) + 0.5 * np.sin(2 * phase)) * envelope * 0.2 * voiced
+    return y[:target].astype(np.float32)
+
+
+def pauses_with_loop(y, sr: int):
+    """比較用: フレームごとの Python ループで RMS を求め、ポーズを数える"""
+    frame = int(sr * FRAME_SECONDS)
+    db = []
+    for start in range(0, len(y) - frame + 1, frame):
+        samples = y[start:start + frame]
+        db.append(10 * np.log10(float(np.mean(samples * samples)) + 1e-10))
+    threshold = max(max(db) - SILENCE_TOP_DB, -60.0)
+    pauses, run = [], 0
+    for value in db:
+        if value > threshold:
+            if run * FRAME_SECONDS >= MIN_PAUSE_SECONDS:
+                pauses.append(run * FRAME_SECONDS)
+            run = 0
+        else:
+            run += 1
+    return pauses
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    minutes_list = [float(m) for m in sys.argv[1:]] or DEFAULT_MINUTES
+    # librosa / yin の初回呼び出し（JIT コンパイル等）を計測から除く
+    analyze_prosody(make_voiced(0.1), SAMPLE_RATE)
+
+    for minutes in minutes_list:
+        y = make_voiced(minutes)
+        print(f"{minutes:g} min ({len(y) * 4 / 1e6:.0f} MB float32)")
+
+        result, elapsed, peak = measure(analyze_prosody, y, SAMPLE_RATE)
+        print(
+            f"  analyze_prosody          {elapsed:7.3f}s  peak {peak / 1e6:6.1f} MB  "
+            f"pauses {result['pauses']['count']}  F0 median {result['pitch']['median_hz']} Hz"
+        )
+        _, elapsed, peak = measure(analyze_prosody, y, SAMPLE_RATE, False)
+        print(f"  analyze_prosody (no F0)  {elapsed:7.3f}s  peak {peak / 1e6:6.1f} MB")
+
+        if minutes <= LOOP_MAX_MINUTES:
+            pauses, elapsed, _ = measure(pauses_with_loop, y, SAMPLE_RATE)
+            print(f"  RMS + pauses (loop)      {elapsed:7.3f}s  pauses {len(pauses)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""再試行・サーキットブレーカー・フェイルオーバー・ヘッジの効果を確かめるベンチマーク
+
+障害を注入するローカルのスタブ（OpenAI 互換）に対して、次の3つを比べる。
+- 不安定（30% が 503）: 素の OpenAIProvider と再試行付きの成功率
+- 停止（100% が 503）: フェイルオーバー先のスタブへ切り替え、ブレーカーで停止側への呼び出しを止める
+- 遅延（10% が 1秒遅い）: ヘッジ無し / 有りの p99
+
+使い方 (backend ディレクトリで実行):
+    python -m benchmarks.bench_resilience [リクエスト数] [同時実行数]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from betterways.providers import OpenAIProvider
+from betterways.resilience import ResilienceSettings, ResilientProvider
+from betterways.transport import HTTPSettings
+
+from .stub_server import StubServer
+
+# ベンチマークを短くするため、待ち時間は小さめにする
+SETTINGS = ResilienceSettings(max_attempts=4, base_delay=0.02, max_delay=0.2, timeout=10.0, breaker_reset=60.0)
+
+
+def provider_for(server: StubServer, name: str, concurrency: int) -> OpenAIProvider:
+    provider = OpenAIProvider(
+        api_key="stub",
+        max_concurrency=concurrency,
+        http_settings=HTTPSettings(max_connections=concurrency, max_keepalive_connections=concurrency),
+        base_url=server.base_url,
+        max_retries=0,
+    )
+    provider.name = name
+    return provider
+
+
+async def run(call, requests: int, concurrency: int):
+    """(成功数, レイテンシ一覧) を返す"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call()
+                return True, time.perf_counter() - start
+            except Exception:
+                return False, time.perf_counter() - start
+
+    results = await asyncio.gather(*(one() for _ in range(requests)))
+    return sum(ok for ok, _ in results), sorted(latency for _, latency in results)
+
+
+def report(label: str, ok: int, latencies, detail: str = ""):
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"  {label:<28} success {ok:4d}/{len(latencies):<4d} "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  {detail}"
+    )
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    print(f"flaky upstream (30% 503), {requests} requests, {concurrency} concurrent")
+    async with StubServer(latency=0.01, handshake=0, fail_rate=0.3, seed=1) as server:
+        bare = provider_for(server, "flaky", concurrency)
+        ok, latencies = await run(lambda: bare.generate("hi"), requests, concurrency)
+        report("no retries", ok, latencies, f"upstream calls {server.requests}")
+        server.reset()
+        # ブレーカーが開かないよう閾値を上げ、再試行だけの効果を見る
+        resilient = ResilientProvider(bare, settings=SETTINGS._replace(breaker_failures=10 ** 6))
+        ok, latencies = await run(lambda: resilient.generate("hi"), requests, concurrency)
+        report("retry + backoff", ok, latencies, f"upstream calls {server.requests}")
+        await bare.aclose()
+
+    print("primary outage (100% 503) with failover")
+    async with StubServer(latency=0.01, handshake=0, fail_rate=1.0) as down, \
+            StubServer(latency=0.01, handshake=0) as healthy:
+        primary = provider_for(down, "primary", concurrency)
+        fallback = provider_for(healthy, "fallback", concurrency)
+        resilient = ResilientProvider(primary, [fallback], SETTINGS._replace(failover=True))
+        ok, latencies = await run(lambda: resilient.generate("hi"), requests, concurrency)
+        report(
+            "failover + breaker", ok, latencies,
+            f"primary calls {down.requests}, fallback calls {healthy.requests}",
+        )
+        await primary.aclose()
+        await fallback.aclose()
+
+    print("slow tail (10% +1 s) with hedging")
+    async with StubServer(latency=0.02, handshake=0, slow_rate=0.1, slow=1.0, seed=2) as slow, \
+            StubServer(latency=0.02, handshake=0) as healthy:
+        primary = provider_for(slow, "primary", concurrency)
+        fallback = provider_for(healthy, "fallback", concurrency)
+        for hedge_after in (0.0, 0.2):
+            slow.reset()
+            healthy.reset()
+            resilient = ResilientProvider(primary, [fallback], SETTINGS._replace(failover=True, hedge_after=hedge_after))
+            ok, latencies = await run(lambda: resilient.generate("hi"), requests, concurrency)
+            label = f"hedge after {hedge_after * 1000:.0f} ms" if hedge_after else "no hedging"
+            report(label, ok, latencies, f"fallback calls {healthy.requests}")
+        await primary.aclose()
+        await fallback.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""分割並列文字起こしのベンチマーク（レイテンシを注入した偽の文字起こしを使用）
+
+発話（ノイズ）と無音が交互に続く合成音声を作り、1回で送る場合と
+分割して fan-out 並列で送る場合の所要時間を比較する。
+
+使い方 (backend ディレクトリで実行):
+    python -m benchmarks.bench_segmentation [分数] [セグメント秒数]
+"""
+import asyncio
+import sys
+import time
+
+import numpy as np
+import soundfile as sf
+
+from betterways.segmentation import SAMPLE_RATE, transcribe_buffer
+
+# 偽の文字起こしのレイテンシ: 固定の往復時間 + 音声1秒あたりの処理時間
+BASE_LATENCY = 0.3
+LATENCY_PER_AUDIO_SECOND = 0.01
+
+
+def make_speech_like(minutes: float, sr: int = SAMPLE_RATE):
+    """2〜6秒の発話と0.3〜1秒の無音を交互に並べた信号"""
+    rng = np.random.default_rng(0)
+    parts = []
+    total = 0
+    target = int(minutes * 60 * sr)
+    while total < target:
+        speech = int(rng.uniform(2, 6) * sr)
+        pause = int(rng.uniform(0.3, 1.0) * sr)
+        parts.append(rng.normal(0, 0.1, speech).astype(np.float32))
+        parts.append(np.zeros(pause, dtype=np.float32))
+        total += speech + pause
+    return np.concatenate(parts)[:target]
+
+
+async def fake_transcribe(path: str) -> str:
+    seconds = sf.info(path).duration
+    await asyncio.sleep(BASE_LATENCY + LATENCY_PER_AUDIO_SECOND * seconds)
+    return f"[{seconds:.1f}s]"
+
+
+async def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    segment_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 120
+    y = make_speech_like(minutes)
+    serial = BASE_LATENCY + LATENCY_PER_AUDIO_SECOND * minutes * 60
+    print(f"{minutes} min audio, single call would take ~{serial:.2f}s")
+
+    for fan_out in (1, 2, 4, 8):
+        start = time.perf_counter()
+        result = await transcribe_buffer(
+            y, SAMPLE_RATE, fake_transcribe,
+            max_segment_seconds=segment_seconds, fan_out=fan_out,
+        )
+        elapsed = time.perf_counter() - start
+        print(f"  fan_out={fan_out}  segments={len(result['segments']):3d}  wall {elapsed:6.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
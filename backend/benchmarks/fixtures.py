@@ -0,0 +1,92 @@
+"""ベンチマーク用の合成音声ファイル（長さ・サンプリングレート・チャンネル数・形式を変えたもの）
+
+発話に似た信号（揺れる基本周波数の倍音に音節ほどの音量変化を付けたもの）と無音を交互に並べる。
+作ったファイルはディレクトリに残し、次回からは作り直さない。
+
+    paths = ensure_fixtures()                      # {名前: パス}
+    with open(paths["short-wav"], "rb") as f:
+        data = unique_variant(f.read(), 3)         # 内容のハッシュだけが異なるコピー
+"""
+import os
+import tempfile
+from typing import NamedTuple
+
+import numpy as np
+import soundfile as sf
+
+
+class Fixture(NamedTuple):
+    name: str
+    seconds: float
+    sample_rate: int
+    channels: int
+    format: str
+    subtype: str
+    content_type: str
+
+    @property
+    def filename(self) -> str:
+        return f"{self.name}.{self.format.lower()}"
+
+
+# short / medium は1回で文字起こしし、long は TRANSCRIBE_SEGMENT_SECONDS（既定: 300秒）を超えるので分割される
+FIXTURES = [
+    Fixture("short-wav", 5, 16000, 1, "WAV", "PCM_16", "audio/wav"),
+    Fixture("medium-wav", 30, 44100, 2, "WAV", "PCM_16", "audio/wav"),
+    Fixture("medium-mp3", 60, 48000, 1, "MP3", "MPEG_LAYER_III", "audio/mpeg"),
+    Fixture("long-mp3", 360, 16000, 1, "MP3", "MPEG_LAYER_III", "audio/mpeg"),
+]
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), "betterways-bench-fixtures")
+
+
+def synthetic_speech(seconds: float, sample_rate: int, channels: int = 1, seed: int = 0) -> np.ndarray:
+    """1.5〜5秒の発話と 0.2〜1.2秒の無音を交互に並べた信号（(サンプル数, channels) の float32）"""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    voiced = np.zeros(total, dtype=bool)
+    offset = 0
+    while offset < total:
+        speech, pause = int(rng.uniform(1.5, 5) * sample_rate), int(rng.uniform(0.2, 1.2) * sample_rate)
+        voiced[offset:offset + speech] = True
+        offset += speech + pause
+
+    t = np.arange(total) / sample_rate
+    f0 = 160 + 40 * np.sin(2 * np.pi * 0.3 * t) + 10 * np.sin(2 * np.pi * 2.1 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    # 1秒に約5音節の音量変化
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 5 * t)
+    y = (np.sin(phase) + 0.5 * np.sin(2 * phase) + 0.25 * np.sin(3 * phase)) * envelope * voiced * 0.15
+    y += rng.normal(0, 0.002, total)
+    return np.repeat(y.astype(np.float32)[:, None], channels, axis=1)
+
+
+def ensure_fixtures(directory: str = DEFAULT_DIRECTORY, fixtures=FIXTURES) -> dict[str, str]:
+    """{名前: パス}。まだ無いファイルだけを作る"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for fixture in fixtures:
+        path = os.path.join(directory, fixture.filename)
+        if not os.path.exists(path):
+            y = synthetic_speech(fixture.seconds, fixture.sample_rate, fixture.channels)
+            # 書き込み途中のファイルを残さないよう、書き終えてから置き換える
+            partial = f"{path}.partial"
+            sf.write(partial, y, fixture.sample_rate, format=fixture.format, subtype=fixture.subtype)
+            os.replace(partial, path)
+        paths[fixture.name] = path
+    return paths
+
+
+def fixture_by_name(name: str) -> Fixture:
+    for fixture in FIXTURES:
+        if fixture.name == name:
+            return fixture
+    raise KeyError(f"unknown fixture {name!r} (choose from {', '.join(f.name for f in FIXTURES)})")
+
+
+def unique_variant(data: bytes, index: int) -> bytes:
+    """末尾の 4 バイトだけを index で書き換えたコピー
+
+    同じ音声のアップロードはキャッシュや同時実行の相乗り（single-flight）で1回分しか処理されないため、
+    リクエストごとに内容のハッシュを変える。WAV なら最後のサンプル、MP3 なら最後のフレームの一部が変わるだけ。
+    """
+    return data[:-4] + index.to_bytes(4, "little")
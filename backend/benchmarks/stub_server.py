@@ -0,0 +1,232 @@
+"""ベンチマーク用のローカルなプロバイダーのスタブ（OpenAI・Gemini 互換の HTTP/1.1 サーバー）
+
+Whisper（/v1/audio/transcriptions）、チャット（/v1/chat/completions、stream にも対応）、
+Gemini の REST API（/v1beta/models/...:generateContent, :countTokens）を模擬する。
+新しい TCP 接続ごとに handshake 秒だけ待ってから応答を始め、TLS ハンドシェイクの
+往復を模擬する。受け付けた接続数と処理したリクエスト数を数える。
+
+レイテンシは latency（全体）に、route_latency（"chat" / "transcriptions" / "gemini" / "models"
+ごとの追加秒）と、文字起こしの音声 1MB あたりの latency_per_mb を足したもの。
+障害の注入もできる: fail_rate の割合で fail_status（429 なら Retry-After 付き）を返し、
+slow_rate の割合で slow 秒余分に待つ。属性を書き換えれば実行中に切り替えられる。
+
+    async with StubServer(latency=0.05, handshake=0.05, fail_rate=0.3) as server:
+        OpenAIProvider(api_key="stub", base_url=server.base_url)
+        GeminiProvider(api_key="stub", base_url=server.gemini_url)
+
+別のスレッドのイベントループで動かすと、測定対象のイベントループに負荷をかけない:
+
+    with running_in_thread(StubServer(latency=0.2)) as server:
+        ...
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+CHAT_COMPLETION = {
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "stub"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+MODEL_LIST = {"object": "list", "data": []}
+TRANSCRIPTION = {"text": "stub"}
+# 文字起こしの応答に繰り返す文（フィラー語を含む）。音声 32KB ごとに1回
+SPEECH_SENTENCE = "えーと、今日は発表の構成について、あの、三つのポイントに分けてお話しします。"
+SPEECH_BYTES_PER_SENTENCE = 32_000
+MAX_SPEECH_SENTENCES = 400
+GEMINI_USAGE = {"promptTokenCount": 1, "candidatesTokenCount": 1, "totalTokenCount": 2}
+
+
+class StubServer:
+    def __init__(
+        self,
+        latency: float = 0.05,
+        handshake: float = 0.05,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        fail_rate: float = 0.0,
+        fail_status: int = 503,
+        retry_after: float | None = None,
+        slow_rate: float = 0.0,
+        slow: float = 1.0,
+        seed: int | None = None,
+        route_latency: dict[str, float] | None = None,
+        latency_per_mb: float = 0.0,
+        reply: str = "stub",
+    ):
+        self.latency = latency
+        self.route_latency = dict(route_latency or {})
+        self.latency_per_mb = latency_per_mb
+        self.reply = reply
+        self.handshake = handshake
+        self.host = host
+        self.port = port
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow = slow
+        self.rng = random.Random(seed)
+        self.connections = 0
+        self.requests = 0
+        self.failures = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def gemini_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def reset(self):
+        self.connections = 0
+        self.requests = 0
+        self.failures = 0
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @staticmethod
+    def _kind(path: str) -> str:
+        """route_latency のキー"""
+        if path.startswith("/v1/audio/transcriptions"):
+            return "transcriptions"
+        if path.startswith("/v1/chat/completions"):
+            return "chat"
+        if path.startswith("/v1beta/"):
+            return "gemini"
+        return "models"
+
+    def _delay(self, path: str, body: bytes) -> float:
+        kind = self._kind(path)
+        delay = self.latency + self.route_latency.get(kind, 0.0)
+        if kind == "transcriptions":
+            delay += self.latency_per_mb * len(body) / 1_000_000
+        if self.slow_rate and self.rng.random() < self.slow_rate:
+            delay += self.slow
+        return delay
+
+    def _route(self, method: str, path: str, body: bytes):
+        """(ステータス, JSON) を返す。JSON がリストなら Server-Sent Events で1つずつ送る。サブクラスでエンドポイントを追加できる"""
+        if method == "GET" and path.startswith("/v1/models"):
+            return 200, MODEL_LIST
+        if method == "POST" and path.startswith("/v1/chat/completions"):
+            completion = {**CHAT_COMPLETION, "created": int(time.time())}
+            message = {"role": "assistant", "content": self.reply}
+            completion["choices"] = [{**CHAT_COMPLETION["choices"][0], "message": message}]
+            if json.loads(body or b"{}").get("stream"):
+                return 200, self._chat_chunks(completion)
+            return 200, completion
+        if method == "POST" and path.startswith("/v1/audio/transcriptions"):
+            sentences = min(MAX_SPEECH_SENTENCES, max(1, len(body) // SPEECH_BYTES_PER_SENTENCE))
+            # 録音ごとに異なる文字起こしにする（同じ文字起こしだとフィードバックがキャッシュされる）
+            return 200, {"text": SPEECH_SENTENCE * sentences + f"以上です（{self.requests}）。"}
+        if method == "POST" and path.startswith("/v1beta/models/"):
+            if ":countTokens" in path:
+                return 200, {"totalTokens": 1}
+            if ":generateContent" in path:
+                return 200, {
+                    "candidates": [{
+                        "content": {"parts": [{"text": self.reply}], "role": "model"},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }],
+                    "usageMetadata": GEMINI_USAGE,
+                }
+        return 404, {"error": {"message": f"no stub for {method} {path}"}}
+
+    def _chat_chunks(self, completion: dict) -> list[dict]:
+        """stream=True のチャットの応答（単語ごとの断片と、最後に usage だけの断片）"""
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+                "model": completion["model"]}
+        chunks = [
+            {**base, "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+            for word in self.reply.split(" ")
+        ]
+        chunks.append({**base, "choices": [], "usage": completion["usage"]})
+        return chunks
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        await asyncio.sleep(self.handshake)
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                lines = header.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                self.requests += 1
+                await asyncio.sleep(self._delay(path, body))
+                extra = ""
+                if self.fail_rate and self.rng.random() < self.fail_rate:
+                    self.failures += 1
+                    status, payload = self.fail_status, {"error": {"message": "injected failure"}}
+                    if self.retry_after is not None:
+                        extra = f"retry-after: {self.retry_after}\r\n"
+                else:
+                    status, payload = self._route(method, path, body)
+                if isinstance(payload, list):
+                    content_type = "text/event-stream"
+                    data = b"".join(b"data: " + json.dumps(event).encode() + b"\n\n" for event in payload)
+                    data += b"data: [DONE]\n\n"
+                else:
+                    content_type = "application/json"
+                    data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"content-type: {content_type}\r\ncontent-length: {len(data)}\r\n{extra}"
+                    f"connection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # CancelledError: 停止時にまだ応答中だった接続（ヘッジで見捨てられた呼び出しなど）
+            pass
+        finally:
+            writer.close()
+
+
+@contextmanager
+def running_in_thread(server: StubServer):
+    """server を専用のスレッドのイベントループで動かす"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="stub-server", daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.__aenter__(), loop).result()
+
+    async def stop():
+        await server.__aexit__(None, None, None)
+        # キープアライブ中の接続の処理も、ループを止める前に終わらせる
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(stop(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1 @@
+"""Better Ways バックエンド共通モジュール"""
@@ -0,0 +1,360 @@
+"""重い処理の前に置く流量制御（アドミッション制御）
+
+- レート制限: ルートごと・クライアントごとのトークンバケット。超えたリクエストはボディを読む前に 429 で返す
+- 同時実行数の上限: 音声のデコードと文字起こしは、プロセス全体でそれぞれ決まった件数までしか同時に行わない。
+  空きを待てる件数と待ち時間にも上限があり、超えたら待たせずに 429 を返す（どちらも Retry-After 付き）
+- バックグラウンドジョブ（background() の中）はワーカー数で件数が抑えられているので、拒否せずに空くまで待つ
+
+    async with services.gates["decode"].slot():   # 空きが無ければ待つ。待てなければ Overloaded
+        ...
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple
+
+from .metrics import ADMISSION_IN_USE, ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS, ADMISSION_WAITING
+
+# バケットを覚えておくクライアント数の上限（使われていないものから捨てる）
+MAX_CLIENTS = 10000
+# Retry-After で返す秒数の上限
+MAX_RETRY_AFTER = 300
+
+
+class Overloaded(Exception):
+    """混み合っているため受け付けない（retry_after 秒後の再試行を促す）"""
+
+    def __init__(self, target: str, reason: str, retry_after: float):
+        super().__init__(f"{target}: {reason}")
+        # ルール名（speech など）またはゲート名（decode / transcription）
+        self.target = target
+        # client_rate / route_rate / queue_full / timeout
+        self.reason = reason
+        self.retry_after = min(MAX_RETRY_AFTER, max(1, math.ceil(retry_after)))
+        ADMISSION_REJECTIONS.labels(target, reason).inc()
+
+    @property
+    def detail(self) -> str:
+        if self.reason.endswith("_rate"):
+            return f"リクエストが多すぎます。{self.retry_after}秒後に再度お試しください。"
+        return f"混み合っています。{self.retry_after}秒後に再度お試しください。"
+
+    @property
+    def headers(self) -> dict:
+        return {"Retry-After": str(self.retry_after)}
+
+
+# --- レート制限 ---
+class TokenBucket:
+    """1秒に rate 個補充され、burst 個までためられるトークンバケット"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "clock")
+
+    def __init__(self, rate: float, burst: float, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self) -> float:
+        """トークンを1つ使って 0 を返す。足りなければ使わずに、次のトークンまでの秒数を返す"""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Rate(NamedTuple):
+    requests: int
+    seconds: float
+
+    def bucket(self, clock=time.monotonic) -> TokenBucket:
+        # 一度に requests 件まで受け付け、その後は均等な間隔で補充する
+        return TokenBucket(self.requests / self.seconds, self.requests, clock)
+
+
+def parse_rate(value: str | None) -> Rate | None:
+    """"20/60"（60秒に20件）を Rate にする。空・"0"・"off" なら制限しない（None）"""
+    if value is None or value.strip().lower() in ("", "0", "off"):
+        return None
+    requests, _, seconds = value.partition("/")
+    try:
+        rate = Rate(int(requests), float(seconds or 1))
+    except ValueError:
+        raise ValueError(f"invalid rate {value!r} (expected <requests>/<seconds>, e.g. 20/60)")
+    if rate.requests <= 0 or rate.seconds <= 0:
+        raise ValueError(f"invalid rate {value!r} (requests and seconds must be positive)")
+    return rate
+
+
+def rate_limit_enabled_from_env() -> bool:
+    """RATE_LIMIT_ENABLED=0 でレート制限をすべて無効にする（ゲートの早期拒否は残る）"""
+    return os.environ.get("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+class RateRule:
+    """パスの前方一致とメソッドで対象を決める、1つのルートのレート制限
+
+    per_client はクライアントごと、total はルート全体のバケット。gates に挙げたゲートが
+    満杯（枠も待ち行列も埋まっている）の間は、ボディを受け取る前に拒否する。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        prefixes,
+        methods=("POST",),
+        per_client: Rate | None = None,
+        total: Rate | None = None,
+        gates=(),
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.prefixes = tuple(prefixes)
+        self.methods = tuple(methods)
+        self.per_client = per_client
+        self.total = total
+        self.gates = tuple(gates)
+        self.clock = clock
+        self._clients = OrderedDict()
+        self._total = total.bucket(clock) if total else None
+
+    @classmethod
+    def from_env(cls, name: str, prefixes, methods=("POST",), per_client: str = "off", total: str = "off", gates=()):
+        """RATE_LIMIT_{NAME}_PER_CLIENT / RATE_LIMIT_{NAME}_TOTAL（"件数/秒数"、off で無効）。引数は既定値"""
+        if not rate_limit_enabled_from_env():
+            return cls(name, prefixes, methods, gates=gates)
+        key = f"RATE_LIMIT_{name.upper()}"
+        return cls(
+            name,
+            prefixes,
+            methods,
+            per_client=parse_rate(os.environ.get(f"{key}_PER_CLIENT", per_client)),
+            total=parse_rate(os.environ.get(f"{key}_TOTAL", total)),
+            gates=gates,
+        )
+
+    def matches(self, method: str, path: str) -> bool:
+        return method in self.methods and path.startswith(self.prefixes)
+
+    def _client_bucket(self, client: str) -> TokenBucket:
+        bucket = self._clients.get(client)
+        if bucket is None:
+            bucket = self._clients[client] = self.per_client.bucket(self.clock)
+            if len(self._clients) > MAX_CLIENTS:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client)
+        return bucket
+
+    def check(self, client: str):
+        """クライアントとルート全体のトークンを1つずつ使う。足りなければ Overloaded"""
+        if self.per_client:
+            wait = self._client_bucket(client).take()
+            if wait:
+                raise Overloaded(self.name, "client_rate", wait)
+        if self._total:
+            wait = self._total.take()
+            if wait:
+                raise Overloaded(self.name, "route_rate", wait)
+
+
+# --- 同時実行数の上限 ---
+class GateSettings(NamedTuple):
+    max_concurrency: int
+    # 空きを待てる件数（超えたら待たずに拒否する。0 なら待たせない）
+    max_waiting: int
+    # 空きを待つ時間の上限（秒、0 で無制限）
+    max_wait: float
+
+
+DECODE_DEFAULTS = GateSettings(max_concurrency=min(4, os.cpu_count() or 1), max_waiting=16, max_wait=60.0)
+TRANSCRIPTION_DEFAULTS = GateSettings(max_concurrency=8, max_waiting=32, max_wait=300.0)
+
+
+def gate_settings_from_env(prefix: str, defaults: GateSettings) -> GateSettings:
+    """{prefix}_MAX_CONCURRENCY / {prefix}_MAX_WAITING / {prefix}_MAX_WAIT_SECONDS"""
+    def number(name: str, default, cast):
+        try:
+            return max(0, cast(os.environ.get(f"{prefix}_{name}", default)))
+        except ValueError:
+            return default
+
+    return GateSettings(
+        max_concurrency=max(1, number("MAX_CONCURRENCY", defaults.max_concurrency, int)),
+        max_waiting=number("MAX_WAITING", defaults.max_waiting, int),
+        max_wait=number("MAX_WAIT_SECONDS", defaults.max_wait, float),
+    )
+
+
+_background = ContextVar("admission_background", default=False)
+
+
+@contextmanager
+def background():
+    """この中の処理は、ゲートが混んでいても拒否せずに空くまで待つ"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class ConcurrencyGate:
+    """同時に slot() に入れる件数を max_concurrency に抑え、待ち行列の長さと待ち時間も制限する"""
+
+    def __init__(self, name: str, settings: GateSettings):
+        self.name = name
+        self.settings = settings
+        self.in_use = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(settings.max_concurrency)
+        # 1件が枠を使う時間の移動平均（Retry-After の見積もり用。まだ無ければ None）
+        self._hold = None
+        self._wait_seconds = ADMISSION_WAIT_SECONDS.labels(name)
+        self._in_use_gauge = ADMISSION_IN_USE.labels(name)
+        self._waiting_gauge = ADMISSION_WAITING.labels(name)
+
+    @property
+    def saturated(self) -> bool:
+        """枠も待ち行列も埋まっている（今来たリクエストは拒否される）"""
+        return self.in_use >= self.settings.max_concurrency and self.waiting >= self.settings.max_waiting
+
+    def retry_after(self) -> float:
+        """待っている分が捌けるまでのおおよその秒数"""
+        return (self._hold or 1.0) * (self.waiting + 1) / self.settings.max_concurrency
+
+    def check(self):
+        """満杯なら Overloaded（リクエストのボディを受け取る前の判定用）"""
+        if self.saturated and not _background.get():
+            raise Overloaded(self.name, "queue_full", self.retry_after())
+
+    async def _acquire(self):
+        if not self._semaphore.locked():
+            # 空いていれば待たずに取れる
+            await self._semaphore.acquire()
+            self._wait_seconds.observe(0.0)
+            return
+
+        patient = _background.get()
+        if self.waiting >= self.settings.max_waiting and not patient:
+            raise Overloaded(self.name, "queue_full", self.retry_after())
+        self.waiting += 1
+        self._waiting_gauge.inc()
+        start = time.perf_counter()
+        try:
+            if self.settings.max_wait and not patient:
+                await asyncio.wait_for(self._semaphore.acquire(), self.settings.max_wait)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            raise Overloaded(self.name, "timeout", self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+            self._waiting_gauge.dec()
+            self._wait_seconds.observe(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def slot(self):
+        await self._acquire()
+        self.in_use += 1
+        self._in_use_gauge.inc()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._in_use_gauge.dec()
+            self._semaphore.release()
+            held = time.perf_counter() - start
+            self._hold = held if self._hold is None else 0.8 * self._hold + 0.2 * held
+
+
+def gates_from_env() -> dict[str, ConcurrencyGate]:
+    """decode（DECODE_*）と transcription（TRANSCRIBE_*）のゲート"""
+    return {
+        "decode": ConcurrencyGate("decode", gate_settings_from_env("DECODE", DECODE_DEFAULTS)),
+        "transcription": ConcurrencyGate("transcription", gate_settings_from_env("TRANSCRIBE", TRANSCRIPTION_DEFAULTS)),
+    }
+
+
+# --- ミドルウェア ---
+def trusted_proxies_from_env() -> int:
+    """RATE_LIMIT_TRUSTED_PROXIES: 前段のリバースプロキシの数（X-Forwarded-For の右から何番目をクライアントとみなすか）
+
+    0 なら X-Forwarded-For を見ない。RATE_LIMIT_TRUST_FORWARDED=1 は 1 とみなす。
+    """
+    default = 1 if os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "0").lower() in ("1", "true", "yes") else 0
+    try:
+        return max(0, int(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", default)))
+    except ValueError:
+        return default
+
+
+class AdmissionMiddleware:
+    """ルールに一致するリクエストを、ボディを読む前にレート制限とゲートの空きで判定する ASGI ミドルウェア
+
+    拒否したリクエストには 429 と Retry-After を返す。
+    """
+
+    def __init__(self, app, rules, gates=None, trusted_proxies: int = 0):
+        self.app = app
+        self.rules = list(rules)
+        self.gates = dict(gates or {})
+        self.trusted_proxies = trusted_proxies
+
+    def _client(self, scope) -> str:
+        if self.trusted_proxies:
+            # 左側はクライアントが自由に書けるので、信頼できるプロキシが付け足した右側から数える
+            forwarded = [
+                address.strip()
+                for name, value in scope.get("headers", [])
+                if name == b"x-forwarded-for"
+                for address in value.decode("latin-1").split(",")
+                if address.strip()
+            ]
+            if len(forwarded) >= self.trusted_proxies:
+                return forwarded[-self.trusted_proxies]
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rule = next((rule for rule in self.rules if rule.matches(scope["method"], scope["path"])), None)
+        if rule is not None:
+            try:
+                # 満杯のゲートで断られる分はトークンを使わない
+                for name in rule.gates:
+                    gate = self.gates.get(name)
+                    if gate is not None:
+                        gate.check()
+                rule.check(self._client(scope))
+            except Overloaded as e:
+                await self._send_overloaded(send, e)
+                return
+        await self.app(scope, receive, send)
+
+    async def _send_overloaded(self, send, e: Overloaded):
+        body = json.dumps({"detail": e.detail, "retry_after": e.retry_after}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(e.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
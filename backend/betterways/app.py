@@ -0,0 +1,186 @@
+"""アプリの組み立て
+
+音声分析（speech）・チャット（chat）・URL 指定の LLM 呼び出し（ai）のルーターを、
+1つのプロセスで共有のプロバイダー・キャッシュ・ジョブのワーカーを使って提供する。
+どのルーターを載せるかはデプロイごとに BETTERWAYS_ROUTERS で選ぶ。
+
+    uvicorn betterways.app:create_app --factory
+    BETTERWAYS_ROUTERS=ai uvicorn betterways.app:create_app --factory
+"""
+# 起動時間の計測の起点になるため、最初に import する
+from .startup import Warmup, warmup_enabled_from_env
+
+import importlib
+import os
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+
+from .admission import AdmissionMiddleware, trusted_proxies_from_env
+from .fillers import get_detector
+from .metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from .preprocess import warm_up as warm_up_audio
+from .services import get_services
+from .tokenizer import get_tokenizer
+from .transport import warm_up_from_env
+from .uploads import UploadSizeLimitMiddleware
+
+# ルーター名 -> モジュール（載せないルーターは import しない）
+ROUTERS = {
+    "speech": ".routers.speech",
+    "chat": ".routers.chat",
+    "ai": ".routers.ai",
+}
+DEFAULT_CORS_ORIGINS = ["http://localhost:5173"]
+
+# どのアプリにも載せる、死活監視・メトリクス用のルート
+core = APIRouter()
+
+
+def _list_from_env(name: str, default) -> list[str]:
+    value = os.environ.get(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def routers_from_env(default=tuple(ROUTERS)) -> list[str]:
+    """BETTERWAYS_ROUTERS=speech,chat,ai（カンマ区切り）。未設定なら default"""
+    names = _list_from_env("BETTERWAYS_ROUTERS", default)
+    unknown = [name for name in names if name not in ROUTERS]
+    if unknown:
+        raise ValueError(f"BETTERWAYS_ROUTERS: unknown routers {unknown} (choose from {', '.join(ROUTERS)})")
+    return names
+
+
+def cors_origins_from_env(default=DEFAULT_CORS_ORIGINS) -> list[str]:
+    """CORS_ALLOW_ORIGINS=https://a.example,https://b.example（* で全許可）。未設定なら default"""
+    return _list_from_env("CORS_ALLOW_ORIGINS", default)
+
+
+@core.get("/")
+async def root(request: Request):
+    return {
+        "message": "Backend is running successfully!",
+        "status": "OK",
+        "routers": request.app.state.routers,
+    }
+
+
+@core.get("/health")
+async def health_check():
+    return {"status": "healthy"}
+
+
+# Liveness: プロセスが応答できれば常に 200
+@core.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+
+# Readiness: ウォームアップが終わるまでは 503
+@core.get("/health/ready")
+async def readiness(request: Request):
+    warm_up = request.app.state.warm_up
+    status = warm_up.status()
+    if not warm_up.ready:
+        return JSONResponse(status, status_code=503, headers={"Retry-After": "5"})
+    return status
+
+
+@core.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@core.get("/api/cache/stats")
+async def cache_stats():
+    return get_services().result_cache.stats()
+
+
+def build_warm_up(routers: list[str], services) -> Warmup:
+    """載せるルーターが使う重い依存だけを、起動後にバックグラウンドで読み込む"""
+    warm_up = Warmup(warmup_enabled_from_env())
+    if "speech" in routers:
+        warm_up.add_import("numpy")
+        warm_up.add_import("librosa")
+        warm_up.add("audio", warm_up_audio)
+        warm_up.add("text", lambda: (get_tokenizer(), get_detector()))
+    for provider in services.providers:
+        warm_up.add(f"provider:{provider.name}", provider.load)
+    return warm_up
+
+
+def create_app(routers=None, cors_origins=None) -> FastAPI:
+    """ルーターを載せたアプリを作る
+
+    routers / cors_origins を省略すると BETTERWAYS_ROUTERS / CORS_ALLOW_ORIGINS から読む。
+    プロバイダーとキャッシュはプロセスで共有する（get_services）。
+    """
+    routers = routers_from_env() if routers is None else list(routers)
+    cors_origins = cors_origins_from_env() if cors_origins is None else list(cors_origins)
+    modules = {name: importlib.import_module(ROUTERS[name], __package__) for name in routers}
+    services = get_services()
+
+    app = FastAPI()
+    app.state.routers = routers
+    app.state.services = services
+
+    # ルーターごとのレート制限と、デコードの待ち行列が満杯の時の早期拒否（429 + Retry-After）。
+    # ボディを読む前に判定し、CORS の内側に置いて 429 にも CORS ヘッダーを付ける
+    app.add_middleware(
+        AdmissionMiddleware,
+        rules=[rule for module in modules.values() for rule in getattr(module, "RATE_LIMITS", [])],
+        gates=services.gates,
+        trusted_proxies=trusted_proxies_from_env(),
+    )
+    speech = modules.get("speech")
+    if speech is not None:
+        # アップロードサイズの上限（受信中に判定し、超えた時点で413を返す）。
+        # 413 にも CORS ヘッダーが付くよう、CORS の内側に置く
+        app.add_middleware(
+            UploadSizeLimitMiddleware,
+            max_bytes=speech.MAX_UPLOAD_BYTES,
+            path_prefixes=speech.UPLOAD_PATH_PREFIXES,
+            exclude_prefixes=speech.BATCH_PATH_PREFIXES,
+            detail="ファイルサイズが上限を超えています。",
+        )
+        app.add_middleware(
+            UploadSizeLimitMiddleware,
+            max_bytes=speech.BATCH_MAX_BYTES,
+            path_prefixes=speech.BATCH_PATH_PREFIXES,
+            detail="まとめて送ったファイルの合計サイズが上限を超えています。",
+        )
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Prometheus形式のメトリクス（処理中のリクエスト数・レイテンシ）。413 も数えるため最も外側に置く
+    app.add_middleware(MetricsMiddleware)
+
+    app.include_router(core)
+    for module in modules.values():
+        # ルーターの startup / shutdown（ジョブのワーカーなど）もアプリに登録される
+        app.include_router(module.router)
+
+    warm_up = build_warm_up(routers, services)
+    app.state.warm_up = warm_up
+
+    async def start_warm_up():
+        await warm_up.start()
+        # PROVIDER_WARMUP=1 なら、最初のリクエストの前に接続を確立しておく
+        if warm_up_from_env():
+            await services.warm_up()
+
+    async def shutdown():
+        await warm_up.stop()
+        await services.aclose()
+
+    app.router.add_event_handler("startup", start_warm_up)
+    app.router.add_event_handler("shutdown", shutdown)
+    print(f"Routers: {', '.join(routers) or '(none)'}")
+    return app
@@ -0,0 +1,267 @@
+"""音声ファイルの長さをヘッダーから取得する
+
+WAV (RIFF), MP3 (Xing/Info/VBRI ヘッダーまたはフレーム走査), M4A (moov/mvhd)
+のメタデータだけを読み、波形全体のデコードを避ける。ヘッダーが読めない場合のみ
+ストリーミングデコードにフォールバックする。
+"""
+import mmap
+import os
+import struct
+
+# MPEG オーディオのビットレート表 (kbps)
+# key: (MPEG1 かどうか, レイヤー)
+_MP3_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# version bits -> サンプルレート表
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG1
+    2: [22050, 24000, 16000],  # MPEG2
+    0: [11025, 12000, 8000],   # MPEG2.5
+}
+
+# フレーム走査で有効とみなす最低フレーム数
+_MIN_MP3_FRAMES = 2
+
+
+def _parse_mp3_frame_header(header: bytes):
+    """MPEG フレームヘッダー (4バイト) を解析する。不正な場合は None"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = (header[2] >> 4) & 0x0F
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    channel_mode = (header[3] >> 6) & 0x03
+
+    # version 1 と layer 0 は予約済み、bitrate 0 (free format) と 15 は扱わない
+    if version_bits == 1 or layer_bits == 0:
+        return None
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    is_mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    bitrate = _MP3_BITRATES[(is_mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][sample_rate_index]
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or is_mpeg1:
+        samples_per_frame = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:
+        samples_per_frame = 576
+        frame_length = 72 * bitrate // sample_rate + padding
+
+    return {
+        "is_mpeg1": is_mpeg1,
+        "layer": layer,
+        "sample_rate": sample_rate,
+        "samples_per_frame": samples_per_frame,
+        "frame_length": frame_length,
+        "mono": channel_mode == 3,
+    }
+
+
+def _skip_id3v2(data) -> int:
+    """先頭の ID3v2 タグを読み飛ばした位置を返す"""
+    offset = 0
+    # タグが連続している場合もあるのでループする
+    while data[offset:offset + 3] == b"ID3" and len(data) >= offset + 10:
+        flags = data[offset + 5]
+        size_bytes = data[offset + 6:offset + 10]
+        size = 0
+        for b in size_bytes:
+            size = (size << 7) | (b & 0x7F)
+        offset += 10 + size
+        if flags & 0x10:
+            offset += 10  # フッター
+    return offset
+
+
+def _find_first_mp3_frame(data, offset: int, limit: int = 64 * 1024):
+    """offset 以降で連続した2フレームが見つかる最初の位置を探す"""
+    end = min(len(data) - 4, offset + limit)
+    pos = offset
+    while pos < end:
+        pos = data.find(b"\xff", pos, end)
+        if pos < 0:
+            return None, None
+        frame = _parse_mp3_frame_header(data[pos:pos + 4])
+        if frame:
+            next_pos = pos + frame["frame_length"]
+            # 誤検出を避けるため次のフレームヘッダーも確認する
+            if next_pos + 4 > len(data) or _parse_mp3_frame_header(data[next_pos:next_pos + 4]):
+                return pos, frame
+        pos += 1
+    return None, None
+
+
+def _mp3_vbr_header_frames(data, pos: int, frame: dict):
+    """Xing/Info または VBRI ヘッダーから総フレーム数を読む"""
+    if frame["is_mpeg1"]:
+        side_info = 17 if frame["mono"] else 32
+    else:
+        side_info = 9 if frame["mono"] else 17
+
+    xing_pos = pos + 4 + side_info
+    tag = data[xing_pos:xing_pos + 4]
+    if tag in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing_pos + 4:xing_pos + 8])[0]
+        if flags & 0x01:
+            return struct.unpack(">I", data[xing_pos + 8:xing_pos + 12])[0]
+
+    vbri_pos = pos + 4 + 32
+    if data[vbri_pos:vbri_pos + 4] == b"VBRI":
+        return struct.unpack(">I", data[vbri_pos + 14:vbri_pos + 18])[0]
+
+    return None
+
+
+def _probe_mp3(data):
+    offset = _skip_id3v2(data)
+    pos, frame = _find_first_mp3_frame(data, offset)
+    if frame is None:
+        return None
+
+    total_frames = _mp3_vbr_header_frames(data, pos, frame)
+    if total_frames:
+        return total_frames * frame["samples_per_frame"] / frame["sample_rate"]
+
+    # VBR ヘッダーが無い場合はフレームヘッダーだけを辿って数える
+    total_samples = 0
+    frames = 0
+    size = len(data)
+    while pos + 4 <= size:
+        current = _parse_mp3_frame_header(data[pos:pos + 4])
+        if current is None or current["frame_length"] <= 0:
+            break
+        total_samples += current["samples_per_frame"]
+        frames += 1
+        pos += current["frame_length"]
+
+    if frames < _MIN_MP3_FRAMES:
+        return None
+    return total_samples / frame["sample_rate"]
+
+
+def _probe_wav(data):
+    if data[0:4] not in (b"RIFF", b"RF64") or data[8:12] != b"WAVE":
+        return None
+
+    byte_rate = None
+    data_size = None
+    ds64_data_size = None
+    pos = 12
+    size = len(data)
+    while pos + 8 <= size:
+        chunk_id = data[pos:pos + 4]
+        chunk_size = struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b"ds64" and body + 16 <= size:
+            ds64_data_size = struct.unpack("<Q", data[body + 8:body + 16])[0]
+        elif chunk_id == b"fmt " and body + 12 <= size:
+            byte_rate = struct.unpack("<I", data[body + 8:body + 12])[0]
+        elif chunk_id == b"data":
+            if chunk_size == 0xFFFFFFFF and ds64_data_size is not None:
+                data_size = ds64_data_size
+            elif chunk_size in (0, 0xFFFFFFFF) or body + chunk_size > size:
+                # ストリーミング書き出し等でサイズ未確定の場合は残り全体
+                data_size = size - body
+            else:
+                data_size = chunk_size
+            break
+        pos = body + chunk_size + (chunk_size & 1)
+
+    if not byte_rate or data_size is None:
+        return None
+    return data_size / byte_rate
+
+
+def _iter_mp4_atoms(data, start: int, end: int):
+    pos = start
+    while pos + 8 <= end:
+        atom_size = struct.unpack(">I", data[pos:pos + 4])[0]
+        atom_type = data[pos + 4:pos + 8]
+        header = 8
+        if atom_size == 1:
+            atom_size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif atom_size == 0:
+            atom_size = end - pos
+        if atom_size < header:
+            return
+        yield atom_type, pos + header, min(pos + atom_size, end)
+        pos += atom_size
+
+
+def _probe_m4a(data):
+    if data[4:8] != b"ftyp":
+        return None
+
+    for atom_type, body, atom_end in _iter_mp4_atoms(data, 0, len(data)):
+        if atom_type != b"moov":
+            continue
+        for child_type, child_body, _ in _iter_mp4_atoms(data, body, atom_end):
+            if child_type != b"mvhd":
+                continue
+            version = data[child_body]
+            if version == 1:
+                timescale, duration = struct.unpack(">IQ", data[child_body + 20:child_body + 32])
+            else:
+                timescale, duration = struct.unpack(">II", data[child_body + 12:child_body + 20])
+            # fragmented MP4 は mvhd の duration が 0 のことがある
+            if timescale and duration:
+                return duration / timescale
+            return None
+    return None
+
+
+def _probe_header(file_path: str):
+    if os.path.getsize(file_path) == 0:
+        return None
+
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[0:4] in (b"RIFF", b"RF64"):
+            return _probe_wav(data)
+        if data[4:8] == b"ftyp":
+            return _probe_m4a(data)
+        return _probe_mp3(data)
+
+
+def probe_header_duration(file_path: str):
+    """ヘッダー情報のみから長さ(秒)を求める。判定できなければ None"""
+    try:
+        duration = _probe_header(file_path)
+    except (ValueError, struct.error, IndexError, OSError):
+        return None
+    return duration if duration is not None and duration > 0 else None
+
+
+def _streaming_duration(file_path: str) -> float:
+    """ヘッダーが無い場合のフォールバック（全体を配列に展開せずに長さを求める）"""
+    import librosa
+
+    try:
+        return librosa.get_duration(path=file_path)
+    except TypeError:
+        # librosa < 0.10 は filename 引数
+        return librosa.get_duration(filename=file_path)
+
+
+def probe_duration(file_path: str) -> float:
+    """音声ファイルの長さ(秒)を取得する"""
+    duration = probe_header_duration(file_path)
+    if duration is not None:
+        return duration
+    return _streaming_duration(file_path)
@@ -0,0 +1,146 @@
+"""複数の録音をまとめて分析するためのヘルパー
+
+- zip で送られた録音を展開する（展開後の録音ごとのサイズと合計サイズを上限で打ち切る）
+- 文字起こしをまとめて1回のプロンプトでフィードバックを依頼し、応答を録音ごとに分ける
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+from .uploads import ALLOWED_EXTENSIONS, DEFAULT_CHUNK_SIZE, SavedUpload, UploadTooLarge
+
+DEFAULT_MAX_ITEMS = 50
+# 1回のバッチのリクエストボディ全体の上限（録音ごとの上限は MAX_UPLOAD_BYTES）
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_FAN_OUT = 4
+# 1回のフィードバック依頼にまとめる文字起こしの合計文字数と件数
+DEFAULT_FEEDBACK_GROUP_CHARS = 12000
+DEFAULT_FEEDBACK_GROUP_SIZE = 8
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+
+def _int_from_env(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+def max_items_from_env() -> int:
+    """BATCH_MAX_ITEMS: 1回のバッチで受け付ける録音数の上限"""
+    return _int_from_env("BATCH_MAX_ITEMS", DEFAULT_MAX_ITEMS)
+
+
+def max_bytes_from_env() -> int:
+    """BATCH_MAX_BYTES: 1回のバッチで受け付けるリクエストボディの合計バイト数の上限"""
+    return _int_from_env("BATCH_MAX_BYTES", DEFAULT_MAX_BYTES)
+
+
+def fan_out_from_env() -> int:
+    """BATCH_FAN_OUT: 同時に文字起こしする録音数"""
+    return _int_from_env("BATCH_FAN_OUT", DEFAULT_FAN_OUT)
+
+
+def feedback_group_chars_from_env() -> int:
+    """BATCH_FEEDBACK_GROUP_CHARS: 1回のフィードバック依頼にまとめる文字数の上限"""
+    return _int_from_env("BATCH_FEEDBACK_GROUP_CHARS", DEFAULT_FEEDBACK_GROUP_CHARS)
+
+
+def is_zip(filename: str | None, content_type: str | None) -> bool:
+    return (filename or "").lower().endswith(".zip") or content_type in ZIP_CONTENT_TYPES
+
+
+def extract_zip(path: str, max_item_bytes: int, max_total_bytes: int, max_items: int):
+    """zip 内の音声ファイルを一時ファイルへ展開する
+
+    戻り値は [(ファイル名, SavedUpload), ...]。対応していない形式のファイルは無視する。
+    展開後の1ファイルが max_item_bytes を、合計が max_total_bytes を超えたら UploadTooLarge
+    （zip の宣言サイズは信用しない）。
+    """
+    extracted = []
+    temp_paths = []
+    total = 0
+    try:
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                name = info.filename
+                extension = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+                if info.is_dir() or name.startswith("__MACOSX/") or extension not in ALLOWED_EXTENSIONS:
+                    continue
+                if len(extracted) >= max_items:
+                    break
+
+                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{extension}")
+                temp_paths.append(temp_file.name)
+                digest = hashlib.sha256()
+                size = 0
+                with temp_file, archive.open(info) as member:
+                    while True:
+                        chunk = member.read(DEFAULT_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        total += len(chunk)
+                        if size > max_item_bytes:
+                            raise UploadTooLarge(max_item_bytes)
+                        if total > max_total_bytes:
+                            raise UploadTooLarge(max_total_bytes)
+                        digest.update(chunk)
+                        temp_file.write(chunk)
+                extracted.append((os.path.basename(name), SavedUpload(temp_file.name, size, digest.hexdigest())))
+    except BaseException:
+        for temp_path in temp_paths:
+            os.unlink(temp_path)
+        raise
+    return extracted
+
+
+def group_for_feedback(transcripts: dict, max_chars: int, max_size: int = DEFAULT_FEEDBACK_GROUP_SIZE):
+    """{番号: 文字起こし} を、1回の依頼にまとめる番号のグループに分ける
+
+    max_chars を超える長い文字起こしは単独のグループになる。
+    """
+    groups = []
+    current = []
+    current_chars = 0
+    for index, transcript in transcripts.items():
+        if current and (current_chars + len(transcript) > max_chars or len(current) >= max_size):
+            groups.append(current)
+            current = []
+            current_chars = 0
+        current.append(index)
+        current_chars += len(transcript)
+    if current:
+        groups.append(current)
+    return groups
+
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def split_combined_feedback(response: str, keys) -> dict:
+    """まとめて依頼したフィードバック（{"番号": "フィードバック", ...} の JSON）を分ける
+
+    コードブロック等で囲まれていても最初の { から最後の } までを読む。
+    読めなかった番号は結果に含めない（呼び出し側で個別に依頼し直す）。
+    """
+    match = _JSON_OBJECT.search(response or "")
+    if not match:
+        return {}
+    try:
+        parsed = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+
+    feedback = {}
+    for key in keys:
+        value = parsed.get(str(key))
+        if isinstance(value, str) and value.strip():
+            feedback[key] = value.strip()
+    return feedback
@@ -0,0 +1,251 @@
+"""文字起こし・フィードバック結果のキャッシュ
+
+同じ録音の再アップロード（プロバイダー違いの比較など）で Whisper や LLM を
+再度呼ばないよう、音声のハッシュをキーに結果を保存する。
+
+- メモリ: 件数・バイト数・TTL で上限を設けた LRU
+- ディスク: 任意の SQLite（再起動後も結果を再利用できる）
+- 同じキーの計算が実行中なら、重複して呼ばずにその結果を待つ（single-flight）
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import CACHE_REQUESTS
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def transcript_key(audio_hash: str, model: str, language: str) -> str:
+    return f"transcript:{model}:{language}:{audio_hash}"
+
+
+def feedback_key(transcript: str, provider: str, prompt_version: str) -> str:
+    transcript_hash = hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+    return f"feedback:{provider}:{prompt_version}:{transcript_hash}"
+
+
+class LRUCache:
+    """件数・合計バイト数・TTL で制限されたメモリ上の LRU キャッシュ"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl_seconds: float | None = None):
+        """ttl_seconds を省略するとキャッシュ全体の TTL を使う"""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+
+class SQLiteCache:
+    """ディスク上の SQLite キャッシュ（TTL 付き）"""
+
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return row[0]
+
+    def set(self, key: str, value: str, ttl_seconds: float | None = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+
+class ResultCache:
+    """メモリ LRU + 任意の SQLite の2層キャッシュ。ヒット/ミス数を名前空間ごとに数える"""
+
+    def __init__(self, memory: LRUCache, disk: SQLiteCache | None = None):
+        self.memory = memory
+        self.disk = disk
+        self._counters = {}
+        self._inflight = {}  # key -> 実行中の compute() の Task
+
+    def _count(self, key: str, field: str):
+        namespace = key.split(":", 1)[0]
+        counters = self._counters.setdefault(
+            namespace, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+        )
+        counters[field] += 1
+        CACHE_REQUESTS.labels(namespace, field).inc()
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count(key, "memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                self._count(key, "disk_hits")
+                return value
+        self._count(key, "misses")
+        return None
+
+    def set(self, key: str, value: str, ttl_seconds: float | None = None):
+        """ttl_seconds で名前空間ごとに寿命を変えられる（/ai の応答は文字起こしより短くするなど）"""
+        self.memory.set(key, value, ttl_seconds)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl_seconds)
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    async def get_or_compute(self, key: str, compute, ttl_seconds: float | None = None):
+        """キャッシュにあれば返し、無ければ compute() を await して保存する
+
+        compute が例外を送出した場合は何も保存しない。
+        """
+        value, _ = await self.get_or_compute_with_status(key, compute, ttl_seconds)
+        return value
+
+    async def get_or_compute_with_status(self, key: str, compute, ttl_seconds: float | None = None):
+        """get_or_compute と同じだが、(値, "hit" / "miss" / "coalesced") を返す
+
+        同じキーの compute() が実行中なら新たに呼ばずにその結果を待つ。
+        compute() は別タスクで実行するため、最初の呼び出し元が切断しても
+        待っている他の呼び出し元には結果（または例外）が届く。
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, "hit"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count(key, "coalesced")
+            return await asyncio.shield(task), "coalesced"
+
+        task = asyncio.ensure_future(self._compute_and_set(key, compute, ttl_seconds))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), "miss"
+
+    async def _compute_and_set(self, key: str, compute, ttl_seconds: float | None = None):
+        value = await compute()
+        if value is not None:
+            self.set(key, value, ttl_seconds)
+        return value
+
+    def _finish(self, key: str, task):
+        self._inflight.pop(key, None)
+        # 誰も待っていなかった場合に "exception was never retrieved" を出さない
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        namespaces = {}
+        for name, counters in self._counters.items():
+            lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            hits = counters["memory_hits"] + counters["disk_hits"]
+            namespaces[name] = {
+                **counters,
+                # 実行中の計算を待った分（coalesced）はミスに含まれるが、上流は呼んでいない
+                "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            }
+        return {
+            "entries": len(self.memory),
+            "evictions": self.memory.evictions,
+            "disk_enabled": self.disk is not None,
+            "in_flight": len(self._inflight),
+            "namespaces": namespaces,
+        }
+
+
+def cache_from_env(prefix: str = "CACHE_", ttl_seconds: float = DEFAULT_TTL_SECONDS) -> ResultCache:
+    """環境変数からキャッシュを構築する
+
+    CACHE_MAX_ENTRIES / CACHE_MAX_BYTES / CACHE_TTL_SECONDS / CACHE_SQLITE_PATH
+    （prefix を変えると別のキャッシュ用の変数を読む）
+    """
+    ttl = float(os.environ.get(f"{prefix}TTL_SECONDS", ttl_seconds))
+    memory = LRUCache(
+        max_entries=int(os.environ.get(f"{prefix}MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        max_bytes=int(os.environ.get(f"{prefix}MAX_BYTES", DEFAULT_MAX_BYTES)),
+        ttl_seconds=ttl,
+    )
+    sqlite_path = os.environ.get(f"{prefix}SQLITE_PATH")
+    disk = SQLiteCache(sqlite_path, ttl_seconds=ttl) if sqlite_path else None
+    return ResultCache(memory, disk)
@@ -0,0 +1,161 @@
+"""フィラー語の検出
+
+言語ごとのフィラー語辞書を1つの正規表現（選択）にまとめてコンパイルし、
+文字起こしを1回だけ走査する。同じ位置を複数の
+パターンで数えることはなく、英語のフィラーは単語境界を要求するため
+"umbrella" の "um" や "likely" の "like" は数えない。
+"""
+import json
+import os
+import re
+from functools import lru_cache
+
+_span = re.Match.span
+_group = re.Match.group
+
+# 言語 -> [(表示名, 正規表現), ...]  先に書いたものが優先される
+FILLER_LEXICONS = {
+    "ja": [
+        ("えーと", r"えー+と?"),
+        ("あー", r"あー+"),
+        ("うーん", r"うー+ん?"),
+        ("その", r"その+"),
+        ("なんか", r"なんか"),
+        ("ちょっと", r"ちょっと"),
+    ],
+    "en": [
+        ("um", r"um+"),
+        ("uh", r"uh+"),
+        ("like", r"like"),
+        ("you know", r"you know"),
+    ],
+}
+
+# 日本語の発表でも英語のフィラーが混ざるため両方を使う
+DEFAULT_LANGUAGES = ("ja", "en")
+
+
+def load_lexicons_from_env():
+    """FILLER_LEXICON_PATH の JSON で辞書を上書き・追加する
+
+    形式: {"ja": {"えーと": "えー+と?", ...}, "en": {...}}
+    """
+    path = os.environ.get("FILLER_LEXICON_PATH")
+    if not path:
+        return
+    with open(path, encoding="utf-8") as f:
+        for language, entries in json.load(f).items():
+            register_lexicon(language, list(entries.items()))
+
+
+def register_lexicon(language: str, entries):
+    """言語のフィラー語辞書を登録する（既存の辞書は置き換える）"""
+    FILLER_LEXICONS[language] = list(entries)
+    get_detector.cache_clear()
+
+
+class FillerDetector:
+    def __init__(self, entries):
+        self.entries = [(label, re.compile(pattern), pattern.isascii()) for label, pattern in entries]
+        alternation = "|".join(f"(?:{pattern})" for _, pattern in entries)
+        # フラグ無しの単純な選択にすると re のプレフィックス最適化が効くため、
+        # 大文字小文字は文字起こし側を小文字にして吸収する
+        self.regex = re.compile(alternation)
+        self.regex_ignorecase = re.compile(alternation, re.IGNORECASE)
+        self._labels = {}
+
+    def _label(self, word: str):
+        """一致した文字列（小文字）がどの辞書項目か。(表示名, 英字のみか) を返す"""
+        cached = self._labels.get(word)
+        if cached is None:
+            cached = next(
+                ((label, ascii_only) for label, regex, ascii_only in self.entries if regex.fullmatch(word)),
+                (word, word.isascii()),
+            )
+            self._labels[word] = cached
+        return cached
+
+    def _matches(self, text: str):
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return list(self.regex.finditer(lowered))
+        # 小文字化で長さが変わる文字がある場合は位置がずれるため IGNORECASE で走査する
+        return list(self.regex_ignorecase.finditer(text))
+
+    @staticmethod
+    def _is_word_part(text: str, start: int, end: int) -> bool:
+        """前後が英字なら英単語の一部（umbrella の um、likely の like など）"""
+        before = text[start - 1] if start > 0 else ""
+        after = text[end] if end < len(text) else ""
+        return (before.isascii() and before.isalpha()) or (after.isascii() and after.isalpha())
+
+    def _scan(self, text: str) -> list:
+        """一致したフィラーの (開始位置, 終了位置, 元の文字列, 表示名) を出現順に返す"""
+        matches = self._matches(text)
+        spans = list(map(_span, matches))
+        lowered_words = list(map(_group, matches))
+        labels = {word: self._label(word.lower()) for word in set(lowered_words)}
+
+        hits = []
+        for (start, end), lowered_word in zip(spans, lowered_words):
+            label, ascii_only = labels[lowered_word]
+            if ascii_only and self._is_word_part(text, start, end):
+                continue
+            hits.append((start, end, text[start:end], label))
+        return hits
+
+    def detect(self, text: str) -> dict:
+        """フィラー語の総数・出現順の一覧・表示名ごとの件数・位置を返す"""
+        return _summarize(self._scan(text))
+
+    def detect_many(self, texts) -> list:
+        """複数のテキストを連結して1回だけ走査し、テキストごとに detect() と同じ結果を返す"""
+        texts = list(texts)
+        joined = SEPARATOR.join(texts)
+        hits = self._scan(joined)
+
+        results = []
+        i = 0
+        base = 0
+        for text in texts:
+            # 一致は出現順なので、各テキストの範囲に入るものを先頭から切り出す
+            limit = base + len(text)
+            j = i
+            while j < len(hits) and hits[j][0] < limit:
+                j += 1
+            results.append(_summarize(hits[i:j], base))
+            i = j
+            base = limit + len(SEPARATOR)
+        return results
+
+
+# 連結するときの区切り（どの辞書項目にも含まれず、英字でもない）
+SEPARATOR = "\n"
+
+
+def _summarize(hits, base: int = 0) -> dict:
+    """_scan() の結果を detect() の形式にまとめる（位置は base からの文字数）"""
+    counts = {}
+    for hit in hits:
+        counts[hit[3]] = counts.get(hit[3], 0) + 1
+    return {
+        "filler_count": len(hits),
+        "filler_words": [word for _, _, word, _ in hits],
+        "filler_counts": counts,
+        "filler_positions": [
+            {"filler": label, "start": start - base, "end": end - base}
+            for start, end, _, label in hits
+        ],
+    }
+
+
+@lru_cache(maxsize=None)
+def get_detector(languages=DEFAULT_LANGUAGES) -> FillerDetector:
+    """言語の組み合わせごとにコンパイル済みの検出器を返す"""
+    entries = []
+    for language in languages:
+        entries.extend(FILLER_LEXICONS.get(language, []))
+    return FillerDetector(entries)
+
+
+load_lexicons_from_env()
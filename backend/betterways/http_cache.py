@@ -0,0 +1,48 @@
+"""GET エンドポイントの HTTP キャッシュ用ヘルパー（ETag / Cache-Control / ルートごとの除外）"""
+import hashlib
+import os
+from fnmatch import fnmatchcase
+
+DEFAULT_MAX_AGE = 300
+
+
+def etag_for(body: str) -> str:
+    """応答本文から強い ETag を作る"""
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match に etag が含まれるか（弱い比較。* はすべてに一致）"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def request_directives(cache_control: str | None) -> set:
+    """リクエストの Cache-Control を小文字のディレクティブ名の集合にする（no-cache, no-store など）"""
+    if not cache_control:
+        return set()
+    return {part.split("=", 1)[0].strip().lower() for part in cache_control.split(",") if part.strip()}
+
+
+class RoutePolicy:
+    """キャッシュしないルートを glob パターンで指定する（例: "openai/*", "*/poet"）"""
+
+    def __init__(self, excluded=()):
+        self.excluded = tuple(pattern for pattern in excluded if pattern)
+
+    def enabled(self, route: str) -> bool:
+        return not any(fnmatchcase(route, pattern) for pattern in self.excluded)
+
+
+def route_policy_from_env(name: str) -> RoutePolicy:
+    """カンマ区切りのパターンを環境変数から読む"""
+    return RoutePolicy(pattern.strip() for pattern in os.environ.get(name, "").split(","))
+
+
+def max_age_from_env(name: str, default: int = DEFAULT_MAX_AGE) -> int:
+    try:
+        return max(0, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
@@ -0,0 +1,346 @@
+"""音声分析のバックグラウンドジョブ
+
+投稿されたジョブは SQLite に保存され、上限付きのワーカーが順に処理する。
+結果はポーリング（GET）で取得するか、callback_url に POST で通知する。
+callback_url は http(s) で、内部ネットワーク（プライベート・ループバックなど）宛てでないものだけを受け付ける。
+再起動時には未完了（queued / running）のジョブを再投入する。
+"""
+import asyncio
+import ipaddress
+import json
+import math
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from .metrics import JOB_QUEUE_DEPTH, JOBS_RUNNING, REGISTRY, RETRIES
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUE = 100
+CALLBACK_ATTEMPTS = 3
+CALLBACK_TIMEOUT_SECONDS = 10
+# QueueFull の retry_after の上限（秒）
+MAX_RETRY_AFTER = 300
+
+
+class QueueFull(Exception):
+    """待ち行列が上限に達している（retry_after 秒後の再試行を促す）"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__(f"job queue is full (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+
+class InvalidCallbackURL(ValueError):
+    """callback_url に通知できない（形式が不正、許可されていないホスト、内部ネットワーク宛て）"""
+
+
+class CallbackPolicy(NamedTuple):
+    # 通知してよいホスト（空なら公開アドレスのどれでも）。".example.com" はそのサブドメインすべて
+    allowed_hosts: tuple = ()
+    # プライベート・ループバックなど内部ネットワーク宛てを許す（開発用）
+    allow_private: bool = False
+
+
+def callback_policy_from_env() -> CallbackPolicy:
+    """JOB_CALLBACK_ALLOWED_HOSTS（カンマ区切り）/ JOB_CALLBACK_ALLOW_PRIVATE"""
+    hosts = os.environ.get("JOB_CALLBACK_ALLOWED_HOSTS", "")
+    return CallbackPolicy(
+        allowed_hosts=tuple(host.strip().lower() for host in hosts.split(",") if host.strip()),
+        allow_private=os.environ.get("JOB_CALLBACK_ALLOW_PRIVATE", "0").lower() in ("1", "true", "yes"),
+    )
+
+
+def _host_allowed(host: str, allowed_hosts) -> bool:
+    return any(host == allowed or (allowed.startswith(".") and host.endswith(allowed)) for allowed in allowed_hosts)
+
+
+def _is_public(address) -> bool:
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+async def check_callback_url(url: str, policy: CallbackPolicy = CallbackPolicy()):
+    """通知してよい URL でなければ InvalidCallbackURL
+
+    ホスト名は解決し、どれか1つでも内部ネットワークのアドレスなら断る（SSRF 対策）。
+    """
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        raise InvalidCallbackURL("callback_url を解釈できません。")
+    if parts.scheme not in ("http", "https") or not host:
+        raise InvalidCallbackURL("callback_url には http または https の URL を指定してください。")
+    if policy.allowed_hosts and not _host_allowed(host.lower(), policy.allowed_hosts):
+        raise InvalidCallbackURL("callback_url のホストは許可されていません。")
+    if policy.allow_private:
+        return
+
+    try:
+        addresses = [ipaddress.ip_address(host)]
+    except ValueError:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+            )
+        except OSError:
+            raise InvalidCallbackURL("callback_url のホストを解決できません。")
+        addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    if not all(_is_public(address) for address in addresses):
+        raise InvalidCallbackURL("内部ネットワーク宛ての callback_url は指定できません。")
+
+
+class JobStore:
+    """ジョブの状態を保存する SQLite ストア"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " params TEXT NOT NULL,"
+            " callback_url TEXT,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def create(self, job_id: str, params: dict, callback_url: str | None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, params, callback_url, created_at, updated_at)"
+                " VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, json.dumps(params, ensure_ascii=False), callback_url, now, now),
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, status: str, result=None, error: str | None = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "params": json.loads(row["params"]),
+            "callback_url": row["callback_url"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def unfinished(self):
+        """再起動時に再投入するジョブ ID（古い順）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def count_by_status(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+
+class JobQueue:
+    """上限付きワーカーでジョブを処理するキュー
+
+    handler(params) は結果（JSON にできる dict）を返す async 関数。
+    params["file_path"] の音声ファイルは処理後に削除する。
+    """
+
+    def __init__(self, store: JobStore, handler, storage_dir: str,
+                 workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE,
+                 callback_policy: CallbackPolicy = CallbackPolicy()):
+        self.store = store
+        self.handler = handler
+        self.storage_dir = storage_dir
+        self.workers = workers
+        self.max_queue = max_queue
+        self.callback_policy = callback_policy
+        self._queue = None
+        self._tasks = []
+        self._running = 0
+        # 1件の処理時間の移動平均（QueueFull の retry_after の見積もり用。まだ無ければ None）
+        self._duration = None
+        os.makedirs(storage_dir, exist_ok=True)
+        REGISTRY.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        JOB_QUEUE_DEPTH.set(self._queue.qsize() if self._queue else 0)
+        JOBS_RUNNING.set(self._running)
+
+    async def start(self):
+        """ワーカーを起動し、前回未完了のジョブを再投入する"""
+        self._queue = asyncio.Queue()
+        for job_id in self.store.unfinished():
+            self.store.update(job_id, "queued")
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, file_path: str, params: dict, callback_url: str | None = None) -> str:
+        """音声ファイルをジョブ用ディレクトリへ移してジョブを登録し、ID を返す"""
+        if self._queue is None:
+            raise RuntimeError("job queue is not started")
+        if self._queue.qsize() >= self.max_queue:
+            raise QueueFull(self.retry_after())
+
+        job_id = uuid.uuid4().hex
+        extension = os.path.splitext(file_path)[1]
+        stored_path = os.path.join(self.storage_dir, f"{job_id}{extension}")
+        shutil.move(file_path, stored_path)
+
+        self.store.create(job_id, {**params, "file_path": stored_path}, callback_url)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def retry_after(self) -> int:
+        """待ち行列が1件分空くまでのおおよその秒数"""
+        seconds = (self._duration or 1.0) * (self._queue.qsize() - self.max_queue + 1) / self.workers
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(seconds)))
+
+    async def check_callback_url(self, url: str):
+        await check_callback_url(url, self.callback_policy)
+
+    def get(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is not None:
+            # 内部のファイルパスは返さない
+            job["params"].pop("file_path", None)
+        return job
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "running": self._running,
+            "jobs_by_status": self.store.count_by_status(),
+        }
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._process(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 1件の失敗（ストアや通知の想定外のエラー）でワーカーを止めない
+                print(f"Job {job_id} error: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None:
+            return
+        params = job["params"]
+        self._running += 1
+        self.store.update(job_id, "running")
+        start = time.monotonic()
+        try:
+            result = await self.handler(params)
+            self.store.update(job_id, "completed", result=result)
+        except asyncio.CancelledError:
+            # シャットダウン時は queued に戻し、次回起動時に再処理する
+            self.store.update(job_id, "queued")
+            raise
+        except Exception as e:
+            self.store.update(job_id, "failed", error=str(e))
+        finally:
+            self._running -= 1
+            elapsed = time.monotonic() - start
+            self._duration = elapsed if self._duration is None else 0.8 * self._duration + 0.2 * elapsed
+
+        file_path = params.get("file_path")
+        if file_path and os.path.exists(file_path):
+            os.unlink(file_path)
+
+        if job["callback_url"]:
+            await self._notify(job["callback_url"], self.get(job_id))
+
+    async def _notify(self, callback_url: str, payload: dict):
+        import httpx
+
+        try:
+            # 受け付けた後で内部アドレスを指すよう DNS が変わっていないか、送る前にもう一度確かめる
+            await self.check_callback_url(callback_url)
+        except InvalidCallbackURL as e:
+            print(f"Job callback skipped ({callback_url}): {e}")
+            return
+
+        # リダイレクトで内部ネットワークへ送らないよう、リダイレクトは追わない
+        async with httpx.AsyncClient(timeout=CALLBACK_TIMEOUT_SECONDS, follow_redirects=False) as client:
+            for attempt in range(CALLBACK_ATTEMPTS):
+                try:
+                    response = await client.post(callback_url, json=payload)
+                    if response.status_code < 500:
+                        return
+                except httpx.HTTPError as e:
+                    print(f"Job callback error ({callback_url}): {e}")
+                except Exception as e:
+                    # 不正な URL など、再試行しても直らないもの
+                    print(f"Job callback failed ({callback_url}): {e!r}")
+                    return
+                if attempt + 1 < CALLBACK_ATTEMPTS:
+                    RETRIES.labels("job_callback").inc()
+                    await asyncio.sleep(2 ** attempt)
+
+
+def job_queue_from_env(handler) -> JobQueue:
+    """環境変数からジョブキューを構築する
+
+    JOB_DB_PATH / JOB_STORAGE_DIR / JOB_WORKERS / JOB_MAX_QUEUE / JOB_CALLBACK_ALLOWED_HOSTS / JOB_CALLBACK_ALLOW_PRIVATE
+    """
+    base_dir = os.path.join(tempfile.gettempdir(), "betterways-jobs")
+    storage_dir = os.environ.get("JOB_STORAGE_DIR", base_dir)
+    os.makedirs(storage_dir, exist_ok=True)
+    db_path = os.environ.get("JOB_DB_PATH", os.path.join(storage_dir, "jobs.sqlite3"))
+    return JobQueue(
+        JobStore(db_path),
+        handler,
+        storage_dir,
+        workers=max(1, int(os.environ.get("JOB_WORKERS", DEFAULT_WORKERS))),
+        max_queue=max(1, int(os.environ.get("JOB_MAX_QUEUE", DEFAULT_MAX_QUEUE))),
+        callback_policy=callback_policy_from_env(),
+    )
@@ -0,0 +1,388 @@
+"""Prometheus 形式のメトリクス
+
+依存パッケージを増やさないよう、必要な分（Counter / Gauge / Histogram）だけを
+実装している。ホットパスでは dict の参照と数値の加算だけを行い、
+テキスト形式への変換は /metrics が呼ばれたときにまとめて行う。
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# 秒単位のレイテンシ用（Whisper や長い録音の処理を含むため数分まで）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# アップロードサイズ用（64KB〜256MB）
+SIZE_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(7))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """ラベルの値ごとの系列を返す（呼び出し側で保持しておけば参照も省ける）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock):
+        self.value = 0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _samples(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild(self._lock)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def _samples(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets, lock):
+        self.buckets = buckets
+        # 最後の要素は +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = lock
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """with 文の中の経過時間（秒）を記録する"""
+
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets, self._lock)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _samples(self, values, child):
+        with self._lock:
+            counts = list(child.counts)
+            total = child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = 'le="' + _format_value(float(bound)) + '"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, func):
+        """/metrics の出力直前に呼ぶ関数を登録する（キューの長さなど、その時点の値を Gauge に入れる用）"""
+        self._collectors.append(func)
+
+    def render(self) -> str:
+        for func in self._collectors:
+            func()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "betterways_stage_seconds", "Latency of each speech analysis stage.", ["stage"]
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "betterways_stage_errors_total", "Speech analysis stages that raised.", ["stage"]
+))
+PROVIDER_SECONDS = REGISTRY.register(Histogram(
+    "betterways_provider_request_seconds", "Latency of calls to LLM / speech providers.", ["provider", "operation"]
+))
+PROVIDER_ERRORS = REGISTRY.register(Counter(
+    "betterways_provider_errors_total", "Failed calls to LLM / speech providers.", ["provider", "operation"]
+))
+RETRIES = REGISTRY.register(Counter(
+    "betterways_retries_total", "Retried outbound calls.", ["target"]
+))
+BREAKER_OPEN = REGISTRY.register(Gauge(
+    "betterways_provider_circuit_open", "1 while the provider's circuit breaker is open.", ["provider"]
+))
+FAILOVERS = REGISTRY.register(Counter(
+    "betterways_provider_failovers_total", "Calls moved to a fallback provider after a failure.", ["source", "target"]
+))
+HEDGES = REGISTRY.register(Counter(
+    "betterways_provider_hedges_total", "Slow calls duplicated to a fallback provider.", ["source", "target"]
+))
+TOKENS = REGISTRY.register(Counter(
+    "betterways_provider_tokens_total", "Tokens reported by provider responses.", ["provider", "kind"]
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "betterways_cache_requests_total",
+    "Result cache lookups by outcome (memory_hits / disk_hits / misses / coalesced).",
+    ["namespace", "result"]
+))
+CHAT_SESSION_TURNS = REGISTRY.register(Counter(
+    "betterways_chat_session_turns_total", "Chat turns sent with server-side session history.", ["provider"]
+))
+CHAT_CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    "betterways_chat_context_tokens", "Estimated tokens of session history sent with a chat turn.",
+    buckets=(0, 250, 500, 1000, 2000, 4000, 8000, 16000)
+))
+CHAT_SESSION_COMPACTIONS = REGISTRY.register(Counter(
+    "betterways_chat_session_compactions_total",
+    "Session histories folded into the rolling summary, by method (summarize / truncate).", ["method"]
+))
+GEMINI_CHATS = REGISTRY.register(Counter(
+    "betterways_gemini_chats_total", "Gemini chat sessions used for multi-turn requests (reused / started).", ["outcome"]
+))
+PROMPT_COMPRESSIONS = REGISTRY.register(Counter(
+    "betterways_prompt_compressions_total",
+    "Prompts whose variable part was shrunk to fit the token budget, by method (summarize / select).", ["method"]
+))
+UPLOAD_BYTES = REGISTRY.register(Histogram(
+    "betterways_upload_bytes", "Size of saved audio uploads.", buckets=SIZE_BUCKETS
+))
+PREPROCESS_BYTES = REGISTRY.register(Counter(
+    "betterways_preprocess_bytes_total",
+    "Audio bytes before (original) and after (encoded) preprocessing for transcription.", ["kind"]
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "betterways_http_requests_in_flight", "HTTP requests currently being handled.", ["route"]
+))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "betterways_job_queue_depth", "Background jobs waiting for a worker."
+))
+JOBS_RUNNING = REGISTRY.register(Gauge(
+    "betterways_jobs_running", "Background jobs being processed."
+))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "betterways_admission_wait_seconds", "Time spent queued for a decode / transcription slot.", ["gate"]
+))
+ADMISSION_IN_USE = REGISTRY.register(Gauge(
+    "betterways_admission_in_use", "Slots in use per concurrency gate.", ["gate"]
+))
+ADMISSION_WAITING = REGISTRY.register(Gauge(
+    "betterways_admission_waiting", "Requests queued for a concurrency gate.", ["gate"]
+))
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "betterways_admission_rejections_total",
+    "Requests rejected with 429, by rate rule or gate and reason (client_rate / route_rate / queue_full / timeout).",
+    ["target", "reason"]
+))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "betterways_http_request_seconds", "HTTP request latency (until the response body is complete).",
+    ["method", "route", "status"]
+))
+
+READY = REGISTRY.register(Gauge(
+    "betterways_ready", "1 once the background warm-up has finished."
+))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "betterways_startup_seconds", "Seconds from process start until the app could serve (app) and was warm (ready).",
+    ["phase"]
+))
+WARMUP_SECONDS = REGISTRY.register(Gauge(
+    "betterways_warmup_step_seconds", "Duration of each warm-up step (import:<module> for module imports).", ["step"]
+))
+FIRST_REQUEST_SECONDS = REGISTRY.register(Gauge(
+    "betterways_first_request_seconds", "Latency of the first request to each route since start (cold path).",
+    ["route"]
+))
+
+
+def _flatten(routes):
+    """include_router したルーターを（中のルートを保持したまま登録する版の FastAPI でも）展開する"""
+    for route in routes:
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            yield from _flatten(included.routes)
+        else:
+            yield route
+
+
+class MetricsMiddleware:
+    """HTTP リクエストの処理中の件数とレイテンシを記録する ASGI ミドルウェア
+
+    ラベルにはパスではなくルートのテンプレート（/api/jobs/{job_id} など）を使い、
+    系列が増え続けないようにする。どのルートにも一致しないパスは "other" にまとめる。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._static_routes = {}
+        self._seen_routes = set()
+
+    def _route(self, scope) -> str:
+        path = scope["path"]
+        route = self._static_routes.get(path)
+        if route is not None:
+            return route
+        route = "other"
+        for candidate in _flatten(getattr(scope.get("app"), "routes", ())):
+            regex = getattr(candidate, "path_regex", None)
+            if regex is not None and regex.match(path):
+                route = candidate.path
+                break
+        if route == path:
+            # パラメーターを含まないルートだけを覚えておく
+            self._static_routes[path] = route
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route(scope)
+        in_flight = HTTP_IN_FLIGHT.labels(route)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            elapsed = time.perf_counter() - start
+            HTTP_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            if route not in self._seen_routes:
+                # 各ルートの最初のリクエストは遅延 import やウォームアップ前の影響を受ける
+                self._seen_routes.add(route)
+                FIRST_REQUEST_SECONDS.labels(route).set(elapsed)
+
+
+def record_usage(provider: str, prompt_tokens, completion_tokens):
+    """プロバイダーの応答に含まれるトークン数を記録する（取得できなかったものは None）"""
+    if prompt_tokens:
+        TOKENS.labels(provider, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        TOKENS.labels(provider, "completion").inc(completion_tokens)
@@ -0,0 +1,104 @@
+"""API のリクエスト・レスポンスのモデル（すべてのルーターで共通）"""
+from pydantic import BaseModel
+
+
+# Pydantic model for the request body
+class Message(BaseModel):
+    content: str
+    # POST /api/chat/sessions で作ったセッション。指定するとサーバー側の会話の続きとして送る（content はそのターンの発言だけ）
+    session_id: str | None = None
+
+
+# Pydantic model for a transcribed segment (timestamps in seconds)
+class TranscriptSegment(BaseModel):
+    start: float
+    end: float
+    text: str
+
+
+# Pydantic model for a detected filler word (character offsets in the transcript)
+class FillerPosition(BaseModel):
+    filler: str
+    start: int
+    end: int
+
+
+# Pydantic model for the audio preprocessing report (sizes before/after re-encoding)
+class AudioPreprocessing(BaseModel):
+    format: str
+    original_bytes: int
+    encoded_bytes: int
+    bytes_saved: int
+    trimmed_seconds: float
+    seconds: float
+
+
+# Pydantic models for acoustic (prosody) metrics computed from the decoded waveform
+class PauseStats(BaseModel):
+    count: int
+    total_seconds: float
+    mean_seconds: float
+    median_seconds: float
+    p90_seconds: float
+    max_seconds: float
+    # 長さの区間 -> 件数
+    histogram: dict[str, int] = {}
+
+
+class PitchStats(BaseModel):
+    median_hz: float
+    p5_hz: float
+    p95_hz: float
+    range_semitones: float
+    std_semitones: float
+    voiced_ratio: float
+
+
+class LoudnessStats(BaseModel):
+    mean_db: float
+    std_db: float
+    range_db: float
+
+
+class RateWindow(BaseModel):
+    start: float
+    end: float
+    syllables_per_second: float
+    speaking_ratio: float
+
+
+class ProsodyMetrics(BaseModel):
+    speaking_seconds: float
+    speaking_ratio: float
+    syllables_per_second: float
+    pauses: PauseStats
+    pitch: PitchStats | None = None
+    loudness: LoudnessStats
+    rate_over_time: list[RateWindow] = []
+
+
+# Pydantic model for analysis results
+class SpeechAnalysisResult(BaseModel):
+    transcript: str
+    content_feedback: str
+    total_words: int
+    duration_seconds: float
+    average_wpm: float
+    # 日本語は単語の区切りが曖昧なため、文字数・モーラ数ベースの話速も返す
+    total_characters: int = 0
+    total_morae: int = 0
+    characters_per_minute: float = 0
+    morae_per_minute: float = 0
+    filler_count: int
+    filler_words: list[str]
+    # フィラー語ごとの件数と、文字起こし中の位置（文字単位）
+    filler_counts: dict[str, int] = {}
+    filler_positions: list[FillerPosition] = []
+    used_provider: str
+    segments: list[TranscriptSegment] = []
+    # ステージ名 -> 所要時間(ms)
+    stage_timings: dict[str, float] = {}
+    # Whisper に送る前の前処理の結果（AUDIO_PREPROCESS=off なら None）
+    audio_preprocessing: AudioPreprocessing | None = None
+    # ポーズ・声の高さ・音量・話速の推移（前処理が無効、または1秒未満の音声なら None）
+    prosody: ProsodyMetrics | None = None
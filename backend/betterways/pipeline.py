@@ -0,0 +1,103 @@
+"""依存関係に沿ってステージを並行実行する小さなパイプライン
+
+各ステージは依存するステージの結果をキーワード引数として受け取る。
+依存が揃ったステージから順に開始するため、互いに独立したステージ
+（例: 音声長の取得と文字起こし）は同時に実行される。
+"""
+import asyncio
+import inspect
+import time
+
+from .metrics import STAGE_ERRORS, STAGE_SECONDS
+
+
+class Stage:
+    def __init__(self, name: str, func, deps=(), blocking: bool = False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        # 同期関数で時間がかかるもの（デコード等）はスレッドで実行する
+        self.blocking = blocking
+
+
+class PipelineResult:
+    def __init__(self, results: dict, timings: dict):
+        self.results = results
+        # ステージ名 -> 所要時間(ms)
+        self.timings = timings
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+
+class Pipeline:
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name: str, func, deps=(), blocking: bool = False):
+        """ステージを追加する。func(**{依存名: 結果}) の形で呼ばれる"""
+        if name in self.stages:
+            raise ValueError(f"stage already exists: {name}")
+        self.stages[name] = Stage(name, func, deps, blocking)
+        return self
+
+    def _check(self, inputs: dict):
+        known = set(inputs)
+        for stage in self.stages.values():
+            missing = [d for d in stage.deps if d not in self.stages and d not in known]
+            if missing:
+                raise ValueError(f"stage {stage.name} depends on unknown {missing}")
+
+        # 循環していると永遠に待つことになるので事前に検出する
+        resolved = set(known)
+        pending = dict(self.stages)
+        while pending:
+            ready = [n for n, s in pending.items() if all(d in resolved for d in s.deps)]
+            if not ready:
+                raise ValueError(f"dependency cycle among stages: {sorted(pending)}")
+            resolved.update(ready)
+            for name in ready:
+                del pending[name]
+
+    async def _run_stage(self, stage: Stage, tasks: dict, results: dict, timings: dict):
+        if stage.deps:
+            await asyncio.gather(*(tasks[d] for d in stage.deps if d in tasks))
+        kwargs = {d: results[d] for d in stage.deps}
+
+        start = time.perf_counter()
+        try:
+            if stage.blocking:
+                value = await asyncio.to_thread(stage.func, **kwargs)
+            else:
+                value = stage.func(**kwargs)
+                if inspect.isawaitable(value):
+                    value = await value
+        except Exception:
+            STAGE_ERRORS.labels(stage.name).inc()
+            raise
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage.name).observe(elapsed)
+        timings[stage.name] = round(elapsed * 1000, 1)
+        results[stage.name] = value
+        return value
+
+    async def run(self, **inputs) -> PipelineResult:
+        """全ステージを実行する。どれかが失敗したら残りを取り消して例外を送出する"""
+        self._check(inputs)
+        results = dict(inputs)
+        timings = {}
+        tasks = {}
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.ensure_future(
+                self._run_stage(stage, tasks, results, timings)
+            )
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        return PipelineResult(results, timings)
@@ -0,0 +1,154 @@
+"""文字起こし前の音声の前処理
+
+アップロードされた音声を1回だけデコードし（16kHz モノラル）、前後の無音を切り、
+小さなコーデック（OGG Vorbis / FLAC）で書き出してから Whisper に送る。
+48kHz ステレオの WAV などは数十分の一になり、アップロード時間と上限超えを減らせる。
+デコードした波形は長さの算出や長い録音の分割にもそのまま使い、再デコードしない。
+"""
+import os
+import tempfile
+import time
+from typing import NamedTuple
+
+from .metrics import PREPROCESS_BYTES
+from .segmentation import SAMPLE_RATE, load_audio
+
+# 形式 -> (soundfile の format, subtype, 拡張子)
+FORMATS = {
+    "ogg": ("OGG", "VORBIS", ".ogg"),
+    "flac": ("FLAC", None, ".flac"),
+}
+DEFAULT_FORMAT = "ogg"
+# 最大音量からこの dB 以上小さい区間を無音とみなす
+DEFAULT_TOP_DB = 40
+# 一度に書き込むサンプル数（libsndfile の Vorbis エンコーダは、数分以上を1回で書くとクラッシュする）
+WRITE_BLOCK_FRAMES = 65536
+# 発話の頭と末尾が切れないように残す余白
+PAD_SECONDS = 0.2
+
+
+class PreparedAudio(NamedTuple):
+    source: str
+    # Whisper に送るファイル。書き出しても小さくならなかった場合は source のまま
+    path: str
+    # デコードした波形（トリム前）。start / end は発話区間の秒
+    y: object
+    sr: int
+    start: float
+    end: float
+    format: str
+    original_bytes: int
+    encoded_bytes: int
+    seconds: float
+
+    @property
+    def duration(self) -> float:
+        return len(self.y) / self.sr
+
+    @property
+    def trimmed(self):
+        return self.y[int(self.start * self.sr):int(self.end * self.sr)]
+
+    def report(self) -> dict:
+        return {
+            "format": self.format if self.path != self.source else "original",
+            "original_bytes": self.original_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "bytes_saved": self.original_bytes - self.encoded_bytes,
+            "trimmed_seconds": round(float(self.duration - (self.end - self.start)), 2),
+            "seconds": round(self.seconds, 3),
+        }
+
+    def discard(self):
+        """書き出したファイルを消す（元のファイルは消さない）"""
+        if self.path != self.source and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def preprocess_format_from_env() -> str | None:
+    """AUDIO_PREPROCESS=ogg / flac / off。off なら前処理せず元のファイルを送る"""
+    value = os.environ.get("AUDIO_PREPROCESS", DEFAULT_FORMAT).lower()
+    return value if value in FORMATS else None
+
+
+def speech_bounds(y, sr: int, top_db: float = DEFAULT_TOP_DB):
+    """前後の無音を除いた区間 (開始秒, 終了秒)。全体が無音なら全体を返す"""
+    import librosa
+
+    duration = len(y) / sr
+    if not len(y):
+        return 0.0, 0.0
+    _, (begin, end) = librosa.effects.trim(y, top_db=top_db)
+    if end <= begin:
+        return 0.0, duration
+    return max(0.0, float(begin) / sr - PAD_SECONDS), min(duration, float(end) / sr + PAD_SECONDS)
+
+
+def warm_up():
+    """librosa の import と、デコード・トリム・エンコード・音響特徴の初回呼び出しの準備を済ませておく
+
+    初回だけ numba の JIT コンパイルなどで数秒〜数十秒かかるため、起動後のウォームアップで呼ぶ。
+    """
+    import io
+
+    import librosa
+    import numpy as np
+    import soundfile as sf
+
+    from .prosody import analyze_prosody
+
+    rate = 44100
+    tone = (0.1 * np.sin(2 * np.pi * 150 * np.arange(2 * rate) / rate)).astype(np.float32)
+    y = librosa.resample(tone, orig_sr=rate, target_sr=SAMPLE_RATE)
+    speech_bounds(y, SAMPLE_RATE)
+    for sf_format, subtype, _ in FORMATS.values():
+        sf.write(io.BytesIO(), y, SAMPLE_RATE, format=sf_format, subtype=subtype)
+    analyze_prosody(y, SAMPLE_RATE)
+
+
+def write_audio(path: str, y, sr: int, sf_format: str, subtype: str):
+    """y を WRITE_BLOCK_FRAMES ずつ書き込む"""
+    import soundfile as sf
+
+    with sf.SoundFile(path, "w", sr, 1, format=sf_format, subtype=subtype) as f:
+        for start in range(0, len(y), WRITE_BLOCK_FRAMES):
+            f.write(y[start:start + WRITE_BLOCK_FRAMES])
+
+
+def prepare_audio(file_path: str, format: str = DEFAULT_FORMAT, top_db: float = DEFAULT_TOP_DB) -> PreparedAudio:
+    """デコード・モノラル化・16kHz 化・無音のトリム・再エンコードを行う（同期。スレッドで呼ぶ）"""
+    started = time.perf_counter()
+    y, sr = load_audio(file_path)
+    start, end = speech_bounds(y, sr, top_db)
+
+    sf_format, subtype, suffix = FORMATS[format]
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="whisper_", dir=os.path.dirname(file_path) or None)
+    os.close(fd)
+    try:
+        write_audio(path, y[int(start * sr):int(end * sr)], sr, sf_format, subtype)
+        original_bytes = os.path.getsize(file_path)
+        encoded_bytes = os.path.getsize(path)
+    except BaseException:
+        # 書きかけの一時ファイルを残さない
+        os.unlink(path)
+        raise
+    if encoded_bytes >= original_bytes:
+        # 元から小さい圧縮音声などは、そのまま送る（トリムしていないので、区間の時刻は録音の先頭から）
+        os.unlink(path)
+        path, encoded_bytes = file_path, original_bytes
+        start, end = 0.0, len(y) / sr
+    PREPROCESS_BYTES.labels("original").inc(original_bytes)
+    PREPROCESS_BYTES.labels("encoded").inc(encoded_bytes)
+
+    return PreparedAudio(
+        source=file_path,
+        path=path,
+        y=y,
+        sr=sr,
+        start=start,
+        end=end,
+        format=format,
+        original_bytes=original_bytes,
+        encoded_bytes=encoded_bytes,
+        seconds=time.perf_counter() - started,
+    )
@@ -0,0 +1,235 @@
+"""トークン数の上限を守ったプロンプトの組み立て
+
+プロンプトは、変わらない指示（テンプレートの前半）を先頭に、文字起こしなどの可変部分を末尾に置く。
+同じ前置きが続くので、プロバイダー側のプロンプトキャッシュ（共通の先頭部分の再利用）が効く。
+可変部分が上限を超える場合は、次のどちらかで縮める。
+
+- summarize: 区切った塊を並列に要約し、まだ長ければ要約をさらに要約する（階層的な要約）
+- select: 冒頭・結び・途中から均等に文を選び、上限に収まるまで並べる（LLM を呼ばない）
+
+トークン数は tiktoken があればそれで数え、無ければ文字種ごとの目安で多めに見積もる。
+"""
+import asyncio
+import os
+import re
+from functools import cached_property, lru_cache
+from typing import NamedTuple
+
+from .metrics import PROMPT_COMPRESSIONS
+
+DEFAULT_MAX_TOKENS = 8000
+DEFAULT_CHUNK_TOKENS = 2000
+DEFAULT_STRATEGY = "summarize"
+DEFAULT_FAN_OUT = 4
+# 要約しても上限に収まらない場合に、要約の要約を作る回数
+DEFAULT_MAX_DEPTH = 2
+STRATEGIES = ("summarize", "select")
+# select で必ず残す冒頭と結びの文の数（話の導入と結論）
+KEEP_HEAD_SENTENCES = 2
+KEEP_TAIL_SENTENCES = 2
+OMISSION = "（中略）"
+
+_CJK_PATTERN = re.compile(r"[　-ヿ㐀-䶿一-鿿＀-￯]")
+# 句点・感嘆符・疑問符・改行の直後で文を区切る
+_SENTENCE_END = re.compile(r"(?<=[。！？!?\n])")
+
+
+class PromptBudget(NamedTuple):
+    # プロンプト全体（システムプロンプトを含む）の入力トークン数の上限
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    # 要約するときの1つの塊のトークン数
+    chunk_tokens: int = DEFAULT_CHUNK_TOKENS
+    strategy: str = DEFAULT_STRATEGY
+    # 同時に要約を依頼する塊の数
+    fan_out: int = DEFAULT_FAN_OUT
+    max_depth: int = DEFAULT_MAX_DEPTH
+
+
+def prompt_budget_from_env() -> PromptBudget:
+    """FEEDBACK_MAX_INPUT_TOKENS / FEEDBACK_CHUNK_TOKENS / FEEDBACK_COMPRESSION（summarize / select）/ FEEDBACK_SUMMARY_FAN_OUT"""
+    def positive_int(name: str, default: int) -> int:
+        try:
+            return max(1, int(os.environ.get(name, default)))
+        except ValueError:
+            return default
+
+    strategy = os.environ.get("FEEDBACK_COMPRESSION", DEFAULT_STRATEGY).lower()
+    return PromptBudget(
+        max_tokens=positive_int("FEEDBACK_MAX_INPUT_TOKENS", DEFAULT_MAX_TOKENS),
+        chunk_tokens=positive_int("FEEDBACK_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS),
+        strategy=strategy if strategy in STRATEGIES else DEFAULT_STRATEGY,
+        fan_out=positive_int("FEEDBACK_SUMMARY_FAN_OUT", DEFAULT_FAN_OUT),
+    )
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # 未インストール、またはエンコーディングの取得に失敗した（オフラインなど）
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """tiktoken が無い場合の見積もり（かな・漢字は1文字1トークン、それ以外は4文字1トークン）"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + -(-(len(text) - cjk) // 4)
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class PromptTemplate:
+    """前半（prefix）が固定で、末尾（suffix）だけが変わるプロンプト
+
+    prefix のトークン数は1回だけ数える。suffix は str.format の書式。
+    """
+
+    def __init__(self, prefix: str, suffix: str):
+        self.prefix = prefix
+        self.suffix = suffix
+
+    @cached_property
+    def prefix_tokens(self) -> int:
+        return count_tokens(self.prefix)
+
+    def render(self, **values) -> str:
+        return self.prefix + self.suffix.format(**values)
+
+
+class FittedText(NamedTuple):
+    text: str
+    # none / summarize / select / summarize+select
+    method: str
+    original_tokens: int
+    tokens: int
+
+    def report(self) -> dict:
+        return {"method": self.method, "original_tokens": self.original_tokens, "tokens": self.tokens}
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def split_chunks(text: str, max_tokens: int) -> list[str]:
+    """文の区切りで max_tokens 以下の塊に分ける（1文が長すぎる場合は文の途中で切る）"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if tokens > max_tokens:
+            # 句読点の無い長い発話など。文字数の比率で切る
+            size = max(1, len(sentence) * max_tokens // tokens)
+            pieces = [sentence[i:i + size] for i in range(0, len(sentence), size)]
+        else:
+            pieces = [sentence]
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _spread_order(n: int):
+    """0..n-1 を、冒頭・結びの次に区間の中点を幅優先で辿る順に返す（均等に散らばる）"""
+    head = list(range(min(KEEP_HEAD_SENTENCES, n)))
+    tail = list(range(max(len(head), n - KEEP_TAIL_SENTENCES), n))
+    yield from head
+    yield from tail
+    seen = set(head) | set(tail)
+    intervals = [(0, n - 1)]
+    while intervals:
+        next_intervals = []
+        for low, high in intervals:
+            if high - low < 2:
+                continue
+            middle = (low + high) // 2
+            if middle not in seen:
+                seen.add(middle)
+                yield middle
+            next_intervals += [(low, middle), (middle, high)]
+        intervals = next_intervals
+
+
+def select_sentences(text: str, max_tokens: int) -> str:
+    """上限に収まるだけの文を、元の順序で並べる（省いた箇所には「（中略）」を入れる）"""
+    sentences = split_sentences(text)
+    tokens = [count_tokens(sentence) for sentence in sentences]
+    omission_tokens = count_tokens(OMISSION)
+    chosen = set()
+    used = 0
+    for index in _spread_order(len(sentences)):
+        cost = tokens[index] + omission_tokens
+        if used + cost > max_tokens:
+            continue
+        chosen.add(index)
+        used += cost
+
+    parts = []
+    previous = -1
+    for index in sorted(chosen):
+        if index != previous + 1:
+            parts.append(OMISSION)
+        parts.append(sentences[index])
+        previous = index
+    if previous != len(sentences) - 1:
+        parts.append(OMISSION)
+    return "".join(parts)
+
+
+async def _summarize_chunks(chunks: list[str], summarize, limit: int, fan_out: int) -> list[str]:
+    semaphore = asyncio.Semaphore(fan_out)
+
+    async def run(chunk: str) -> str:
+        async with semaphore:
+            return await summarize(chunk, limit)
+
+    return await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+
+async def fit_to_budget(text: str, max_tokens: int, budget: PromptBudget, summarize=None) -> FittedText:
+    """text を max_tokens 以下にする
+
+    summarize(塊, 目安のトークン数) は要約を返す async 関数。無い場合や失敗した場合は select で縮める。
+    """
+    original_tokens = count_tokens(text)
+    if original_tokens <= max_tokens:
+        return FittedText(text, "none", original_tokens, original_tokens)
+
+    method = "select"
+    if budget.strategy == "summarize" and summarize is not None:
+        current = text
+        try:
+            for _ in range(budget.max_depth):
+                chunks = split_chunks(current, budget.chunk_tokens)
+                # 要約を並べて上限に収まるよう、塊ごとの目安を決める
+                limit = max(50, max_tokens // len(chunks))
+                summaries = await _summarize_chunks(chunks, summarize, limit, budget.fan_out)
+                current = "\n".join(summary.strip() for summary in summaries)
+                tokens = count_tokens(current)
+                if tokens <= max_tokens:
+                    PROMPT_COMPRESSIONS.labels("summarize").inc()
+                    return FittedText(current, "summarize", original_tokens, tokens)
+            text, method = current, "summarize+select"
+        except Exception as e:
+            # 要約に失敗しても、抜粋でフィードバックは作る
+            print(f"summarization failed, selecting sentences instead: {e}")
+
+    selected = select_sentences(text, max_tokens)
+    PROMPT_COMPRESSIONS.labels(method).inc()
+    return FittedText(selected, method, original_tokens, count_tokens(selected))
@@ -0,0 +1,192 @@
+"""デコード済みの波形から話し方の音響的な特徴を求める
+
+ポーズ（間）の数と長さの分布、発話時間の割合、声の高さ（F0）の範囲と変化、
+音量（RMS）の抑揚、時間ごとの話速（音節核の数で近似）を計算する。
+フレーム単位の処理はすべて NumPy の配列演算で行い、フレームごとの Python ループは使わない。
+"""
+import numpy as np
+
+# 20ms ごとの重ならないフレーム（16kHz なら 320 サンプル）
+FRAME_SECONDS = 0.02
+# 最大音量からこの dB 以上小さいフレームを無音とみなす
+SILENCE_TOP_DB = 35
+# これより短い無音はポーズとして数えない（語中の閉鎖音など）
+MIN_PAUSE_SECONDS = 0.25
+PAUSE_BUCKETS = (0.5, 1.0, 2.0)
+# 人の声の F0 の探索範囲
+F0_MIN = 65.0
+F0_MAX = 400.0
+F0_FRAME_LENGTH = 1024
+# F0 は統計にしか使わないので、RMS の STRIDE フレームおきに求める（yin が最も重い）
+F0_STRIDE = 2
+# yin のメモリ使用量を抑えるため、この長さずつ計算する
+F0_CHUNK_SECONDS = 60
+RATE_WINDOW_SECONDS = 30
+# これより短い音声は分析しない
+MIN_SECONDS = 1.0
+# 音節核とみなす音量のピーク（前後 PEAK_FRAMES フレームの中で最大で、最小より PEAK_DB 以上大きい）
+PEAK_FRAMES = 3
+PEAK_DB = 1.0
+EPSILON = 1e-10
+
+
+def frame_db(y, sr: int):
+    """20ms フレームごとの RMS（dB）"""
+    frame = max(1, int(sr * FRAME_SECONDS))
+    n_frames = len(y) // frame
+    frames = np.asarray(y[:n_frames * frame], dtype=np.float32).reshape(n_frames, frame)
+    # einsum は行ごとの二乗和を一時配列なしで計算する
+    power = np.einsum("ij,ij->i", frames, frames) / frame
+    return 10 * np.log10(power + EPSILON), frame
+
+
+def runs(mask):
+    """True が続く区間の (開始フレーム, 終了フレーム) の配列"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def pause_stats(speech) -> dict:
+    """最初の発話から最後の発話までの間にある無音区間の統計"""
+    voiced = np.flatnonzero(speech)
+    if len(voiced) < 2:
+        lengths = np.zeros(0)
+    else:
+        inner = ~speech[voiced[0]:voiced[-1] + 1]
+        starts, ends = runs(inner)
+        lengths = (ends - starts) * FRAME_SECONDS
+        lengths = lengths[lengths >= MIN_PAUSE_SECONDS]
+
+    edges = (MIN_PAUSE_SECONDS, *PAUSE_BUCKETS, np.inf)
+    counts = np.histogram(lengths, bins=edges)[0] if len(lengths) else np.zeros(len(edges) - 1, dtype=int)
+    labels = [f"{low:g}-{high:g}s" for low, high in zip(edges[:-2], edges[1:-1])] + [f"{edges[-2]:g}s+"]
+    return {
+        "count": int(len(lengths)),
+        "total_seconds": round(float(lengths.sum()), 2),
+        "mean_seconds": round(float(lengths.mean()), 2) if len(lengths) else 0.0,
+        "median_seconds": round(float(np.median(lengths)), 2) if len(lengths) else 0.0,
+        "p90_seconds": round(float(np.percentile(lengths, 90)), 2) if len(lengths) else 0.0,
+        "max_seconds": round(float(lengths.max()), 2) if len(lengths) else 0.0,
+        "histogram": dict(zip(labels, counts.tolist())),
+    }
+
+
+def f0_track(y, sr: int, frame: int, stride: int = F0_STRIDE):
+    """RMS のフレーム 0, stride, 2*stride, ... に対応する F0（Hz）"""
+    import librosa
+
+    hop = frame * stride
+    n_frames = -(-(len(y) // frame) // stride)
+    chunk = max(1, int(F0_CHUNK_SECONDS * sr) // hop) * hop
+    # 先頭をずらし、yin のフレームの中心を RMS のフレームの中心に合わせる
+    shift = F0_FRAME_LENGTH // 2 - frame // 2
+    span = chunk + F0_FRAME_LENGTH - hop
+
+    def piece(start):
+        # 波形全体をコピーしないよう、端のチャンクだけゼロで埋める
+        begin = start - shift
+        samples = y[max(0, begin):begin + span]
+        return np.pad(samples, (max(0, -begin), span - max(0, -begin) - len(samples)))
+
+    tracks = [
+        librosa.yin(
+            piece(start),
+            fmin=F0_MIN, fmax=F0_MAX, sr=sr,
+            frame_length=F0_FRAME_LENGTH, hop_length=hop, center=False,
+        )
+        for start in range(0, n_frames * hop, chunk)
+    ]
+    return np.concatenate(tracks)[:n_frames] if tracks else np.zeros(0)
+
+
+def pitch_stats(f0, speech):
+    """発話フレームの F0 の範囲（Hz / 半音）とばらつき（半音の標準偏差）。speech は f0 と同じ間隔"""
+    # yin は周期性の無いフレームで探索範囲の端に張り付くため除く
+    voiced = speech & (f0 > F0_MIN * 1.05) & (f0 < F0_MAX * 0.95)
+    values = f0[voiced]
+    if len(values) < 10:
+        return None
+    low, median, high = np.percentile(values, [5, 50, 95])
+    semitones = 12 * np.log2(values / median)
+    return {
+        "median_hz": round(float(median), 1),
+        "p5_hz": round(float(low), 1),
+        "p95_hz": round(float(high), 1),
+        "range_semitones": round(float(12 * np.log2(high / low)), 2),
+        "std_semitones": round(float(semitones.std()), 2),
+        "voiced_ratio": round(float(voiced.sum() / max(1, speech.sum())), 3),
+    }
+
+
+def loudness_stats(db, speech) -> dict:
+    values = db[speech]
+    if not len(values):
+        return {"mean_db": 0.0, "std_db": 0.0, "range_db": 0.0}
+    p10, p95 = np.percentile(values, [10, 95])
+    return {
+        "mean_db": round(float(values.mean()), 1),
+        "std_db": round(float(values.std()), 2),
+        "range_db": round(float(p95 - p10), 1),
+    }
+
+
+def syllable_peaks(db, speech):
+    """音量の包絡の山（音節核の近似）のフレーム番号"""
+    width = 5
+    smoothed = np.convolve(db, np.ones(width) / width, mode="same")
+    padded = np.pad(smoothed, PEAK_FRAMES, mode="edge")
+    n = len(smoothed)
+    neighbours = np.stack([
+        padded[PEAK_FRAMES + offset:PEAK_FRAMES + offset + n]
+        for offset in range(-PEAK_FRAMES, PEAK_FRAMES + 1) if offset
+    ])
+    is_peak = (
+        (smoothed > neighbours[:PEAK_FRAMES].max(axis=0))
+        & (smoothed >= neighbours[PEAK_FRAMES:].max(axis=0))
+        & (smoothed - neighbours.min(axis=0) >= PEAK_DB)
+    )
+    floor = np.median(db[speech]) - 10 if speech.any() else np.inf
+    return np.flatnonzero(is_peak & speech & (smoothed > floor))
+
+
+def rate_over_time(peaks, speech, window_seconds: float = RATE_WINDOW_SECONDS):
+    """window_seconds ごとの話速（発話時間あたりの音節数）と発話割合"""
+    per_window = max(1, int(window_seconds / FRAME_SECONDS))
+    n_windows = -(-len(speech) // per_window)
+    syllables = np.bincount(peaks // per_window, minlength=n_windows)
+    speaking = np.bincount(np.flatnonzero(speech) // per_window, minlength=n_windows) * FRAME_SECONDS
+    frames = np.minimum(per_window, len(speech) - np.arange(n_windows) * per_window)
+    rates = np.divide(syllables, speaking, out=np.zeros(n_windows), where=speaking > 0)
+    return [
+        {
+            "start": round(i * per_window * FRAME_SECONDS, 2),
+            "end": round(float(i * per_window + frames[i]) * FRAME_SECONDS, 2),
+            "syllables_per_second": round(float(rates[i]), 2),
+            "speaking_ratio": round(float(speaking[i] / (frames[i] * FRAME_SECONDS)), 3),
+        }
+        for i in range(n_windows)
+    ]
+
+
+def analyze_prosody(y, sr: int, pitch: bool = True) -> dict | None:
+    """16kHz モノラルの波形から話し方の音響的な特徴を求める（同期。スレッドで呼ぶ）
+
+    MIN_SECONDS より短い音声は None を返す。
+    """
+    if len(y) < sr * MIN_SECONDS:
+        return None
+    db, frame = frame_db(y, sr)
+    speech = db > max(db.max(initial=-100.0) - SILENCE_TOP_DB, -60.0)
+    speaking_seconds = float(speech.sum() * FRAME_SECONDS)
+    duration = len(y) / sr
+    peaks = syllable_peaks(db, speech)
+
+    return {
+        "speaking_seconds": round(speaking_seconds, 2),
+        "speaking_ratio": round(speaking_seconds / duration, 3) if duration else 0.0,
+        "syllables_per_second": round(len(peaks) / speaking_seconds, 2) if speaking_seconds else 0.0,
+        "pauses": pause_stats(speech),
+        "pitch": pitch_stats(f0_track(y, sr, frame), speech[::F0_STRIDE]) if pitch else None,
+        "loudness": loudness_stats(db, speech),
+        "rate_over_time": rate_over_time(peaks, speech),
+    }
@@ -0,0 +1,395 @@
+"""LLM / 音声認識プロバイダーの非同期ラッパー
+
+エンドポイントは async で定義されているため、同期クライアントを直接呼ぶと
+イベントループ全体が止まる。ここでは AsyncOpenAI と Gemini の非同期 API を使い、
+非同期 API が無い場合だけ上限付きのスレッドプールで実行する。
+プロバイダーごとに同時実行数を Semaphore で制限する。
+HTTP 接続はプロバイダーごとに1つのプールを使い回す（transport.py）。
+SDK（openai / google.generativeai）の import は重いため、初回の呼び出しか
+起動後のバックグラウンドのウォームアップ（load()）まで遅らせる。
+generate / stream に history（それまでの会話）を渡すと、複数ターンの会話として依頼する。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .metrics import GEMINI_CHATS, PROVIDER_ERRORS, PROVIDER_SECONDS, record_usage
+from .transport import HTTPSettings, build_async_client, timeout
+
+DEFAULT_MAX_CONCURRENCY = 8
+# 次のターンで使い回すために残す Gemini の ChatSession の数
+GEMINI_CHAT_CACHE_SIZE = 256
+
+
+def max_concurrency_from_env(name: str, default: int = DEFAULT_MAX_CONCURRENCY) -> int:
+    """環境変数から同時実行数の上限を読む"""
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+def render_history(history: list[dict], prompt: str) -> str:
+    """会話に対応していないプロバイダー向けに、それまでの会話をプロンプトの前に書き出す"""
+    speakers = {"user": "ユーザー", "assistant": "アシスタント"}
+    lines = [f"{speakers.get(message['role'], message['role'])}: {message['content']}" for message in history]
+    return "これまでの会話:\n" + "\n".join(lines) + f"\n\nユーザー: {prompt}"
+
+
+class Provider:
+    """プロバイダー共通の基底クラス（同時実行数の制限を担当）"""
+
+    name = ""
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        """SDK を import してクライアントを作る（2回目以降は何もしない。スレッドから呼んでよい）"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        pass
+
+    async def _ensure_loaded(self):
+        # ウォームアップ前の呼び出しでも、SDK の import でイベントループを止めない
+        if not self._loaded:
+            await asyncio.to_thread(self.load)
+
+    @contextmanager
+    def _observe(self, operation: str):
+        """呼び出しのレイテンシと失敗をメトリクスに記録する（セマフォの待ち時間は含めない）"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            PROVIDER_ERRORS.labels(self.name, operation).inc()
+            raise
+        finally:
+            PROVIDER_SECONDS.labels(self.name, operation).observe(time.perf_counter() - start)
+
+    async def generate(self, prompt: str, system: str | None = None, history: list[dict] | None = None) -> str:
+        """テキストを生成する
+
+        history: それまでの会話（[{"role": "user" / "assistant", "content": ...}]、古い順）
+        """
+        await self._ensure_loaded()
+        async with self._semaphore:
+            with self._observe("generate"):
+                if history:
+                    return await self._chat(prompt, system, history)
+                return await self._generate(prompt, system)
+
+    async def stream(self, prompt: str, system: str | None = None, history: list[dict] | None = None):
+        """生成されたテキストを断片ごとに返す非同期イテレーター"""
+        await self._ensure_loaded()
+        async with self._semaphore:
+            with self._observe("stream"):
+                chunks = self._chat_stream(prompt, system, history) if history else self._stream(prompt, system)
+                async for text in chunks:
+                    if text:
+                        yield text
+
+    async def transcribe(self, file_path: str, language: str = "ja") -> str:
+        """音声ファイルを文字起こしする"""
+        await self._ensure_loaded()
+        async with self._semaphore:
+            with self._observe("transcribe"):
+                return await self._transcribe(file_path, language)
+
+    async def warm_up(self):
+        """接続を確立しておく（初回リクエストで TLS ハンドシェイクを待たないため）"""
+
+    async def aclose(self):
+        """接続プールを閉じる"""
+
+    async def _generate(self, prompt: str, system: str | None) -> str:
+        raise NotImplementedError
+
+    async def _stream(self, prompt: str, system: str | None):
+        # ストリーミング非対応のプロバイダーは全文を1回で返す
+        yield await self._generate(prompt, system)
+
+    async def _chat(self, prompt: str, system: str | None, history: list[dict]) -> str:
+        return await self._generate(render_history(history, prompt), system)
+
+    async def _chat_stream(self, prompt: str, system: str | None, history: list[dict]):
+        yield await self._chat(prompt, system, history)
+
+    async def _transcribe(self, file_path: str, language: str) -> str:
+        raise NotImplementedError(f"{self.name} は文字起こしに対応していません")
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        chat_model: str = "gpt-4o",
+        transcription_model: str = "whisper-1",
+        http_settings: HTTPSettings | None = None,
+        base_url: str | None = None,
+        max_retries: int = 2,
+    ):
+        super().__init__(max_concurrency)
+        self.api_key = api_key
+        self.base_url = base_url
+        # ResilientProvider で包む場合は 0 にして、SDK 側の再試行と二重にしない
+        self.max_retries = max_retries
+        self.http_settings = http_settings or HTTPSettings()
+        self.chat_model = chat_model
+        self.transcription_model = transcription_model
+        self.http_client = None
+        self.client = None
+
+    def _load(self):
+        import openai
+
+        self.http_client = build_async_client(self.http_settings)
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=self.http_client,
+            timeout=timeout(self.http_settings),
+            max_retries=self.max_retries,
+        )
+
+    async def warm_up(self):
+        await self._ensure_loaded()
+        # 認証付きの軽いリクエストで、接続の確立と API キーの確認を兼ねる
+        await self.client.models.list()
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.close()
+            # 閉じた後に使われたら作り直す（同じプロセスでアプリを作り直す場合など）
+            self.client = None
+            self._loaded = False
+
+    @staticmethod
+    def _messages(prompt: str, system: str | None, history=()):
+        messages = []
+        if system is not None:
+            messages.append({"role": "system", "content": system})
+        messages.extend({"role": message["role"], "content": message["content"]} for message in history)
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    async def _generate(self, prompt: str, system: str | None) -> str:
+        return await self._chat(prompt, system, ())
+
+    async def _chat(self, prompt: str, system: str | None, history) -> str:
+        completion = await self.client.chat.completions.create(
+            model=self.chat_model,
+            messages=self._messages(prompt, system, history),
+        )
+        if completion.usage:
+            record_usage(self.name, completion.usage.prompt_tokens, completion.usage.completion_tokens)
+        return completion.choices[0].message.content
+
+    async def _stream(self, prompt: str, system: str | None):
+        async for text in self._chat_stream(prompt, system, ()):
+            yield text
+
+    async def _chat_stream(self, prompt: str, system: str | None, history):
+        stream = await self.client.chat.completions.create(
+            model=self.chat_model,
+            messages=self._messages(prompt, system, history),
+            stream=True,
+            # 最後のチャンクでトークン数を受け取る
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                record_usage(self.name, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+
+    async def _transcribe(self, file_path: str, language: str) -> str:
+        with open(file_path, "rb") as audio_file:
+            transcript_response = await self.client.audio.transcriptions.create(
+                model=self.transcription_model,
+                file=audio_file,
+                language=language,
+            )
+        return transcript_response.text
+
+
+class GeminiProvider(Provider):
+    name = "google"
+
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        model_name: str = "gemini-1.5-flash",
+        http_settings: HTTPSettings | None = None,
+        base_url: str | None = None,
+    ):
+        super().__init__(max_concurrency)
+        self.api_key = api_key
+        # ベンチマーク用のスタブなど、REST で接続する先（例: http://127.0.0.1:8001）
+        self.base_url = base_url
+        self.model_name = model_name
+        self.http_settings = http_settings or HTTPSettings()
+        self._request_options = {"timeout": self.http_settings.read_timeout}
+        self.model = None
+        self._executor = None
+        # 会話の指紋 -> その会話の続きを送れる ChatSession（start_chat の結果を次のターンで使い回す）
+        self._chats = OrderedDict()
+
+    def _load(self):
+        import google.generativeai as genai
+
+        if self.base_url:
+            genai.configure(api_key=self.api_key, transport="rest", client_options={"api_endpoint": self.base_url})
+        else:
+            genai.configure(api_key=self.api_key)
+        self.model = genai.GenerativeModel(self.model_name)
+        if self.base_url or not hasattr(self.model, "generate_content_async"):
+            # 古い SDK には非同期 API が無く、REST の非同期クライアントはイベントループを塞ぐので、
+            # 同時実行数と同じ数のスレッドで同期 API を実行する
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency, thread_name_prefix="gemini"
+            )
+
+    async def warm_up(self):
+        await self._ensure_loaded()
+        # gRPC チャネルは初回の呼び出しで作られるため、課金されない count_tokens で先に開いておく
+        if self._executor is None:
+            await self.model.count_tokens_async("ping", request_options=self._request_options)
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.model.count_tokens, "ping")
+
+    async def aclose(self):
+        self._chats.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._loaded = False
+
+    async def _generate(self, prompt: str, system: str | None) -> str:
+        contents = [system, prompt] if system is not None else prompt
+        if self._executor is None:
+            response = await self.model.generate_content_async(
+                contents, request_options=self._request_options
+            )
+        else:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self._executor, self.model.generate_content, contents
+            )
+        self._record_usage(response)
+        return response.text
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            record_usage(self.name, usage.prompt_token_count, usage.candidates_token_count)
+
+    async def _stream(self, prompt: str, system: str | None):
+        if self._executor is not None:
+            yield await self._generate(prompt, system)
+            return
+        contents = [system, prompt] if system is not None else prompt
+        response = await self.model.generate_content_async(
+            contents, stream=True, request_options=self._request_options
+        )
+        last_chunk = None
+        async for chunk in response:
+            last_chunk = chunk
+            yield chunk.text
+        # トークン数は最後のチャンクに累計が入る
+        if last_chunk is not None:
+            self._record_usage(last_chunk)
+
+    @staticmethod
+    def _chat_key(system: str | None, history) -> str:
+        data = json.dumps([system, [[message["role"], message["content"]] for message in history]], ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _start_chat(self, system: str | None, history):
+        """前のターンの ChatSession が同じ会話を持っていれば使い回し、無ければ start_chat で作る"""
+        chat = self._chats.pop(self._chat_key(system, history), None)
+        if chat is not None:
+            GEMINI_CHATS.labels("reused").inc()
+            return chat
+        GEMINI_CHATS.labels("started").inc()
+        contents = [
+            {"role": "model" if message["role"] == "assistant" else "user", "parts": [message["content"]]}
+            for message in history
+        ]
+        if system:
+            # 指示は user のターンにだけ置く（履歴が応答から始まる場合は、先頭に user のターンを足す）
+            if contents[0]["role"] == "user":
+                contents[0]["parts"].insert(0, system)
+            else:
+                contents.insert(0, {"role": "user", "parts": [system]})
+        return self.model.start_chat(history=contents)
+
+    def _keep_chat(self, chat, system: str | None, history, prompt: str, reply: str):
+        """応答まで済んだ ChatSession を、その会話の指紋で残す（古いものから捨てる）"""
+        turn = [{"role": "user", "content": prompt}, {"role": "assistant", "content": reply}]
+        self._chats[self._chat_key(system, [*history, *turn])] = chat
+        while len(self._chats) > GEMINI_CHAT_CACHE_SIZE:
+            self._chats.popitem(last=False)
+
+    async def _chat(self, prompt: str, system: str | None, history) -> str:
+        chat = self._start_chat(system, history)
+        if self._executor is None:
+            response = await chat.send_message_async(prompt, request_options=self._request_options)
+        else:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self._executor, chat.send_message, prompt)
+        self._record_usage(response)
+        self._keep_chat(chat, system, history, prompt, response.text)
+        return response.text
+
+    async def _chat_stream(self, prompt: str, system: str | None, history):
+        if self._executor is not None:
+            yield await self._chat(prompt, system, history)
+            return
+        chat = self._start_chat(system, history)
+        response = await chat.send_message_async(prompt, stream=True, request_options=self._request_options)
+        texts = []
+        last_chunk = None
+        async for chunk in response:
+            last_chunk = chunk
+            texts.append(chunk.text)
+            yield chunk.text
+        if last_chunk is not None:
+            self._record_usage(last_chunk)
+        # 最後まで受け取った場合だけ、次のターンで使えるように残す
+        self._keep_chat(chat, system, history, prompt, "".join(texts))
+
+
+async def warm_up_all(providers):
+    """複数のプロバイダーを並行にウォームアップする（失敗しても起動は止めない）"""
+    providers = [provider for provider in providers if provider]
+    results = await asyncio.gather(*(provider.warm_up() for provider in providers), return_exceptions=True)
+    for provider, result in zip(providers, results):
+        if isinstance(result, Exception):
+            print(f"{provider.name} warm-up error: {result}")
+
+
+async def close_all(providers):
+    for provider in providers:
+        if provider:
+            await provider.aclose()
@@ -0,0 +1,409 @@
+"""プロバイダー呼び出しのリトライ・タイムアウト・サーキットブレーカー・フェイルオーバー
+
+- 一時的な失敗（429 / 5xx / 接続エラー / タイムアウト）は指数バックオフ＋ジッターで再試行する
+  （Retry-After があればそれ以上待つ）
+- 1回の呼び出し全体に期限を設け、残り時間を超えて待たない（ストリームは次の断片を待つ時間にも掛ける）。
+  deadline() で外側から期限を狭められる（REQUEST_DEADLINE_SECONDS による音声分析全体の期限など）
+- プロバイダーごとのサーキットブレーカーで、落ちているプロバイダーを呼び続けない
+- 失敗時・遅延時に別のプロバイダーへ切り替える（フェイルオーバー / ヘッジ）
+"""
+import asyncio
+import os
+import random
+import time
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple
+
+from .metrics import BREAKER_OPEN, FAILOVERS, HEDGES, RETRIES
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# SDK ごとの接続エラー・タイムアウト（openai / httpx / google-api-core）。import せずに名前で判定する
+TRANSIENT_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "TransportError",
+    "TimeoutException",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+}
+
+
+class CircuitOpen(Exception):
+    """サーキットブレーカーが開いているため呼び出さなかった"""
+
+    def __init__(self, provider: str):
+        super().__init__(f"circuit open for {provider}")
+        self.provider = provider
+
+
+class ResilienceSettings(NamedTuple):
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    # 1回の呼び出し（再試行を含む）の期限
+    timeout: float = 120.0
+    transcribe_timeout: float = 600.0
+    breaker_failures: int = 5
+    breaker_reset: float = 30.0
+    # この秒数で応答が無ければフォールバック先にも同時に依頼する（0 で無効）
+    hedge_after: float = 0.0
+    failover: bool = False
+
+
+def _env(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def request_deadline_from_env() -> float:
+    """REQUEST_DEADLINE_SECONDS: 音声分析1件（ストリーミングを含む）のプロバイダー呼び出しの期限。0 で無制限"""
+    return max(0.0, _env("REQUEST_DEADLINE_SECONDS", 900.0, float))
+
+
+def resilience_from_env() -> ResilienceSettings:
+    """PROVIDER_RETRY_* / PROVIDER_*_TIMEOUT / PROVIDER_BREAKER_* / PROVIDER_HEDGE_AFTER / PROVIDER_FAILOVER"""
+    defaults = ResilienceSettings()
+    return ResilienceSettings(
+        max_attempts=max(1, _env("PROVIDER_RETRY_ATTEMPTS", defaults.max_attempts, int)),
+        base_delay=_env("PROVIDER_RETRY_BASE_DELAY", defaults.base_delay, float),
+        max_delay=_env("PROVIDER_RETRY_MAX_DELAY", defaults.max_delay, float),
+        timeout=_env("PROVIDER_TIMEOUT", defaults.timeout, float),
+        transcribe_timeout=_env("PROVIDER_TRANSCRIBE_TIMEOUT", defaults.transcribe_timeout, float),
+        breaker_failures=max(1, _env("PROVIDER_BREAKER_FAILURES", defaults.breaker_failures, int)),
+        breaker_reset=_env("PROVIDER_BREAKER_RESET_SECONDS", defaults.breaker_reset, float),
+        hedge_after=_env("PROVIDER_HEDGE_AFTER", defaults.hedge_after, float),
+        failover=os.environ.get("PROVIDER_FAILOVER", "0").lower() in ("1", "true", "yes"),
+    )
+
+
+def status_code(exc: BaseException):
+    """例外から HTTP ステータスを取り出す（openai: status_code, google: code）"""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(exc, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """再試行・フェイルオーバーする価値のある失敗か"""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, CircuitOpen)):
+        return True
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def retry_after(exc: BaseException):
+    """Retry-After ヘッダー（秒）。無ければ None"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(settings: ResilienceSettings, attempt: int, rng=random) -> float:
+    """attempt 回目（0 始まり）の失敗後に待つ秒数（full jitter）"""
+    return rng.uniform(0, min(settings.max_delay, settings.base_delay * 2 ** attempt))
+
+
+_deadline = ContextVar("provider_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """この中で行うプロバイダー呼び出しの期限を、今から seconds 秒後までに狭める（0 / None なら何もしない）"""
+    if not seconds:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            # 非同期ジェネレーターが別のコンテキスト（切断後の後始末など）で閉じられた。そこには設定していない
+            pass
+
+
+async def with_deadline(events, seconds: float | None):
+    """events（SSE のイベントなど）を返す間、その中のプロバイダー呼び出しに deadline(seconds) を掛ける"""
+    with deadline(seconds):
+        async with aclosing(events) as items:
+            async for item in items:
+                yield item
+
+
+def _deadline_after(timeout: float) -> float:
+    at = time.monotonic() + timeout
+    outer = _deadline.get()
+    return at if outer is None else min(outer, at)
+
+
+class CircuitBreaker:
+    """連続 failure_threshold 回の一時的な失敗で開き、reset_timeout 秒後に1件だけ試す"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            # 試しに1件だけ通す。結果が出るまで他は止める
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            BREAKER_OPEN.labels(self.name).set(0)
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def release_trial(self):
+        """試しの1件が結果を出さずに終わった（取り消された）。状態は変えず、次の呼び出しでもう一度試す"""
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            self._trial = False
+            BREAKER_OPEN.labels(self.name).set(1)
+
+
+def breaker_for(provider, settings: ResilienceSettings) -> CircuitBreaker:
+    """プロバイダーごとに1つのブレーカー（プライマリとしてもフォールバックとしても共有する）"""
+    breaker = getattr(provider, "_circuit_breaker", None)
+    if breaker is None:
+        breaker = CircuitBreaker(provider.name, settings.breaker_failures, settings.breaker_reset)
+        provider._circuit_breaker = breaker
+    return breaker
+
+
+class ResilientProvider:
+    """Provider を包み、再試行・期限・ブレーカー・フェイルオーバーを加える
+
+    generate / stream / transcribe は元の Provider と同じ形で呼べる。
+    それ以外の属性（transcription_model など）はプライマリのものを返す。
+    """
+
+    def __init__(self, primary, fallbacks=(), settings: ResilienceSettings = ResilienceSettings(), rng=random):
+        self.primary = primary
+        self.fallbacks = list(fallbacks)
+        self.settings = settings
+        self.rng = rng
+
+    @property
+    def name(self) -> str:
+        return self.primary.name
+
+    def __getattr__(self, attr):
+        return getattr(self.primary, attr)
+
+    async def _call(self, provider, call, timeout: float):
+        """provider への1回分の呼び出しを、期限内で再試行しながら行う"""
+        breaker = breaker_for(provider, self.settings)
+        deadline_at = _deadline_after(timeout)
+        attempt = 0
+        while True:
+            trial = breaker.state == "half_open"
+            if not breaker.allow():
+                raise CircuitOpen(provider.name)
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                if trial:
+                    breaker.release_trial()
+                raise asyncio.TimeoutError(f"{provider.name} deadline exceeded")
+            try:
+                result = await asyncio.wait_for(call(), remaining)
+            except Exception as e:
+                if not is_transient(e):
+                    # 4xx などはプロバイダーの不調ではないので、ブレーカーの判定には使わない
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                attempt += 1
+                delay = max(retry_after(e) or 0.0, backoff(self.settings, attempt - 1, self.rng))
+                if attempt >= self.settings.max_attempts or time.monotonic() + delay >= deadline_at:
+                    raise
+                RETRIES.labels(provider.name).inc()
+                await asyncio.sleep(delay)
+            except BaseException:
+                # 取り消された（クライアントの切断、ヘッジで負けた側など）。試しの1件なら手放さないとブレーカーが閉じなくなる
+                if trial:
+                    breaker.release_trial()
+                raise
+            else:
+                breaker.record_success()
+                return result
+
+    def _candidates(self):
+        return [self.primary, *self.fallbacks] if self.settings.failover else [self.primary]
+
+    async def generate(self, prompt: str, system: str | None = None, history: list[dict] | None = None) -> str:
+        candidates = self._candidates()
+        if self.settings.hedge_after > 0 and len(candidates) > 1:
+            return await self._hedged(candidates, prompt, system, history)
+
+        for index, provider in enumerate(candidates):
+            try:
+                return await self._call(
+                    provider, lambda: provider.generate(prompt, system, history), self.settings.timeout
+                )
+            except Exception as e:
+                if index + 1 == len(candidates) or not is_transient(e):
+                    raise
+                FAILOVERS.labels(provider.name, candidates[index + 1].name).inc()
+
+    async def _hedged(self, candidates, prompt: str, system: str | None, history: list[dict] | None) -> str:
+        """プライマリが hedge_after 秒で応答しなければフォールバック先にも依頼し、早い方を使う"""
+        primary, fallback = candidates[0], candidates[1]
+
+        def start(provider):
+            return asyncio.ensure_future(
+                self._call(provider, lambda: provider.generate(prompt, system, history), self.settings.timeout)
+            )
+
+        tasks = {start(primary)}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.settings.hedge_after)
+            first = next(iter(done), None)
+            if first is not None:
+                error = first.exception()
+                if error is None:
+                    return first.result()
+                if not is_transient(error):
+                    raise error
+                tasks = set()
+                FAILOVERS.labels(primary.name, fallback.name).inc()
+            else:
+                HEDGES.labels(primary.name, fallback.name).inc()
+            tasks.add(start(fallback))
+
+            errors = []
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream(self, prompt: str, system: str | None = None, history: list[dict] | None = None):
+        """最初の断片が届く前の失敗だけを再試行・フェイルオーバーする（途中からはやり直せない）"""
+        candidates = self._candidates()
+        deadline_at = _deadline_after(self.settings.timeout)
+        for index, provider in enumerate(candidates):
+            breaker = breaker_for(provider, self.settings)
+            attempt = 0
+            while True:
+                trial = breaker.state == "half_open"
+                if not breaker.allow():
+                    error = CircuitOpen(provider.name)
+                    break
+                started = False
+                try:
+                    chunks = _until(provider.stream(prompt, system, history), deadline_at, provider.name)
+                    async with aclosing(chunks) as texts:
+                        async for text in texts:
+                            started = True
+                            yield text
+                    breaker.record_success()
+                    return
+                except Exception as e:
+                    if started or not is_transient(e):
+                        # 応答が届いた、または 4xx などプロバイダーの不調ではない失敗
+                        breaker.record_success()
+                        raise
+                    breaker.record_failure()
+                    attempt += 1
+                    error = e
+                    delay = max(retry_after(e) or 0.0, backoff(self.settings, attempt - 1, self.rng))
+                    if attempt >= self.settings.max_attempts or time.monotonic() + delay >= deadline_at:
+                        break
+                    RETRIES.labels(provider.name).inc()
+                    await asyncio.sleep(delay)
+                except BaseException:
+                    # 取り消された、または途中で読むのをやめられた。応答が届いていればプロバイダーは正常
+                    if started:
+                        breaker.record_success()
+                    elif trial:
+                        breaker.release_trial()
+                    raise
+            if index + 1 == len(candidates):
+                raise error
+            FAILOVERS.labels(provider.name, candidates[index + 1].name).inc()
+
+    async def transcribe(self, file_path: str, language: str = "ja") -> str:
+        # 文字起こしに対応しているのはプライマリ（OpenAI）だけなので、フェイルオーバーはしない
+        return await self._call(
+            self.primary, lambda: self.primary.transcribe(file_path, language), self.settings.transcribe_timeout
+        )
+
+    async def warm_up(self):
+        await self.primary.warm_up()
+
+    async def aclose(self):
+        await self.primary.aclose()
+
+
+async def _until(stream, deadline_at: float, name: str):
+    """stream の断片を、期限を過ぎるまで返す（次の断片を待つ間に期限が来たら TimeoutError）"""
+    try:
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"{name} deadline exceeded")
+            try:
+                yield await asyncio.wait_for(anext(stream), remaining)
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def with_resilience(providers, settings: ResilienceSettings):
+    """プロバイダーのリストをそれぞれ ResilientProvider で包む（None はそのまま）
+
+    failover が有効なら、他の利用可能なプロバイダーをフォールバック先にする。
+    """
+    available = [provider for provider in providers if provider]
+    return [
+        ResilientProvider(provider, [other for other in available if other is not provider], settings)
+        if provider else None
+        for provider in providers
+    ]
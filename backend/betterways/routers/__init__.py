@@ -0,0 +1 @@
+"""API のルーター（BETTERWAYS_ROUTERS で、どれをアプリに載せるかを選ぶ）"""
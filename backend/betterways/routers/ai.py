@@ -0,0 +1,110 @@
+"""URL でLLM・ロール・プロンプトを指定するルーター（GET /ai/{llm}/{role}/{prompt}）
+
+応答は共有キャッシュの "ai" 名前空間に AI_CACHE_TTL_SECONDS だけ保存し、ETag を付けて返す。
+?session=（POST /api/chat/sessions で作った ID）を付けると、サーバー側の会話の続きとして送る（キャッシュしない）。
+"""
+import hashlib
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from ..admission import RateRule
+from ..http_cache import etag_for, etag_matches, max_age_from_env, request_directives, route_policy_from_env
+from ..resilience import is_transient
+from ..services import get_services
+from ..sessions import SessionNotFound
+
+router = APIRouter()
+
+# /ai の応答は文字起こしなどより短く保存する（既定: 1時間）
+AI_CACHE_TTL_SECONDS = float(os.environ.get("AI_CACHE_TTL_SECONDS", 3600))
+# ブラウザ・CDN 向けの Cache-Control: max-age
+AI_CACHE_MAX_AGE = max_age_from_env("AI_CACHE_MAX_AGE")
+# キャッシュしない "llm/role" のパターン（カンマ区切り。例: "openai/*,gemini/poet"）
+AI_CACHE_POLICY = route_policy_from_env("AI_CACHE_EXCLUDE")
+# レート制限（AdmissionMiddleware の対象。キャッシュから返す分も数える）
+RATE_LIMITS = [RateRule.from_env("ai", ["/ai/"], methods=["GET"], per_client="60/60", total="600/60")]
+
+
+def ai_cache_key(llm: str, role: str, prompt: str) -> str:
+    digest = hashlib.sha256(f"{role}\0{prompt}".encode("utf-8")).hexdigest()
+    return f"ai:{llm}:{digest}"
+
+
+def provider_error(label: str, e: Exception) -> HTTPException:
+    """再試行しても一時的な失敗（429/5xx・タイムアウト・ブレーカー開）が続いた場合は503で再試行を促す"""
+    if is_transient(e):
+        return HTTPException(
+            status_code=503,
+            detail=f"{label} temporarily unavailable: {str(e)}",
+            headers={"Retry-After": str(get_services().retry_after_seconds())},
+        )
+    return HTTPException(status_code=500, detail=f"{label} error: {str(e)}")
+
+
+async def generate_ai_response(llm: str, role: str, prompt: str, session: str | None = None) -> str:
+    services = get_services()
+    if llm == "openai":
+        client, system, label = services.openai_client, f"You are a {role}.", "OpenAI"
+        if not client:
+            raise HTTPException(status_code=500, detail="OpenAI API not available.")
+    else:
+        client, system, label = services.gemini_model, f"You are a {role}." if role else "", "Gemini"
+        if not client:
+            raise HTTPException(status_code=500, detail="Google Gemini API not available.")
+    try:
+        if session:
+            return await services.chat_sessions.send(session, prompt, client, system)
+        return await client.generate(prompt, system=system)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired.")
+    except Exception as e:
+        raise provider_error(label, e)
+
+
+@router.get("/ai/{llm}/{role}/{prompt:path}")
+async def ai_endpoint(llm: str, role: str, prompt: str, request: Request, session: str | None = None):
+    """
+    例: /ai/gemini/teacher/javaについておしえて
+
+    (llm, role, prompt) ごとに応答をキャッシュし、ETag を付ける。If-None-Match が一致すれば 304 を返す。
+    "Cache-Control: no-cache" で再生成、"no-store" でキャッシュを使わない。
+    ?session= を付けると会話の続きとして送り、キャッシュは使わない。
+    """
+    if llm not in ("openai", "gemini"):
+        raise HTTPException(status_code=400, detail="Supported llm: openai, gemini")
+    if session:
+        response = await generate_ai_response(llm, role, prompt, session)
+        return JSONResponse(
+            {"llm": llm, "role": role, "prompt": prompt, "response": response, "session_id": session},
+            headers={"Cache-Control": "no-store", "X-Cache": "BYPASS"},
+        )
+    cache = get_services().result_cache
+    directives = request_directives(request.headers.get("cache-control"))
+    if "no-store" in directives or not AI_CACHE_POLICY.enabled(f"{llm}/{role}"):
+        response = await generate_ai_response(llm, role, prompt)
+        return JSONResponse(
+            {"llm": llm, "role": role, "prompt": prompt, "response": response},
+            headers={"Cache-Control": "no-store", "X-Cache": "BYPASS"},
+        )
+
+    key = ai_cache_key(llm, role, prompt)
+    if "no-cache" in directives:
+        response = await generate_ai_response(llm, role, prompt)
+        cache.set(key, response, AI_CACHE_TTL_SECONDS)
+        status = "refresh"
+    else:
+        response, status = await cache.get_or_compute_with_status(
+            key, lambda: generate_ai_response(llm, role, prompt), AI_CACHE_TTL_SECONDS
+        )
+
+    etag = etag_for(response)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={AI_CACHE_MAX_AGE}",
+        "X-Cache": status.upper(),
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"llm": llm, "role": role, "prompt": prompt, "response": response}, headers=headers)
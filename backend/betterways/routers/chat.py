@@ -0,0 +1,127 @@
+"""チャットのルーター（/api/chat, /api/chat/stream, /api/chat/sessions）
+
+Message.session_id を指定すると、サーバー側に保存した会話（sessions.py）の続きとして送る。
+"""
+from fastapi import APIRouter, HTTPException
+
+from ..admission import RateRule
+from ..models import Message
+from ..services import get_services
+from ..sessions import SessionNotFound
+from ..sse import sse_event, sse_response
+
+router = APIRouter()
+
+# レート制限（AdmissionMiddleware の対象。セッションの取得・削除は数えない）
+RATE_LIMITS = [RateRule.from_env("chat", ["/api/chat"], per_client="30/60", total="300/60")]
+
+SESSION_NOT_FOUND = "Chat session not found or expired. Create a new one with POST /api/chat/sessions."
+
+
+async def generate_reply(client, message: Message, system: str | None = None) -> str:
+    """セッションがあれば会話の続きとして、無ければそのターンだけで応答を生成する"""
+    if message.session_id:
+        return await get_services().chat_sessions.send(message.session_id, message.content, client, system)
+    return await client.generate(message.content, system=system)
+
+
+def require_session(message: Message):
+    if message.session_id and get_services().chat_sessions.get(message.session_id) is None:
+        raise HTTPException(status_code=404, detail=SESSION_NOT_FOUND)
+
+
+# API endpoint for chat
+@router.post("/api/chat")
+async def chat_with_llm(message: Message, provider: str = "openai"):
+    """チャット機能（プロバイダー指定可能）"""
+    services = get_services()
+    require_session(message)
+    if provider == "openai":
+        if not services.openai_client:
+            return {"error": "OpenAI client is not initialized. Check your API key."}
+        try:
+            response_content = await generate_reply(
+                services.openai_client,
+                message,
+                system="You are a helpful assistant."
+            )
+            return {"response": response_content, "used_provider": "openai", "session_id": message.session_id}
+        except SessionNotFound:
+            raise HTTPException(status_code=404, detail=SESSION_NOT_FOUND)
+        except Exception as e:
+            return {"error": f"OpenAI Error: {str(e)}"}
+
+    elif provider == "google":
+        if not services.gemini_model:
+            return {"error": "Google Gemini client is not initialized. Check your API key."}
+        try:
+            response_content = await generate_reply(services.gemini_model, message)
+            return {"response": response_content, "used_provider": "google", "session_id": message.session_id}
+        except SessionNotFound:
+            raise HTTPException(status_code=404, detail=SESSION_NOT_FOUND)
+        except Exception as e:
+            return {"error": f"Google Gemini Error: {str(e)}"}
+
+    else:
+        return {"error": f"Invalid provider: {provider}. Use 'openai' or 'google'"}
+
+
+# API endpoint for chat (Server-Sent Events)
+@router.post("/api/chat/stream")
+async def chat_with_llm_stream(message: Message, provider: str = "openai"):
+    """チャットの応答を生成しながらSSEで返す（delta → done）"""
+    require_session(message)
+    return sse_response(chat_events(message, provider))
+
+
+async def chat_events(message: Message, provider: str):
+    services = get_services()
+    if provider == "openai":
+        client, system, name = services.openai_client, "You are a helpful assistant.", "OpenAI"
+    elif provider == "google":
+        client, system, name = services.gemini_model, None, "Google Gemini"
+    else:
+        yield sse_event("error", {"error": f"Invalid provider: {provider}. Use 'openai' or 'google'"})
+        return
+
+    if not client:
+        yield sse_event("error", {"error": f"{name} client is not initialized. Check your API key."})
+        return
+
+    if message.session_id:
+        texts = services.chat_sessions.stream(message.session_id, message.content, client, system)
+    else:
+        texts = client.stream(message.content, system=system)
+    chunks = []
+    try:
+        async for text in texts:
+            chunks.append(text)
+            yield sse_event("delta", {"text": text})
+    except SessionNotFound:
+        yield sse_event("error", {"error": SESSION_NOT_FOUND})
+        return
+    except Exception as e:
+        yield sse_event("error", {"error": f"{name} Error: {str(e)}"})
+        return
+    yield sse_event("done", {"response": "".join(chunks), "used_provider": provider, "session_id": message.session_id})
+
+
+@router.post("/api/chat/sessions")
+async def create_chat_session():
+    """会話を始める。返した session_id を以降の /api/chat に付ける"""
+    return {"session_id": get_services().chat_sessions.create().id}
+
+
+@router.get("/api/chat/sessions/{session_id}")
+async def get_chat_session(session_id: str):
+    """保存している会話（要約と、まだ要約していないターン）"""
+    conversation = get_services().chat_sessions.get(session_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail=SESSION_NOT_FOUND)
+    return {**conversation.to_dict(), "tokens": conversation.tokens()}
+
+
+@router.delete("/api/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    get_services().chat_sessions.delete(session_id)
+    return {"deleted": True}
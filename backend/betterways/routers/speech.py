@@ -0,0 +1,897 @@
+"""音声分析のルーター（/api/analyze-speech, /api/analyze-speech/stream, /api/analyze-speech/batch, /api/jobs）"""
+import asyncio
+import json
+import os
+import zipfile
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.encoders import jsonable_encoder
+
+from .. import batch
+from ..admission import Overloaded, RateRule, background
+from ..audio_probe import probe_duration, probe_header_duration
+from ..cache import feedback_key, transcript_key
+from ..fillers import get_detector
+from ..jobs import InvalidCallbackURL, QueueFull, job_queue_from_env
+from ..models import SpeechAnalysisResult
+from ..pipeline import Pipeline
+from ..prompts import PromptTemplate, count_tokens, fit_to_budget, prompt_budget_from_env
+from ..preprocess import PreparedAudio, prepare_audio, preprocess_format_from_env
+from ..resilience import deadline, is_transient, request_deadline_from_env, with_deadline
+from ..segmentation import (
+    fan_out_from_env,
+    needs_segmentation,
+    segment_seconds_from_env,
+    transcribe_buffer,
+    transcribe_in_segments,
+)
+from ..services import get_services
+from ..sse import sse_event, sse_response
+from ..tokenizer import get_tokenizer
+from ..uploads import SavedUpload, UploadTooLarge, max_upload_bytes_from_env, save_upload
+
+router = APIRouter()
+
+# アップロードサイズの上限（受信中に判定し、超えた時点で413を返す。UploadSizeLimitMiddleware の対象）
+MAX_UPLOAD_BYTES = max_upload_bytes_from_env()
+UPLOAD_PATH_PREFIXES = ["/api/analyze-speech", "/api/jobs"]
+# まとめて分析は複数のファイルを1つのボディで送るので、録音ごとの上限ではなくボディ全体の上限を掛ける
+# （録音ごとの上限は save_upload と zip の展開で1件ずつ判定し、zip の展開後の合計にもボディ全体の上限を掛ける）
+BATCH_PATH_PREFIXES = ["/api/analyze-speech/batch"]
+BATCH_MAX_BYTES = batch.max_bytes_from_env()
+# レート制限（AdmissionMiddleware の対象）。音声分析はデコードの待ち行列が満杯ならアップロードを受け取る前に断る
+RATE_LIMITS = [
+    RateRule.from_env("speech", ["/api/analyze-speech"], per_client="10/60", total="60/60", gates=["decode"]),
+    # ジョブはワーカーの待ち行列（JOB_MAX_QUEUE）で件数が抑えられるので、ゲートでは断らない
+    RateRule.from_env("jobs", ["/api/jobs/analyze-speech"], per_client="10/60", total="60/60"),
+]
+
+# 音声分析1件のプロバイダー呼び出し（文字起こし・フィードバック）全体の期限
+REQUEST_DEADLINE_SECONDS = request_deadline_from_env()
+
+# 長い録音は無音区間で分割し、並列に文字起こしする
+TRANSCRIBE_SEGMENT_SECONDS = segment_seconds_from_env()
+TRANSCRIBE_FAN_OUT = fan_out_from_env()
+# Whisper に送る前に 16kHz モノラル化・無音トリム・再エンコードする形式（ogg / flac / off）
+AUDIO_PREPROCESS_FORMAT = preprocess_format_from_env()
+
+# プロンプトを変更したら上げる（古いフィードバックのキャッシュを使わないため）
+FEEDBACK_PROMPT_VERSION = "2"
+
+
+def validate_audio_file(file: UploadFile) -> bool:
+    """音声ファイルの形式を検証"""
+    # Content-Typeチェック
+    allowed_content_types = ["audio/mpeg", "audio/mp3", "audio/wav", "audio/m4a", "audio/x-m4a"]
+
+    # ファイル拡張子チェック
+    if file.filename:
+        file_extension = file.filename.split('.')[-1].lower()
+        allowed_extensions = ["mp3", "wav", "m4a"]
+
+        # いずれかの条件を満たしていればOK
+        return (file.content_type in allowed_content_types or
+                file_extension in allowed_extensions)
+
+    return file.content_type in allowed_content_types
+
+
+def analyze_speech_patterns(transcript: str, duration_seconds: float):
+    """音声パターンを分析する関数"""
+    return analyze_speech_patterns_batch([transcript], [duration_seconds])[0]
+
+
+def analyze_speech_patterns_batch(transcripts: list[str], durations: list[float]) -> list[dict]:
+    """複数の文字起こしの音声パターンをまとめて分析する"""
+    import numpy as np
+
+    # 単語数・文字数・モーラ数をカウント（日本語は形態素解析、無ければ文字種の区切りで近似）
+    tokenizer = get_tokenizer()
+    counts = [tokenizer.analyze(transcript) for transcript in transcripts]
+
+    # フィラー語検出（辞書をまとめてコンパイルした検出器で、全件を連結して1回だけ走査）
+    fillers = get_detector().detect_many(transcripts)
+
+    # WPM計算（分あたりの単語数）と、文字数・モーラ数ベースの話速を全件まとめて計算
+    duration_minutes = np.asarray(durations, dtype=float) / 60
+
+    def per_minute(key):
+        values = np.array([count[key] for count in counts], dtype=float)
+        rates = np.divide(values, duration_minutes, out=np.zeros_like(values), where=duration_minutes > 0)
+        return np.round(rates, 2).tolist()
+
+    average_wpm = per_minute("words")
+    characters_per_minute = per_minute("characters")
+    morae_per_minute = per_minute("morae")
+
+    return [
+        {
+            "total_words": counts[i]["words"],
+            "duration_seconds": durations[i],
+            "average_wpm": average_wpm[i],
+            "total_characters": counts[i]["characters"],
+            "total_morae": counts[i]["morae"],
+            "characters_per_minute": characters_per_minute[i],
+            "morae_per_minute": morae_per_minute[i],
+            **fillers[i]
+        }
+        for i in range(len(transcripts))
+    ]
+
+
+async def whisper_transcribe(file_path: str, audio_hash: str | None = None, duration_seconds: float = 0.0, audio: PreparedAudio | None = None):
+    """Whisperで文字起こし
+
+    長い録音は分割して並列に処理する。音声ハッシュがあればキャッシュを使う。
+    前処理済みの音声（audio）があれば、縮めたファイルを送り、分割にはデコード済みの波形を使う。
+    戻り値は {"text": 全文, "segments": [{"start", "end", "text"}, ...]}
+    """
+    services = get_services()
+    async def run():
+        # キャッシュ済みなら枠を使わない（文字起こしする時だけ枠を待つ）
+        async with services.gates["transcription"].slot():
+            if audio is not None:
+                result = await transcribe_prepared(audio)
+            elif needs_segmentation(duration_seconds, os.path.getsize(file_path), TRANSCRIBE_SEGMENT_SECONDS):
+                result = await transcribe_in_segments(
+                    file_path,
+                    lambda path: services.openai_client.transcribe(path, language="ja"),
+                    max_segment_seconds=TRANSCRIBE_SEGMENT_SECONDS,
+                    fan_out=TRANSCRIBE_FAN_OUT,
+                    language="ja",
+                )
+            else:
+                text = await services.openai_client.transcribe(file_path, language="ja")
+                result = {"text": text, "segments": [{"start": 0.0, "end": round(duration_seconds, 2), "text": text}]}
+        return json.dumps(result, ensure_ascii=False)
+
+    if audio_hash is None:
+        return json.loads(await run())
+
+    key = transcript_key(audio_hash, services.openai_client.transcription_model, "ja")
+    return json.loads(await services.result_cache.get_or_compute(key, run))
+
+
+async def transcribe_prepared(audio: PreparedAudio) -> dict:
+    """前処理済みの音声を文字起こしする（区間の時刻は元の録音での秒）"""
+    services = get_services()
+    speech_seconds = audio.end - audio.start
+    if needs_segmentation(speech_seconds, audio.encoded_bytes, TRANSCRIBE_SEGMENT_SECONDS):
+        result = await transcribe_buffer(
+            audio.trimmed,
+            audio.sr,
+            lambda path: services.openai_client.transcribe(path, language="ja"),
+            max_segment_seconds=TRANSCRIBE_SEGMENT_SECONDS,
+            fan_out=TRANSCRIBE_FAN_OUT,
+            language="ja",
+        )
+        for segment in result["segments"]:
+            segment["start"] = round(segment["start"] + audio.start, 2)
+            segment["end"] = round(segment["end"] + audio.start, 2)
+        return result
+
+    text = await services.openai_client.transcribe(audio.path, language="ja")
+    return {"text": text, "segments": [{"start": round(audio.start, 2), "end": round(audio.end, 2), "text": text}]}
+
+
+async def prepare_upload(upload) -> PreparedAudio | None:
+    """AUDIO_PREPROCESS が有効なら、デコード・トリム・再エンコードを行う（無効なら None）"""
+    if not AUDIO_PREPROCESS_FORMAT:
+        return None
+    async with get_services().gates["decode"].slot():
+        audio = await asyncio.to_thread(prepare_audio, upload.path, AUDIO_PREPROCESS_FORMAT)
+    print(f"音声の前処理: {audio.report()}")
+    return audio
+
+
+async def decode_duration(path: str) -> float:
+    """音声の長さ（ヘッダーから取れなければデコードするので、デコードの枠を使う）"""
+    async with get_services().gates["decode"].slot():
+        return await asyncio.to_thread(probe_duration, path)
+
+
+def measure_prosody(y, sr: int):
+    """音響特徴を求める（numpy を使うモジュールは最初に使う時かウォームアップで読み込む）"""
+    from ..prosody import analyze_prosody
+    return analyze_prosody(y, sr)
+
+
+async def transcribe_audio(file_path: str, provider: str, audio_hash: str | None = None, duration_seconds: float = 0.0, audio: PreparedAudio | None = None):
+    """音声を文字起こしする統一関数（前処理で書き出したファイルは、終わったら消す）"""
+    services = get_services()
+    try:
+        if provider == "openai":
+            if not services.openai_client:
+                raise HTTPException(status_code=500, detail="OpenAI APIが利用できません。APIキーを確認してください。")
+
+            return await whisper_transcribe(file_path, audio_hash, duration_seconds, audio)
+
+        elif provider == "google":
+            # Google Speech-to-Text APIの実装予定地
+            # 現在は暫定的にOpenAI Whisperを使用
+            if not services.openai_client:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Google Speech-to-Text APIは未実装です。OpenAI Whisper APIを使用するため、OpenAI APIキーが必要です。"
+                )
+
+            print("注意: Googleプロバイダーですが、音声認識にはOpenAI Whisperを使用します。")
+            return await whisper_transcribe(file_path, audio_hash, duration_seconds, audio)
+
+        else:
+            raise HTTPException(status_code=400, detail="サポートされていないプロバイダーです。")
+    finally:
+        if audio is not None:
+            audio.discard()
+
+
+FEEDBACK_SYSTEM_PROMPT = "あなたはプレゼンテーションとスピーチの専門家です。"
+
+FEEDBACK_CRITERIA = """以下の観点で分析してください：
+1. 話の構成（導入、本論、結論）
+2. 論理的な流れ
+3. 具体例や根拠の使用
+4. 聞き手への配慮
+5. 改善点と具体的なアドバイス
+
+フィードバックは建設的で実用的なものにしてください。"""
+
+# 固定の指示を先頭、文字起こしを末尾に置く（プロバイダー側のプロンプトキャッシュが先頭部分を再利用できる）
+FEEDBACK_TEMPLATE = PromptTemplate(
+    prefix=f"""以下の音声の文字起こし内容を分析し、話の構成、論理性、説得力について詳細なフィードバックを提供してください。
+
+{FEEDBACK_CRITERIA}
+
+文字起こし:
+""",
+    suffix="{note}{transcript}\n",
+)
+
+BATCH_FEEDBACK_TEMPLATE = PromptTemplate(
+    prefix=f"""以下の複数の音声の文字起こし内容をそれぞれ分析し、話の構成、論理性、説得力について録音ごとに詳細なフィードバックを提供してください。
+
+{FEEDBACK_CRITERIA}
+
+回答は、録音番号をキー、その録音へのフィードバックを値とするJSONオブジェクトだけにしてください。
+
+""",
+    suffix="録音番号: {keys}\n\n{sections}\n",
+)
+
+SUMMARY_TEMPLATE = PromptTemplate(
+    prefix="""以下はスピーチの文字起こしの一部です。後で話の構成・論理性・説得力を評価するために使います。
+話の流れ、主張、具体例や根拠、聞き手への語りかけが分かるように、話し手の言葉をできるだけ残して要約してください。
+要約の本文だけを出力してください。
+
+""",
+    suffix="目安: {limit}トークン以内\n\n{text}\n",
+)
+
+# 要約・抜粋した文字起こしであることを伝える
+COMPRESSED_NOTE = "（長い録音のため、以下は要約または抜粋です）\n"
+
+# フィードバック用プロンプトの入力トークン数の上限と、超えた場合の縮め方（FEEDBACK_MAX_INPUT_TOKENS など）
+PROMPT_BUDGET = prompt_budget_from_env()
+
+
+def transcript_token_budget(template: PromptTemplate, system: str | None) -> int:
+    """テンプレートの固定部分とシステムプロンプトを除いた、文字起こしに使えるトークン数"""
+    fixed = template.prefix_tokens + (count_tokens(system) if system else 0)
+    return max(1, PROMPT_BUDGET.max_tokens - fixed)
+
+
+async def build_feedback_prompt(transcript: str, client=None, system: str | None = None) -> str:
+    """フィードバック生成用のプロンプトを組み立てる
+
+    文字起こしが上限を超える場合は、client で塊ごとに並列に要約する（client が無ければ文を抜粋する）。
+    """
+    async def summarize(text: str, limit: int) -> str:
+        return await client.generate(SUMMARY_TEMPLATE.render(limit=limit, text=text))
+
+    fitted = await fit_to_budget(
+        transcript,
+        transcript_token_budget(FEEDBACK_TEMPLATE, system),
+        PROMPT_BUDGET,
+        summarize if client else None,
+    )
+    if fitted.method != "none":
+        print(f"フィードバック用に文字起こしを縮めました: {fitted.report()}")
+    note = COMPRESSED_NOTE if fitted.method != "none" else ""
+    return FEEDBACK_TEMPLATE.render(note=note, transcript=fitted.text)
+
+
+def build_batch_feedback_prompt(transcripts: dict[int, str]) -> str:
+    """複数の録音のフィードバックを1回で依頼するプロンプト（応答は録音番号をキーにしたJSON）"""
+    sections = "\n\n".join(f"### 録音 {index}\n{transcript}" for index, transcript in transcripts.items())
+    keys = ", ".join(f'"{index}"' for index in transcripts)
+    return BATCH_FEEDBACK_TEMPLATE.render(keys=keys, sections=sections)
+
+
+async def get_content_feedback(transcript: str, provider: str):
+    """音声内容のフィードバックを取得"""
+    services = get_services()
+    cache_key = feedback_key(transcript, provider, FEEDBACK_PROMPT_VERSION)
+
+    async def generate(client, system):
+        # 要約はキャッシュの計算の中で行う（キャッシュ済みなら要約もしない）
+        return await client.generate(await build_feedback_prompt(transcript, client, system), system=system)
+
+    if provider == "openai":
+        if not services.openai_client:
+            return "OpenAI APIが利用できません。APIキーを確認してください。"
+
+        try:
+            # エラー時は例外になるため、キャッシュには成功した結果だけが残る
+            return await services.result_cache.get_or_compute(
+                cache_key, lambda: generate(services.openai_client, FEEDBACK_SYSTEM_PROMPT)
+            )
+        except Exception as e:
+            return f"OpenAI フィードバック生成エラー: {str(e)}"
+
+    elif provider == "google":
+        if not services.gemini_model:
+            return "Google Gemini APIが利用できません。APIキーを確認してください。"
+
+        try:
+            return await services.result_cache.get_or_compute(
+                cache_key, lambda: generate(services.gemini_model, None)
+            )
+        except Exception as e:
+            return f"Google Gemini フィードバック生成エラー: {str(e)}"
+
+    return "フィードバック生成機能が利用できません。"
+
+
+async def stream_content_feedback(transcript: str, provider: str):
+    """フィードバックを生成しながら断片ごとに返す（キャッシュ済みなら全文を1回で返す）"""
+    services = get_services()
+    cache_key = feedback_key(transcript, provider, FEEDBACK_PROMPT_VERSION)
+    cached = services.result_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    if provider == "openai":
+        client, system = services.openai_client, FEEDBACK_SYSTEM_PROMPT
+        unavailable = "OpenAI APIが利用できません。APIキーを確認してください。"
+    elif provider == "google":
+        client, system = services.gemini_model, None
+        unavailable = "Google Gemini APIが利用できません。APIキーを確認してください。"
+    else:
+        yield "フィードバック生成機能が利用できません。"
+        return
+
+    if not client:
+        yield unavailable
+        return
+
+    prompt = await build_feedback_prompt(transcript, client, system)
+    chunks = []
+    async for text in client.stream(prompt, system=system):
+        chunks.append(text)
+        yield text
+    services.result_cache.set(cache_key, "".join(chunks))
+
+
+def build_analysis_pipeline(upload, provider: str) -> Pipeline:
+    """音声分析のステージ構成
+
+    依存関係の無いステージは並行に実行される:
+    preprocess → (duration ∥ acoustics ∥ transcription) → (speech_analysis ∥ content_feedback)
+    前処理が無効なら duration ∥ transcription から始める（acoustics は無し）。
+    """
+    pipeline = Pipeline()
+    if AUDIO_PREPROCESS_FORMAT:
+        # 1回のデコード結果を、長さ・音響特徴・文字起こし（送信ファイルと分割）で使う
+        pipeline.add("preprocess", lambda: prepare_upload(upload))
+        pipeline.add("duration", lambda preprocess: preprocess.duration, deps=["preprocess"])
+        pipeline.add(
+            "acoustics",
+            lambda preprocess: measure_prosody(preprocess.y, preprocess.sr),
+            deps=["preprocess"],
+            blocking=True,
+        )
+        pipeline.add(
+            "transcription",
+            lambda preprocess: transcribe_audio(upload.path, provider, upload.sha256, preprocess.duration, preprocess),
+            deps=["preprocess"],
+        )
+    else:
+        # 分割要否の判定用。ヘッダーから取れない場合のデコードは duration ステージで並行に行う
+        duration_hint = probe_header_duration(upload.path)
+        pipeline.add("duration", lambda: duration_hint or decode_duration(upload.path))
+        pipeline.add("transcription", lambda: transcribe_audio(upload.path, provider, upload.sha256, duration_hint or 0.0))
+
+    return (
+        pipeline
+        .add(
+            "speech_analysis",
+            lambda transcription, duration: analyze_speech_patterns(transcription["text"], duration),
+            deps=["transcription", "duration"],
+        )
+        .add(
+            "content_feedback",
+            lambda transcription: get_content_feedback(transcription["text"], provider),
+            deps=["transcription"],
+        )
+    )
+
+
+async def run_analysis(upload, provider: str) -> SpeechAnalysisResult:
+    """保存済みの音声を分析する（同期API・ジョブの両方から使う）"""
+    # 前処理・音声長の取得・文字起こし・パターン分析・フィードバックを依存関係に沿って実行
+    with deadline(REQUEST_DEADLINE_SECONDS):
+        run = await build_analysis_pipeline(upload, provider).run()
+    print(f"ステージ所要時間(ms): {run.timings}")
+
+    transcription = run["transcription"]
+    segments = transcription["segments"]
+    if len(segments) == 1 and not segments[0]["end"]:
+        # ヘッダーから長さが取れなかった場合は、デコードした長さで補う
+        segments[0]["end"] = round(run["duration"], 2)
+
+    preprocess = run.results.get("preprocess")
+    return SpeechAnalysisResult(
+        transcript=transcription["text"],
+        content_feedback=run["content_feedback"],
+        used_provider=provider,
+        segments=segments,
+        stage_timings=run.timings,
+        audio_preprocessing=preprocess.report() if preprocess else None,
+        prosody=run.results.get("acoustics"),
+        **run["speech_analysis"]
+    )
+
+
+def validate_provider(provider: str):
+    if provider not in ["openai", "google"]:
+        raise HTTPException(
+            status_code=400,
+            detail="プロバイダーは 'openai' または 'google' を指定してください。"
+        )
+
+
+def validate_analysis_request(file: UploadFile, provider: str):
+    """プロバイダーとファイル形式を検証する"""
+    validate_provider(provider)
+
+    if not validate_audio_file(file):
+        raise HTTPException(
+            status_code=400,
+            detail="サポートされていないファイル形式です。MP3, WAV, M4Aファイルをアップロードしてください。"
+        )
+
+
+def upload_too_large_error(e: UploadTooLarge) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"ファイルサイズが上限（{e.max_bytes // (1024 * 1024)}MB）を超えています。"
+    )
+
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    """デコード・文字起こしの待ち行列が満杯、または待ち時間の上限を超えた"""
+    return HTTPException(status_code=429, detail=e.detail, headers=e.headers)
+
+
+def provider_unavailable_error(e: Exception) -> HTTPException:
+    """再試行しても一時的な失敗（429/5xx・タイムアウト・ブレーカー開）が続いた場合は503で再試行を促す"""
+    return HTTPException(
+        status_code=503,
+        detail=f"音声分析サービスが一時的に利用できません。しばらくしてから再度お試しください: {str(e)}",
+        headers={"Retry-After": str(get_services().retry_after_seconds())},
+    )
+
+
+# API endpoint for speech analysis
+@router.post("/api/analyze-speech", response_model=SpeechAnalysisResult)
+async def analyze_speech(file: UploadFile = File(...), provider: str = Form("openai")):
+    """音声ファイルをアップロードして分析する（重複防止機能付き）"""
+
+    # プロバイダー・ファイル形式の検証
+    validate_analysis_request(file, provider)
+
+    print(f"使用プロバイダー: {provider}")
+
+    temp_file_path = None
+
+    try:
+        # 一時ファイルにチャンク単位で保存（元の拡張子を保持、同時にハッシュを計算）
+        upload = await save_upload(file, MAX_UPLOAD_BYTES)
+        temp_file_path = upload.path
+
+        return await run_analysis(upload, provider)
+
+    except HTTPException:
+        # HTTPExceptionは再度raiseする
+        raise
+    except UploadTooLarge as e:
+        raise upload_too_large_error(e)
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        if is_transient(e):
+            raise provider_unavailable_error(e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"音声分析中にエラーが発生しました: {str(e)}"
+        )
+
+    finally:
+        # 一時ファイルを確実に削除
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.unlink(temp_file_path)
+                print(f"一時ファイルを削除しました: {temp_file_path}")
+            except Exception as e:
+                print(f"一時ファイル削除エラー: {e}")
+
+
+# --- Batch Analysis ---
+BATCH_MAX_ITEMS = batch.max_items_from_env()
+BATCH_FAN_OUT = batch.fan_out_from_env()
+BATCH_FEEDBACK_GROUP_CHARS = batch.feedback_group_chars_from_env()
+
+
+async def get_batch_feedback(transcripts: dict[int, str], provider: str) -> dict[int, str]:
+    """複数の文字起こしのフィードバックを1回の依頼にまとめて取得する
+
+    キャッシュ済みのものはそのまま使い、まとめた応答から読み取れなかったものは個別に依頼し直す。
+    """
+    services = get_services()
+    feedback = {}
+    pending = {}
+    for index, transcript in transcripts.items():
+        cached = services.result_cache.get(feedback_key(transcript, provider, FEEDBACK_PROMPT_VERSION))
+        if cached is not None:
+            feedback[index] = cached
+        else:
+            pending[index] = transcript
+
+    client = services.openai_client if provider == "openai" else services.gemini_model
+    system = FEEDBACK_SYSTEM_PROMPT if provider == "openai" else None
+    prompt = build_batch_feedback_prompt(pending)
+    # 上限を超える場合はまとめずに個別に依頼する（個別なら長い文字起こしは要約される）
+    fits = count_tokens(prompt) + (count_tokens(system) if system else 0) <= PROMPT_BUDGET.max_tokens
+    if len(pending) > 1 and client and fits:
+        try:
+            response = await client.generate(prompt, system=system)
+            combined = batch.split_combined_feedback(response, pending)
+        except Exception as e:
+            print(f"まとめたフィードバック生成エラー（個別に再試行します）: {e}")
+            combined = {}
+        for index, text in combined.items():
+            services.result_cache.set(feedback_key(pending[index], provider, FEEDBACK_PROMPT_VERSION), text)
+            feedback[index] = text
+
+    missing = [index for index in pending if index not in feedback]
+    results = await asyncio.gather(*(get_content_feedback(pending[index], provider) for index in missing))
+    feedback.update(zip(missing, results))
+    return feedback
+
+
+# API endpoint for batch speech analysis (Server-Sent Events)
+@router.post("/api/analyze-speech/batch")
+async def analyze_speech_batch(files: list[UploadFile] = File(...), provider: str = Form("openai")):
+    """複数の音声ファイル（またはそれらをまとめたzip）を分析し、録音ごとの結果をSSEで順次返す
+
+    イベント: accepted → transcript（録音ごと）→ item（録音ごと、/api/analyze-speech と同じ形式）→ done
+    失敗した録音は item_error になり、他の録音の処理は続ける。
+    """
+    validate_provider(provider)
+
+    # [(ファイル名, SavedUpload)]。対応していない形式は None にして item_error で返す
+    items = []
+    try:
+        for file in files:
+            if batch.is_zip(file.filename, file.content_type):
+                # zip は複数の録音を含むので、ボディ全体の上限で受け取る
+                archive = await save_upload(file, BATCH_MAX_BYTES)
+                received = sum(upload.size for _, upload in items if upload)
+                try:
+                    items.extend(await asyncio.to_thread(
+                        batch.extract_zip, archive.path, MAX_UPLOAD_BYTES, BATCH_MAX_BYTES - received,
+                        BATCH_MAX_ITEMS - len(items) + 1,
+                    ))
+                finally:
+                    os.unlink(archive.path)
+            elif validate_audio_file(file):
+                items.append((file.filename, await save_upload(file, MAX_UPLOAD_BYTES)))
+            else:
+                items.append((file.filename, None))
+
+            if len(items) > BATCH_MAX_ITEMS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"一度に分析できる録音は{BATCH_MAX_ITEMS}件までです。"
+                )
+    except BaseException as e:
+        remove_batch_uploads(items)
+        if isinstance(e, UploadTooLarge):
+            raise upload_too_large_error(e)
+        if isinstance(e, zipfile.BadZipFile):
+            raise HTTPException(status_code=400, detail="zipファイルを読み込めませんでした。")
+        raise
+
+    if not items:
+        raise HTTPException(status_code=400, detail="音声ファイルが含まれていません。")
+
+    return sse_response(analyze_batch_events(items, provider))
+
+
+def remove_batch_uploads(items):
+    for _, upload in items:
+        if upload and os.path.exists(upload.path):
+            try:
+                os.unlink(upload.path)
+            except Exception as e:
+                print(f"一時ファイル削除エラー: {e}")
+
+
+async def analyze_batch_events(items, provider: str):
+    """analyze_speech_batch のイベントを生成する
+
+    文字起こしは BATCH_FAN_OUT 件ずつ並列に行い、パターン分析は全件まとめて1回、
+    フィードバックは BATCH_FEEDBACK_GROUP_CHARS 文字ごとにまとめて依頼する。
+    """
+    semaphore = asyncio.Semaphore(BATCH_FAN_OUT)
+    tasks = []
+    # 録音ごとの前処理の結果と音響特徴（前処理が無効なら空）
+    preprocessing = {}
+    prosodies = {}
+
+    async def transcribe_item(index: int, upload):
+        try:
+            async with semaphore:
+                with deadline(REQUEST_DEADLINE_SECONDS):
+                    audio = await prepare_upload(upload)
+                    duration_seconds = audio.duration if audio else await decode_duration(upload.path)
+                    if audio:
+                        preprocessing[index] = audio.report()
+                        # 音響特徴は文字起こしと並行に、デコード済みの波形から求める
+                        transcription, prosodies[index] = await asyncio.gather(
+                            transcribe_audio(upload.path, provider, upload.sha256, duration_seconds, audio),
+                            asyncio.to_thread(measure_prosody, audio.y, audio.sr),
+                        )
+                    else:
+                        transcription = await transcribe_audio(upload.path, provider, upload.sha256, duration_seconds)
+            return index, duration_seconds, transcription, None
+        except HTTPException as e:
+            return index, None, None, {"status_code": e.status_code, "detail": e.detail}
+        except Overloaded as e:
+            return index, None, None, {"status_code": 429, "detail": e.detail, "retry_after": e.retry_after}
+        except Exception as e:
+            return index, None, None, {"status_code": 500, "detail": f"音声分析中にエラーが発生しました: {str(e)}"}
+
+    def item_error(index: int, error: dict) -> str:
+        return sse_event("item_error", {"index": index, "filename": items[index][0], **error})
+
+    try:
+        yield sse_event("accepted", {
+            "provider": provider,
+            "items": [
+                {"index": index, "filename": filename, "size": upload.size if upload else None}
+                for index, (filename, upload) in enumerate(items)
+            ],
+        })
+
+        failed = 0
+        for index, (_, upload) in enumerate(items):
+            if upload is None:
+                failed += 1
+                yield item_error(index, {
+                    "status_code": 400,
+                    "detail": "サポートされていないファイル形式です。MP3, WAV, M4Aファイルをアップロードしてください。"
+                })
+            else:
+                tasks.append(asyncio.create_task(transcribe_item(index, upload)))
+
+        # 文字起こしは終わった順に返す
+        durations = {}
+        transcriptions = {}
+        for task in asyncio.as_completed(tasks):
+            index, duration_seconds, transcription, error = await task
+            if error:
+                failed += 1
+                yield item_error(index, error)
+                continue
+            durations[index] = duration_seconds
+            transcriptions[index] = transcription
+            yield sse_event("transcript", {"index": index, "filename": items[index][0], **transcription})
+
+        indices = sorted(transcriptions)
+        analyses = dict(zip(indices, analyze_speech_patterns_batch(
+            [transcriptions[index]["text"] for index in indices],
+            [durations[index] for index in indices],
+        )))
+
+        # フィードバックはまとめて依頼し、返ってきたグループから順に結果を返す
+        transcripts = {index: transcriptions[index]["text"] for index in indices}
+        groups = batch.group_for_feedback(transcripts, BATCH_FEEDBACK_GROUP_CHARS)
+        tasks = [
+            asyncio.create_task(get_batch_feedback({index: transcripts[index] for index in group}, provider))
+            for group in groups
+        ]
+        completed = 0
+        for task in asyncio.as_completed(tasks):
+            feedback = await task
+            for index in sorted(feedback):
+                result = SpeechAnalysisResult(
+                    transcript=transcripts[index],
+                    content_feedback=feedback[index],
+                    used_provider=provider,
+                    segments=transcriptions[index]["segments"],
+                    audio_preprocessing=preprocessing.get(index),
+                    prosody=prosodies.get(index),
+                    **analyses[index]
+                )
+                completed += 1
+                yield sse_event("item", {"index": index, "filename": items[index][0], "result": jsonable_encoder(result)})
+
+        yield sse_event("done", {"completed": completed, "failed": failed})
+
+    except Exception as e:
+        yield sse_event("error", {"status_code": 500, "detail": f"音声分析中にエラーが発生しました: {str(e)}"})
+
+    finally:
+        # クライアントが切断した場合も残りの処理を止め、一時ファイルを削除する
+        for task in tasks:
+            task.cancel()
+        remove_batch_uploads(items)
+
+
+# --- Background Jobs ---
+async def run_analysis_job(params: dict) -> dict:
+    """ジョブとして投稿された音声を分析する"""
+    file_path = params["file_path"]
+    upload = SavedUpload(file_path, os.path.getsize(file_path), params["sha256"])
+    # ワーカー数で件数が抑えられているので、デコード・文字起こしの枠は断られずに空くまで待つ
+    with background():
+        result = await run_analysis(upload, params["provider"])
+    return jsonable_encoder(result)
+
+
+# ジョブはSQLiteに保存され、再起動後も未完了のものから処理を再開する
+job_queue = job_queue_from_env(run_analysis_job)
+
+
+@router.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+
+@router.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
+
+# API endpoint for speech analysis (background job)
+@router.post("/api/jobs/analyze-speech", status_code=202)
+async def submit_analysis_job(
+    file: UploadFile = File(...),
+    provider: str = Form("openai"),
+    callback_url: str | None = Form(None),
+):
+    """音声分析をジョブとして受け付け、すぐにジョブIDを返す
+
+    結果は GET /api/jobs/{job_id} で取得するか、callback_url を指定すると完了時にPOSTされる。
+    """
+    validate_analysis_request(file, provider)
+    if callback_url:
+        try:
+            await job_queue.check_callback_url(callback_url)
+        except InvalidCallbackURL as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        upload = await save_upload(file, MAX_UPLOAD_BYTES)
+    except UploadTooLarge as e:
+        raise upload_too_large_error(e)
+
+    try:
+        job_id = job_queue.submit(
+            upload.path,
+            {"provider": provider, "sha256": upload.sha256, "filename": file.filename},
+            callback_url,
+        )
+    except QueueFull as e:
+        os.unlink(upload.path)
+        # 混雑時のレート制限・ゲートと同じく 429 と Retry-After で再試行を促す
+        raise HTTPException(
+            status_code=429,
+            detail=f"処理待ちのジョブが多すぎます。{e.retry_after}秒後に再度お試しください。",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/api/jobs/stats")
+async def job_stats():
+    return job_queue.stats()
+
+
+@router.get("/api/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません。")
+    return job
+
+
+# API endpoint for speech analysis (Server-Sent Events)
+@router.post("/api/analyze-speech/stream")
+async def analyze_speech_stream(file: UploadFile = File(...), provider: str = Form("openai")):
+    """音声分析の途中経過をSSEで順次返す
+
+    イベント: accepted → duration → transcript → metrics → feedback（断片ごと）→ result
+    result は /api/analyze-speech と同じ形式。失敗時は error イベントを返す。
+    """
+    validate_analysis_request(file, provider)
+
+    # レスポンス開始後はUploadFileが閉じられるため、先に一時ファイルへ保存する
+    try:
+        upload = await save_upload(file, MAX_UPLOAD_BYTES)
+    except UploadTooLarge as e:
+        raise upload_too_large_error(e)
+
+    return sse_response(with_deadline(analyze_speech_events(upload, file.filename, provider), REQUEST_DEADLINE_SECONDS))
+
+
+async def analyze_speech_events(upload, filename: str | None, provider: str):
+    """analyze_speech_stream のイベントを生成する"""
+    acoustics = None
+    try:
+        yield sse_event("accepted", {"filename": filename, "size": upload.size, "provider": provider})
+
+        audio = await prepare_upload(upload)
+        duration_seconds = audio.duration if audio else await decode_duration(upload.path)
+        yield sse_event("duration", {"duration_seconds": duration_seconds})
+
+        # 音響特徴は文字起こしと並行に、デコード済みの波形から求める
+        if audio:
+            acoustics = asyncio.create_task(asyncio.to_thread(measure_prosody, audio.y, audio.sr))
+        transcription = await transcribe_audio(upload.path, provider, upload.sha256, duration_seconds, audio)
+        transcript = transcription["text"]
+        yield sse_event("transcript", transcription)
+
+        speech_analysis = analyze_speech_patterns(transcript, duration_seconds)
+        prosody = await acoustics if acoustics else None
+        yield sse_event("metrics", {**speech_analysis, "prosody": prosody})
+
+        chunks = []
+        try:
+            async for text in stream_content_feedback(transcript, provider):
+                chunks.append(text)
+                yield sse_event("feedback", {"text": text})
+            content_feedback = "".join(chunks)
+        except Exception as e:
+            content_feedback = f"フィードバック生成エラー: {str(e)}"
+            yield sse_event("error", {"stage": "feedback", "detail": content_feedback})
+
+        result = SpeechAnalysisResult(
+            transcript=transcript,
+            content_feedback=content_feedback,
+            used_provider=provider,
+            segments=transcription["segments"],
+            audio_preprocessing=audio.report() if audio else None,
+            prosody=prosody,
+            **speech_analysis
+        )
+        yield sse_event("result", jsonable_encoder(result))
+
+    except HTTPException as e:
+        yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+    except Overloaded as e:
+        yield sse_event("error", {"status_code": 429, "detail": e.detail, "retry_after": e.retry_after})
+    except Exception as e:
+        yield sse_event("error", {"status_code": 500, "detail": f"音声分析中にエラーが発生しました: {str(e)}"})
+
+    finally:
+        if acoustics:
+            acoustics.cancel()
+        if os.path.exists(upload.path):
+            try:
+                os.unlink(upload.path)
+            except Exception as e:
+                print(f"一時ファイル削除エラー: {e}")
@@ -0,0 +1,123 @@
+"""長い録音を無音区間で分割し、並列に文字起こしする
+
+Whisper API のアップロード上限を超える長い発表や、1回の呼び出しでは時間が
+かかりすぎる録音を対象とする。音量（フレームごとのエネルギー）が最も小さい
+位置で区切るため、単語の途中で切れることを避けられる。
+"""
+import asyncio
+import os
+import tempfile
+
+DEFAULT_SEGMENT_SECONDS = 300
+DEFAULT_FAN_OUT = 4
+# Whisper API の上限は 25MB。少し余裕を持たせる
+WHISPER_MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+# 区切り位置を探す範囲（セグメント長の後ろ 30%）
+SEARCH_RATIO = 0.3
+# 無音の中央で切るためのエネルギー平滑化幅
+SMOOTH_SECONDS = 0.3
+
+
+def segment_seconds_from_env() -> float:
+    return float(os.environ.get("TRANSCRIBE_SEGMENT_SECONDS", DEFAULT_SEGMENT_SECONDS))
+
+
+def fan_out_from_env() -> int:
+    return max(1, int(os.environ.get("TRANSCRIBE_FAN_OUT", DEFAULT_FAN_OUT)))
+
+
+def needs_segmentation(duration_seconds: float, file_size: int, max_segment_seconds: float) -> bool:
+    """分割して文字起こしすべきかどうか"""
+    return duration_seconds > max_segment_seconds or file_size > WHISPER_MAX_UPLOAD_BYTES
+
+
+def join_texts(texts, language: str) -> str:
+    """セグメントの文字起こしを結合する（日本語・中国語は空白を入れない）"""
+    separator = "" if language in ("ja", "zh") else " "
+    return separator.join(t.strip() for t in texts if t and t.strip())
+
+
+def load_audio(file_path: str):
+    """16kHz モノラルでデコードする"""
+    import librosa
+
+    y, sr = librosa.load(file_path, sr=SAMPLE_RATE, mono=True)
+    return y, sr
+
+
+def plan_segments(y, sr: int, max_segment_seconds: float):
+    """分割位置を決め、(開始秒, 終了秒) のリストを返す"""
+    import numpy as np
+
+    frame = max(1, int(sr * FRAME_SECONDS))
+    n_frames = len(y) // frame
+    total_seconds = len(y) / sr
+    max_frames = int(max_segment_seconds / FRAME_SECONDS)
+    if n_frames <= max_frames:
+        return [(0.0, total_seconds)]
+
+    energy = np.square(y[:n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+    width = max(1, int(SMOOTH_SECONDS / FRAME_SECONDS))
+    smoothed = np.convolve(energy, np.ones(width) / width, mode="same")
+
+    min_frames = max(1, int(max_frames * (1 - SEARCH_RATIO)))
+    cuts = []
+    start = 0
+    while n_frames - start > max_frames:
+        window = smoothed[start + min_frames:start + max_frames]
+        cut = start + min_frames + int(np.argmin(window))
+        cuts.append(cut)
+        start = cut
+
+    bounds = [0.0] + [c * frame / sr for c in cuts] + [total_seconds]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _write_segment(y, sr: int, start: float, end: float, directory: str, index: int) -> str:
+    import soundfile as sf
+
+    path = os.path.join(directory, f"segment_{index:04d}.flac")
+    sf.write(path, y[int(start * sr):int(end * sr)], sr, format="FLAC")
+    return path
+
+
+async def transcribe_buffer(y, sr: int, transcribe, *, max_segment_seconds: float,
+                            fan_out: int = DEFAULT_FAN_OUT, language: str = "ja") -> dict:
+    """デコード済み波形を分割し、transcribe(path) を最大 fan_out 並列で呼ぶ
+
+    戻り値は {"text": 結合したテキスト, "segments": [{"start", "end", "text"}, ...]}
+    """
+    bounds = await asyncio.to_thread(plan_segments, y, sr, max_segment_seconds)
+    semaphore = asyncio.Semaphore(fan_out)
+
+    with tempfile.TemporaryDirectory(prefix="segments_") as directory:
+        async def run(index, start, end):
+            async with semaphore:
+                path = await asyncio.to_thread(_write_segment, y, sr, start, end, directory, index)
+                try:
+                    return await transcribe(path)
+                finally:
+                    os.unlink(path)
+
+        texts = await asyncio.gather(*(
+            run(i, start, end) for i, (start, end) in enumerate(bounds)
+        ))
+
+    segments = [
+        {"start": round(start, 2), "end": round(end, 2), "text": text.strip()}
+        for (start, end), text in zip(bounds, texts)
+    ]
+    return {"text": join_texts(texts, language), "segments": segments}
+
+
+async def transcribe_in_segments(file_path: str, transcribe, *, max_segment_seconds: float,
+                                 fan_out: int = DEFAULT_FAN_OUT, language: str = "ja") -> dict:
+    """ファイルをデコードしてから transcribe_buffer で文字起こしする"""
+    y, sr = await asyncio.to_thread(load_audio, file_path)
+    return await transcribe_buffer(
+        y, sr, transcribe,
+        max_segment_seconds=max_segment_seconds, fan_out=fan_out, language=language,
+    )
@@ -0,0 +1,113 @@
+"""1つのプロセスのすべてのルーターで共有するプロバイダー・キャッシュ・設定
+
+音声分析・チャット・/ai のどのルーターを載せても、プロバイダー（接続プール・同時実行数の
+制限・サーキットブレーカー）とキャッシュ、チャットのセッション、デコード・文字起こしの
+同時実行数のゲートはプロセスに1つだけ作り、使い回す。
+"""
+import os
+from functools import lru_cache
+
+from .admission import ConcurrencyGate, gates_from_env
+from .cache import ResultCache, cache_from_env
+from .providers import GeminiProvider, OpenAIProvider, close_all, max_concurrency_from_env, warm_up_all
+from .resilience import ResilienceSettings, resilience_from_env, with_resilience
+from .sessions import ChatSessions
+from .transport import HTTPSettings, http_settings_from_env
+
+# .env.example のままの値はキーが無いものとして扱う
+PLACEHOLDER_KEYS = {"sk-xxxxxxxxxxxxxxxxxxxxxxxxxx", "your_openai_api_key_here", "your_google_api_key_here"}
+
+
+def api_key_from_env(name: str) -> str | None:
+    value = os.environ.get(name)
+    return value if value and value not in PLACEHOLDER_KEYS else None
+
+
+class Services:
+    def __init__(
+        self,
+        openai_client,
+        gemini_model,
+        result_cache: ResultCache,
+        http_settings: HTTPSettings,
+        resilience: ResilienceSettings,
+        chat_sessions: ChatSessions,
+        gates: dict[str, ConcurrencyGate],
+    ):
+        self.openai_client = openai_client
+        self.gemini_model = gemini_model
+        self.result_cache = result_cache
+        self.http_settings = http_settings
+        self.resilience = resilience
+        self.chat_sessions = chat_sessions
+        # decode / transcription（DECODE_* / TRANSCRIBE_*）
+        self.gates = gates
+
+    @classmethod
+    def from_env(cls) -> "Services":
+        # 接続プール・キープアライブ・タイムアウト（PROVIDER_HTTP_*）
+        http_settings = http_settings_from_env()
+        # 再試行・期限・サーキットブレーカー・フェイルオーバー（PROVIDER_RETRY_* / PROVIDER_BREAKER_* など）
+        resilience = resilience_from_env()
+
+        openai_client = None
+        try:
+            api_key = api_key_from_env("OPENAI_API_KEY")
+            if api_key:
+                openai_client = OpenAIProvider(
+                    api_key=api_key,
+                    max_concurrency=max_concurrency_from_env("OPENAI_MAX_CONCURRENCY"),
+                    http_settings=http_settings,
+                    base_url=os.environ.get("OPENAI_BASE_URL"),
+                    max_retries=0,
+                )
+                print("OpenAI client initialized successfully.")
+            else:
+                print("Warning: Valid OPENAI_API_KEY not found.")
+        except Exception as e:
+            print(f"Error initializing OpenAI client: {e}")
+
+        gemini_model = None
+        try:
+            api_key = api_key_from_env("GOOGLE_API_KEY")
+            if api_key:
+                gemini_model = GeminiProvider(
+                    api_key=api_key,
+                    max_concurrency=max_concurrency_from_env("GEMINI_MAX_CONCURRENCY"),
+                    http_settings=http_settings,
+                    base_url=os.environ.get("GEMINI_BASE_URL"),
+                )
+                print("Google Gemini client initialized successfully.")
+            else:
+                print("Warning: Valid GOOGLE_API_KEY not found.")
+        except Exception as e:
+            print(f"Error initializing Google Gemini client: {e}")
+
+        # 一時的な失敗は再試行し、PROVIDER_FAILOVER=1 なら不調なプロバイダーから他方へ切り替える
+        openai_client, gemini_model = with_resilience([openai_client, gemini_model], resilience)
+        # チャットの会話は結果のキャッシュとは別に保存する（CHAT_SESSION_* / CHAT_HISTORY_MAX_TOKENS）
+        chat_sessions = ChatSessions.from_env()
+        return cls(
+            openai_client, gemini_model, cache_from_env(), http_settings, resilience, chat_sessions, gates_from_env()
+        )
+
+    @property
+    def providers(self) -> list:
+        return [provider for provider in (self.openai_client, self.gemini_model) if provider is not None]
+
+    def retry_after_seconds(self) -> int:
+        """プロバイダーが使えない時に Retry-After で返す秒数（サーキットブレーカーが閉じるまで）"""
+        return max(1, int(self.resilience.breaker_reset))
+
+    async def warm_up(self):
+        await warm_up_all(self.providers)
+
+    async def aclose(self):
+        await self.chat_sessions.aclose()
+        await close_all(self.providers)
+
+
+@lru_cache(maxsize=None)
+def get_services() -> Services:
+    """プロセスで共有する Services（最初の呼び出しで環境変数から作る）"""
+    return Services.from_env()
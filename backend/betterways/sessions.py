@@ -0,0 +1,211 @@
+"""サーバー側に保存する複数ターンのチャット（セッション）
+
+クライアントは毎回そのターンの発言とセッション ID だけを送り、それまでの会話はサーバーが持つ。
+会話は専用のキャッシュ（メモリの LRU と、CHAT_SESSION_SQLITE_PATH があれば SQLite）に JSON で保存する。
+会話が CHAT_HISTORY_MAX_TOKENS を超えたら、古いターンを要約（ローリングサマリー）にまとめ直し、
+LLM に送る会話の長さを一定に抑える。要約は応答を返した後にバックグラウンドで行う。
+同じセッションのターンは1つずつ順に処理する（要約中に次のターンが来たら、要約が終わるまで待つ）。
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+import weakref
+
+from .cache import ResultCache, cache_from_env
+from .metrics import CHAT_CONTEXT_TOKENS, CHAT_SESSION_COMPACTIONS, CHAT_SESSION_TURNS
+from .prompts import PromptTemplate, count_tokens, select_sentences
+
+# LLM に送る会話（要約＋ターン）のトークン数の上限。超えたら古いターンを要約にまとめる
+DEFAULT_MAX_TOKENS = 3000
+# 最後のターンからこの秒数で消える
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+# 要約は、ユーザーが渡した前提と、それへのアシスタントの返事の1往復として会話の先頭に置く
+# （Gemini は user と model が交互になっている必要がある）
+SUMMARY_HEADER = "（ここまでの会話の要約）\n"
+SUMMARY_ACK = "はい、ここまでの内容を踏まえてお答えします。"
+
+SUMMARY_TEMPLATE = PromptTemplate(
+    prefix="""以下はユーザーとアシスタントの会話です。この後も会話を続けられるように、
+ユーザーの目的・前提・決まったこと・未解決の質問を落とさずに、会話の要約を書いてください。
+要約の本文だけを出力してください。
+
+""",
+    suffix="目安: {limit}トークン以内\n\n{summary}{turns}\n",
+)
+
+
+class SessionNotFound(KeyError):
+    """セッションが無い（作られていない・期限切れ・LRU から追い出された）"""
+
+
+def history_max_tokens_from_env() -> int:
+    try:
+        return max(100, int(os.environ.get("CHAT_HISTORY_MAX_TOKENS", DEFAULT_MAX_TOKENS)))
+    except ValueError:
+        return DEFAULT_MAX_TOKENS
+
+
+def session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+class Conversation:
+    """1つのセッションの会話（要約と、まだ要約していないターン）"""
+
+    def __init__(self, id: str, summary: str = "", turns=None, created_at: float | None = None):
+        self.id = id
+        self.summary = summary
+        # [{"role": "user" / "assistant", "content": ...}]（古い順）
+        self.turns = list(turns or [])
+        self.created_at = created_at or time.time()
+
+    def history(self) -> list[dict]:
+        """LLM に送るそれまでの会話"""
+        if not self.summary:
+            return list(self.turns)
+        return [
+            {"role": "user", "content": SUMMARY_HEADER + self.summary},
+            {"role": "assistant", "content": SUMMARY_ACK},
+            *self.turns,
+        ]
+
+    def tokens(self) -> int:
+        return sum(count_tokens(message["content"]) for message in self.history())
+
+    def to_dict(self) -> dict:
+        return {"session_id": self.id, "summary": self.summary, "turns": self.turns, "created_at": self.created_at}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Conversation":
+        return cls(data["session_id"], data.get("summary", ""), data.get("turns"), data.get("created_at"))
+
+
+def recent_turns(turns: list[dict], max_tokens: int) -> list[dict]:
+    """max_tokens に収まる直近のターン（往復単位。最後の1往復は必ず残す）"""
+    kept = []
+    used = 0
+    for start in range(len(turns) - 2, -1, -2):
+        pair = turns[start:start + 2]
+        cost = sum(count_tokens(message["content"]) for message in pair)
+        if kept and used + cost > max_tokens:
+            break
+        kept[:0] = pair
+        used += cost
+    return kept
+
+
+def render_turns(turns: list[dict]) -> str:
+    speakers = {"user": "ユーザー", "assistant": "アシスタント"}
+    return "\n".join(f"{speakers[message['role']]}: {message['content']}" for message in turns)
+
+
+class ChatSessions:
+    def __init__(self, store: ResultCache, max_tokens: int = DEFAULT_MAX_TOKENS):
+        self.store = store
+        self.max_tokens = max_tokens
+        # 使われていないロックは自動で消える
+        self._locks = weakref.WeakValueDictionary()
+        self._compactions = set()
+
+    @classmethod
+    def from_env(cls) -> "ChatSessions":
+        """CHAT_HISTORY_MAX_TOKENS と、保存先の CHAT_SESSION_MAX_ENTRIES / CHAT_SESSION_MAX_BYTES /
+        CHAT_SESSION_TTL_SECONDS / CHAT_SESSION_SQLITE_PATH"""
+        return cls(cache_from_env("CHAT_SESSION_", DEFAULT_TTL_SECONDS), history_max_tokens_from_env())
+
+    def _lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def create(self) -> Conversation:
+        conversation = Conversation(uuid.uuid4().hex)
+        self._save(conversation)
+        return conversation
+
+    def get(self, session_id: str) -> Conversation | None:
+        data = self.store.get(session_key(session_id))
+        return Conversation.from_dict(json.loads(data)) if data is not None else None
+
+    def require(self, session_id: str) -> Conversation:
+        conversation = self.get(session_id)
+        if conversation is None:
+            raise SessionNotFound(session_id)
+        return conversation
+
+    def delete(self, session_id: str):
+        self.store.delete(session_key(session_id))
+
+    def _save(self, conversation: Conversation):
+        self.store.set(session_key(conversation.id), json.dumps(conversation.to_dict(), ensure_ascii=False))
+
+    async def send(self, session_id: str, content: str, client, system: str | None = None) -> str:
+        """セッションの会話の続きとして content を送り、応答を会話に加えて返す"""
+        async with self._lock(session_id):
+            conversation = self.require(session_id)
+            history = conversation.history()
+            CHAT_CONTEXT_TOKENS.observe(conversation.tokens())
+            reply = await client.generate(content, system=system, history=history)
+            self._add_turn(conversation, content, reply, client)
+        return reply
+
+    async def stream(self, session_id: str, content: str, client, system: str | None = None):
+        """send と同じだが、応答を断片ごとに返す（最後まで受け取った場合だけ会話に加える）"""
+        async with self._lock(session_id):
+            conversation = self.require(session_id)
+            history = conversation.history()
+            CHAT_CONTEXT_TOKENS.observe(conversation.tokens())
+            chunks = []
+            async for text in client.stream(content, system=system, history=history):
+                chunks.append(text)
+                yield text
+            self._add_turn(conversation, content, "".join(chunks), client)
+
+    def _add_turn(self, conversation: Conversation, content: str, reply: str, client):
+        conversation.turns += [{"role": "user", "content": content}, {"role": "assistant", "content": reply}]
+        self._save(conversation)
+        CHAT_SESSION_TURNS.labels(client.name).inc()
+        if conversation.tokens() > self.max_tokens:
+            task = asyncio.ensure_future(self._compact(conversation.id, client))
+            self._compactions.add(task)
+            task.add_done_callback(self._compactions.discard)
+
+    async def _compact(self, session_id: str, client):
+        """古いターンを要約にまとめ直す（直近のターンは上限の半分まで残す）"""
+        async with self._lock(session_id):
+            conversation = self.get(session_id)
+            if conversation is None or conversation.tokens() <= self.max_tokens:
+                return
+            keep = recent_turns(conversation.turns, self.max_tokens // 2)
+            old = conversation.turns[:len(conversation.turns) - len(keep)]
+            if not old:
+                # 直近の1往復だけで上限を超えている。次のターンでまとめる
+                return
+            limit = self.max_tokens // 4
+            try:
+                summary = await client.generate(SUMMARY_TEMPLATE.render(
+                    limit=limit,
+                    summary=f"{SUMMARY_HEADER}{conversation.summary}\n\n" if conversation.summary else "",
+                    turns=render_turns(old),
+                ))
+                method = "summarize"
+            except Exception as e:
+                # 要約できなくても会話の長さは抑える（古いターンは捨て、前の要約は残す）
+                print(f"チャットの要約に失敗しました（古いターンを捨てます）: {e}")
+                summary, method = conversation.summary, "truncate"
+            summary = summary.strip()
+            if count_tokens(summary) > limit * 2:
+                summary = select_sentences(summary, limit * 2)
+            conversation.summary = summary
+            conversation.turns = keep
+            self._save(conversation)
+            CHAT_SESSION_COMPACTIONS.labels(method).inc()
+
+    async def aclose(self):
+        for task in list(self._compactions):
+            task.cancel()
+        await asyncio.gather(*self._compactions, return_exceptions=True)
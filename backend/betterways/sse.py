@@ -0,0 +1,21 @@
+"""Server-Sent Events (text/event-stream) のレスポンス生成"""
+import json
+
+from fastapi.responses import StreamingResponse
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # nginx 等のプロキシでバッファリングさせない
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data) -> str:
+    """1件のイベントを SSE 形式に整形する（data は JSON にする）"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    """sse_event() の文字列を返す非同期イテレーターからレスポンスを作る"""
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
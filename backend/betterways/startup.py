@@ -0,0 +1,104 @@
+"""起動を速くするためのウォームアップと、準備状態（readiness）の管理
+
+重い依存（numpy / librosa / openai / google.generativeai など）はモジュールの import 時に
+読み込まず、アプリが応答できるようになった後にバックグラウンドで順に読み込む。
+読み込みが終わるまでは /health/ready が 503 を返し、/health/live は常に 200 を返す。
+各ステップの所要時間と、起動からの経過時間はメトリクスに記録する。
+
+    warm_up = Warmup()
+    warm_up.add_import("numpy")
+    warm_up.add("audio", warm_up_audio)
+    app.on_event("startup")(warm_up.start)
+"""
+import asyncio
+import importlib
+import inspect
+import os
+import time
+
+from .metrics import READY, STARTUP_SECONDS, WARMUP_SECONDS
+
+# このモジュールが最初に import された時刻を、プロセスの起動時刻とみなす
+STARTED = time.perf_counter()
+
+
+def warmup_enabled_from_env() -> bool:
+    """STARTUP_WARMUP=0 なら重い依存は最初に使われた時に読み込む（準備状態は最初から ready）"""
+    return os.environ.get("STARTUP_WARMUP", "1").lower() not in ("0", "false", "no")
+
+
+def since_start() -> float:
+    return time.perf_counter() - STARTED
+
+
+class Warmup:
+    """起動後にバックグラウンドで順に実行するステップと、その進み具合"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.steps = {}
+        self.state = {}
+        self.ready_at = None
+        self._task = None
+
+    def add(self, name: str, func):
+        """ステップを追加する。同期関数はスレッドで、async 関数はそのまま実行する"""
+        self.steps[name] = func
+        self.state[name] = {"state": "pending", "seconds": None}
+        return self
+
+    def add_import(self, module: str):
+        """モジュールの import をステップとして追加する（所要時間は import:<module> として記録される）"""
+        return self.add(f"import:{module}", lambda: importlib.import_module(module))
+
+    @property
+    def ready(self) -> bool:
+        return not self.enabled or self.ready_at is not None
+
+    def mark_app_ready(self):
+        """import とアプリの組み立てが終わった時点（リクエストを受け付けられる時点）を記録する"""
+        STARTUP_SECONDS.labels("app").set(since_start())
+
+    async def start(self):
+        self.mark_app_ready()
+        if not self.enabled:
+            READY.set(1)
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        # 同時に読み込むとリクエストの処理と CPU を奪い合うため、1つずつ実行する
+        for name, func in self.steps.items():
+            self.state[name]["state"] = "running"
+            start = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(func):
+                    await func()
+                else:
+                    await asyncio.to_thread(func)
+            except Exception as e:
+                # 失敗しても起動は止めない（そのステップは最初に使われた時にもう一度試される）
+                self.state[name]["state"] = f"failed: {e}"
+                print(f"warm-up step {name} failed: {e}")
+            else:
+                self.state[name]["state"] = "ready"
+            elapsed = time.perf_counter() - start
+            self.state[name]["seconds"] = round(elapsed, 3)
+            WARMUP_SECONDS.labels(name).set(elapsed)
+
+        self.ready_at = since_start()
+        STARTUP_SECONDS.labels("ready").set(self.ready_at)
+        READY.set(1)
+        print(f"warm-up finished {self.ready_at:.2f}s after start: {self.state}")
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(since_start(), 1),
+            "ready_after_seconds": round(self.ready_at, 3) if self.ready_at is not None else None,
+            "steps": self.state,
+        }
@@ -0,0 +1,144 @@
+"""日本語に対応した単語数・文字数・モーラ数の計測
+
+日本語の文字起こしには空白が無いため、`\\b\\w+\\b` では文全体が1単語になる。
+形態素解析器（fugashi + unidic-lite または janome）がインストールされていれば
+それを使い、無ければ文字種の切り替わりで区切る純 Python の近似にフォールバックする。
+解析器は初回に1度だけ読み込み、以降のリクエストで再利用する。
+"""
+import os
+import re
+from functools import lru_cache
+
+KANJI = r"一-鿿㐀-䶿々〆ヵヶ"
+HIRAGANA = r"ぁ-ゟ"
+KATAKANA = r"ァ-ヺヽ-ヿｦ-ﾟ"
+
+# 日本語以外の文字（アクセント付きのラテン文字・キリル文字・ハングルなど）
+_OTHER_LETTERS = rf"[^\W\d_{KANJI}{HIRAGANA}{KATAKANA}ー]"
+
+# 文字種が切り替わる位置で区切る（長音「ー」は直前の仮名に含める）。最後の \w+ はどれにも当たらない文字用
+_RUN_PATTERN = re.compile(
+    rf"[{KANJI}]+|[{HIRAGANA}ー]+|[{KATAKANA}ー]+|{_OTHER_LETTERS}+(?:'{_OTHER_LETTERS}+)?"
+    r"|[0-9０-９]+(?:[.,][0-9]+)?|\w+"
+)
+_CHARACTER_PATTERN = re.compile(r"[^\W_]")
+_KANA_PATTERN = re.compile(rf"[{HIRAGANA}{KATAKANA}ー]")
+# 拗音・小書きの仮名は直前の仮名と合わせて1モーラ（っ・ッ は1モーラとして数える）
+_SMALL_KANA_PATTERN = re.compile(r"[ぁぃぅぇぉゃゅょゎゕゖァィゥェォャュョヮ]")
+_KANJI_PATTERN = re.compile(rf"[{KANJI}]")
+_LATIN_VOWEL_GROUP = re.compile(r"[aeiouy]+", re.IGNORECASE)
+_DIGIT_PATTERN = re.compile(r"[0-9０-９]")
+
+# 読みが分からない漢字1字あたりのモーラ数の目安（音読みの多くは1〜2モーラ）
+KANJI_MORA_ESTIMATE = 1.7
+DIGIT_MORA_ESTIMATE = 2
+
+
+def count_characters(text: str) -> int:
+    """空白・句読点を除いた文字数"""
+    return len(_CHARACTER_PATTERN.findall(text))
+
+
+def count_kana_morae(kana: str) -> int:
+    return len(_KANA_PATTERN.findall(kana)) - len(_SMALL_KANA_PATTERN.findall(kana))
+
+
+def estimate_morae(text: str) -> float:
+    """読みが無いテキストのモーラ数を文字種から見積もる"""
+    return (
+        count_kana_morae(text)
+        + len(_KANJI_PATTERN.findall(text)) * KANJI_MORA_ESTIMATE
+        + len(_LATIN_VOWEL_GROUP.findall(text))
+        + len(_DIGIT_PATTERN.findall(text)) * DIGIT_MORA_ESTIMATE
+    )
+
+
+class RegexTokenizer:
+    """依存パッケージ無しで使える近似（文字種の連続を1語とみなす）"""
+
+    name = "regex"
+
+    def analyze(self, text: str) -> dict:
+        return {
+            "words": len(_RUN_PATTERN.findall(text)),
+            "characters": count_characters(text),
+            "morae": round(estimate_morae(text)),
+        }
+
+
+class _MorphologicalTokenizer:
+    """形態素解析器の共通処理。_tokens() は (表層形, 読み or None, 記号か) を返す"""
+
+    name = ""
+
+    def analyze(self, text: str) -> dict:
+        words = 0
+        morae = 0.0
+        for surface, reading, is_symbol in self._tokens(text):
+            if is_symbol or not surface.strip():
+                continue
+            words += 1
+            morae += count_kana_morae(reading) if reading else estimate_morae(surface)
+        return {
+            "words": words,
+            "characters": count_characters(text),
+            "morae": round(morae),
+        }
+
+
+class FugashiTokenizer(_MorphologicalTokenizer):
+    name = "fugashi"
+
+    def __init__(self):
+        import fugashi
+
+        # unidic-lite / unidic 辞書が必要
+        self.tagger = fugashi.Tagger()
+
+    def _tokens(self, text: str):
+        for word in self.tagger(text):
+            feature = word.feature
+            reading = getattr(feature, "kana", None) or getattr(feature, "pron", None)
+            pos = getattr(feature, "pos1", "") or ""
+            yield word.surface, reading if reading and reading != "*" else None, "記号" in pos
+
+
+class JanomeTokenizer(_MorphologicalTokenizer):
+    name = "janome"
+
+    def __init__(self):
+        from janome.tokenizer import Tokenizer
+
+        self.tokenizer = Tokenizer()
+
+    def _tokens(self, text: str):
+        for token in self.tokenizer.tokenize(text):
+            reading = token.reading if token.reading != "*" else None
+            yield token.surface, reading, token.part_of_speech.startswith("記号")
+
+
+_TOKENIZERS = {
+    "fugashi": FugashiTokenizer,
+    "janome": JanomeTokenizer,
+    "regex": RegexTokenizer,
+}
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(name: str | None = None):
+    """トークナイザーを返す（プロセス内で1度だけ生成する）
+
+    name 省略時は環境変数 JA_TOKENIZER（auto / fugashi / janome / regex）に従う。
+    auto ではインストール済みの解析器を fugashi → janome の順に試す。
+    """
+    name = name or os.environ.get("JA_TOKENIZER", "auto")
+    if name != "auto":
+        return _TOKENIZERS[name]()
+
+    for candidate in (FugashiTokenizer, JanomeTokenizer):
+        try:
+            return candidate()
+        except Exception:
+            # 未インストール、または辞書が見つからない
+            continue
+    return RegexTokenizer()
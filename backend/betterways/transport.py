@@ -0,0 +1,89 @@
+"""プロバイダー呼び出し用の HTTP 接続設定
+
+OpenAI のクライアントに、接続プール・キープアライブ・タイムアウトを設定した
+httpx.AsyncClient を渡し、プロセス内で同じ接続を使い回す。
+h2 パッケージがインストールされていれば HTTP/2 を使い、1本の接続で多重化する。
+Gemini（google-generativeai）は gRPC（HTTP/2）のチャネルを内部で保持するため、
+ここではタイムアウトだけを共有する。
+"""
+import importlib.util
+import os
+from typing import NamedTuple
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+# 長い録音の文字起こしは数分かかることがある
+DEFAULT_READ_TIMEOUT = 300.0
+DEFAULT_POOL_TIMEOUT = 30.0
+
+
+class HTTPSettings(NamedTuple):
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+    read_timeout: float = DEFAULT_READ_TIMEOUT
+    pool_timeout: float = DEFAULT_POOL_TIMEOUT
+    http2: bool = False
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _env(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def http_settings_from_env() -> HTTPSettings:
+    """PROVIDER_HTTP_* 環境変数から接続設定を読む
+
+    PROVIDER_HTTP2 は auto（h2 があれば使う）/ 1 / 0。
+    """
+    http2 = os.environ.get("PROVIDER_HTTP2", "auto").lower()
+    return HTTPSettings(
+        max_connections=max(1, _env("PROVIDER_HTTP_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS, int)),
+        max_keepalive_connections=max(0, _env("PROVIDER_HTTP_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE, int)),
+        keepalive_expiry=_env("PROVIDER_HTTP_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY, float),
+        connect_timeout=_env("PROVIDER_HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT, float),
+        read_timeout=_env("PROVIDER_HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT, float),
+        pool_timeout=_env("PROVIDER_HTTP_POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT, float),
+        http2=http2_available() if http2 == "auto" else http2 in ("1", "true", "yes"),
+    )
+
+
+def warm_up_from_env() -> bool:
+    """PROVIDER_WARMUP=1 なら起動時にプロバイダーへの接続を確立しておく"""
+    return os.environ.get("PROVIDER_WARMUP", "0").lower() in ("1", "true", "yes")
+
+
+def timeout(settings: HTTPSettings):
+    import httpx
+
+    return httpx.Timeout(
+        connect=settings.connect_timeout,
+        read=settings.read_timeout,
+        write=settings.read_timeout,
+        pool=settings.pool_timeout,
+    )
+
+
+def build_async_client(settings: HTTPSettings, **kwargs):
+    """接続プールを設定した httpx.AsyncClient を作る（プロセス内で使い回す）"""
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry,
+        ),
+        timeout=timeout(settings),
+        http2=settings.http2,
+        **kwargs,
+    )
@@ -0,0 +1,174 @@
+"""アップロードされた音声を一時ファイルへストリーミング保存する
+
+UploadFile 全体を bytes として読み込まず、固定サイズのチャンクで一時ファイルへ
+書き込む。サイズ上限は Content-Length ヘッダーで早期に判定し、ヘッダーが無い
+（または偽っている）場合も受信中のバイト数で判定する。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import NamedTuple
+
+from fastapi import UploadFile
+
+from .metrics import STAGE_SECONDS, UPLOAD_BYTES
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+
+ALLOWED_EXTENSIONS = ["mp3", "wav", "m4a"]
+
+CONTENT_TYPE_EXTENSIONS = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/m4a": "m4a",
+    "audio/x-m4a": "m4a",
+}
+
+
+class UploadTooLarge(Exception):
+    """アップロードサイズが上限を超えた"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class SavedUpload(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+
+
+def max_upload_bytes_from_env() -> int:
+    """MAX_UPLOAD_BYTES 環境変数からアップロード上限を読む"""
+    try:
+        return int(os.environ.get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+    except ValueError:
+        return DEFAULT_MAX_UPLOAD_BYTES
+
+
+def upload_suffix(file: UploadFile) -> str:
+    """一時ファイルに付ける拡張子（元のファイル形式を保つ）"""
+    if file.filename and "." in file.filename:
+        extension = file.filename.rsplit(".", 1)[-1].lower()
+        if extension in ALLOWED_EXTENSIONS:
+            return f".{extension}"
+    extension = CONTENT_TYPE_EXTENSIONS.get(file.content_type or "")
+    return f".{extension}" if extension else ".mp3"
+
+
+async def save_upload(
+    file: UploadFile,
+    max_bytes: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> SavedUpload:
+    """アップロードをチャンク単位で一時ファイルへ書き出す
+
+    書き込みと同時に SHA-256 を計算する（キャッシュキー用）。
+    上限を超えた場合は書きかけのファイルを削除して UploadTooLarge を送出する。
+    """
+    start = time.perf_counter()
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=upload_suffix(file))
+    digest = hashlib.sha256()
+    total = 0
+    try:
+        with temp_file:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                temp_file.write(chunk)
+    except BaseException:
+        os.unlink(temp_file.name)
+        raise
+    STAGE_SECONDS.labels("upload").observe(time.perf_counter() - start)
+    UPLOAD_BYTES.observe(total)
+    return SavedUpload(temp_file.name, total, digest.hexdigest())
+
+
+class UploadSizeLimitMiddleware:
+    """指定パスへのリクエストボディを上限バイト数で打ち切る ASGI ミドルウェア
+
+    Content-Length が上限を超えていればボディを読まずに 413 を返す。
+    ヘッダーが無い場合も受信したバイト数を数え、超えた時点で以降のボディを捨てて
+    アプリの応答を 413 に差し替える。exclude_prefixes のパスは対象外（別の上限を掛けるものなど）。
+    """
+
+    def __init__(self, app, max_bytes: int, path_prefixes=("/",), detail: str = "Upload too large.", exclude_prefixes=()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefixes = tuple(path_prefixes)
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.detail = detail
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith(self.path_prefixes) or (
+            self.exclude_prefixes and path.startswith(self.exclude_prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    break
+                if declared > self.max_bytes:
+                    await self._send_too_large(send)
+                    return
+                break
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    # 残りのボディは渡さず、クライアント切断として扱わせる
+                    return {"type": "http.disconnect"}
+            return message
+
+        response_started = False
+
+        async def limited_send(message):
+            nonlocal response_started
+            if exceeded:
+                if not response_started:
+                    response_started = True
+                    await self._send_too_large(send)
+                return
+            response_started = response_started or message["type"] == "http.response.start"
+            await send(message)
+
+        await self.app(scope, limited_receive, limited_send)
+        if exceeded and not response_started:
+            await self._send_too_large(send)
+
+    async def _send_too_large(self, send):
+        body = json.dumps({"detail": self.detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
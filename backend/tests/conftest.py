@@ -0,0 +1,16 @@
+import pytest
+
+
+class FakeClock:
+    """時刻を手で進める clock（time.monotonic の代わり）"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
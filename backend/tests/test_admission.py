@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from betterways.admission import (
+    AdmissionMiddleware,
+    ConcurrencyGate,
+    GateSettings,
+    Overloaded,
+    Rate,
+    RateRule,
+    TokenBucket,
+    background,
+    parse_rate,
+)
+
+
+def test_bucket_refills(clock):
+    bucket = TokenBucket(rate=0.5, burst=2, clock=clock)
+    assert bucket.take() == 0 and bucket.take() == 0
+    # 空になったら、次のトークンまでの秒数を返す
+    assert bucket.take() == pytest.approx(2.0)
+    clock.now = 1.0
+    assert bucket.take() == pytest.approx(1.0)
+    clock.now = 2.0
+    assert bucket.take() == 0
+    # 長く空いても burst までしかためない
+    clock.now = 100.0
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert bucket.take() > 0
+
+
+def test_parse_rate():
+    assert parse_rate("20/60") == Rate(20, 60.0)
+    assert parse_rate("off") is None and parse_rate("0") is None
+    with pytest.raises(ValueError):
+        parse_rate("twenty")
+
+
+def test_rule_limits_each_client_and_route(clock):
+    rule = RateRule("speech", ["/api/analyze-speech"], per_client=Rate(1, 10), total=Rate(2, 10), clock=clock)
+    rule.check("a")
+    with pytest.raises(Overloaded) as excinfo:
+        rule.check("a")
+    assert excinfo.value.reason == "client_rate"
+    assert excinfo.value.headers == {"Retry-After": "10"}
+
+    rule.check("b")
+    with pytest.raises(Overloaded) as excinfo:
+        rule.check("c")
+    assert excinfo.value.reason == "route_rate"
+
+    clock.now = 10
+    rule.check("a")
+
+
+def test_retry_after_is_rounded_up_and_clamped():
+    assert Overloaded("speech", "client_rate", 0.2).retry_after == 1
+    assert Overloaded("speech", "client_rate", 2.1).retry_after == 3
+    assert Overloaded("speech", "client_rate", 10000).retry_after == 300
+
+
+def test_gate_rejects_when_queue_is_full():
+    async def run():
+        gate = ConcurrencyGate("decode", GateSettings(max_concurrency=1, max_waiting=0, max_wait=0))
+        async with gate.slot():
+            assert gate.saturated
+            with pytest.raises(Overloaded) as excinfo:
+                gate.check()
+            assert excinfo.value.reason == "queue_full"
+            # バックグラウンドジョブは断らない
+            with background():
+                gate.check()
+
+    asyncio.run(run())
+
+
+def test_gate_times_out_waiting():
+    async def run():
+        gate = ConcurrencyGate("decode", GateSettings(max_concurrency=1, max_waiting=1, max_wait=0.05))
+        async with gate.slot():
+            with pytest.raises(Overloaded) as excinfo:
+                async with gate.slot():
+                    pass
+            return excinfo.value.reason
+
+    assert asyncio.run(run()) == "timeout"
+
+
+def make_client(trusted_proxies: int) -> TestClient:
+    app = FastAPI()
+
+    @app.post("/api/analyze-speech")
+    async def analyze():
+        return {"ok": True}
+
+    rule = RateRule("speech", ["/api/analyze-speech"], per_client=Rate(1, 60))
+    app.add_middleware(AdmissionMiddleware, rules=[rule], trusted_proxies=trusted_proxies)
+    return TestClient(app)
+
+
+def test_rate_limited_response():
+    client = make_client(trusted_proxies=0)
+    assert client.post("/api/analyze-speech").status_code == 200
+    response = client.post("/api/analyze-speech")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "60"
+    assert response.json()["retry_after"] == 60
+
+
+def test_spoofed_forwarded_for_does_not_bypass_limit():
+    client = make_client(trusted_proxies=1)
+    # プロキシは接続元（203.0.113.7）を右端に付け足す。左側はクライアントが自由に書ける
+    for spoofed in ("1.1.1.1", "2.2.2.2"):
+        headers = {"X-Forwarded-For": f"{spoofed}, 203.0.113.7"}
+        status = client.post("/api/analyze-speech", headers=headers).status_code
+    assert status == 429
+    headers = {"X-Forwarded-For": "198.51.100.1"}
+    assert client.post("/api/analyze-speech", headers=headers).status_code == 200
+
+
+def test_forwarded_for_counts_trusted_hops():
+    middleware = AdmissionMiddleware(None, [], trusted_proxies=2)
+
+    def client(*values):
+        headers = [(b"x-forwarded-for", value.encode()) for value in values]
+        return middleware._client({"headers": headers, "client": ("10.0.0.2", 1234)})
+
+    assert client("1.1.1.1, 203.0.113.7, 10.0.0.1") == "203.0.113.7"
+    # 複数のヘッダーは順につなげたものとして扱う
+    assert client("1.1.1.1, 203.0.113.7", "10.0.0.1") == "203.0.113.7"
+    # 段数より短ければ、プロキシを経由していないので接続元を使う
+    assert client("203.0.113.7") == "10.0.0.2"
+
+
+def test_forwarded_for_ignored_without_trusted_proxies():
+    scope = {"headers": [(b"x-forwarded-for", b"1.1.1.1")], "client": ("10.0.0.2", 1234)}
+    assert AdmissionMiddleware(None, [])._client(scope) == "10.0.0.2"
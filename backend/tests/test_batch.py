@@ -0,0 +1,103 @@
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from betterways import batch
+from betterways.routers import speech
+from betterways.uploads import UploadTooLarge
+
+
+def parse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def make_zip(members: dict, compression=zipfile.ZIP_STORED) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # プロバイダーとデコードを呼ばずに、ルートの流れ（期限・並列・イベント）だけを通す
+    async def prepare_upload(upload):
+        return None
+
+    async def decode_duration(path):
+        return 3.0
+
+    async def transcribe_audio(file_path, provider, audio_hash=None, duration_seconds=0.0, audio=None):
+        return {"text": "今日は良い天気です", "segments": [{"start": 0.0, "end": 3.0, "text": "今日は良い天気です"}]}
+
+    async def get_batch_feedback(transcripts, provider):
+        return {index: "よく話せています" for index in transcripts}
+
+    monkeypatch.setattr(speech, "prepare_upload", prepare_upload)
+    monkeypatch.setattr(speech, "decode_duration", decode_duration)
+    monkeypatch.setattr(speech, "transcribe_audio", transcribe_audio)
+    monkeypatch.setattr(speech, "get_batch_feedback", get_batch_feedback)
+    app = FastAPI()
+    app.include_router(speech.router)
+    return TestClient(app)
+
+
+def test_batch_analyzes_each_file(client):
+    files = [
+        ("files", ("a.wav", b"RIFF-a", "audio/wav")),
+        ("files", ("b.wav", b"RIFF-b", "audio/wav")),
+    ]
+    response = client.post("/api/analyze-speech/batch", files=files, data={"provider": "openai"})
+    assert response.status_code == 200
+
+    events = parse_events(response.text)
+    names = [name for name, _ in events]
+    assert "item_error" not in names, events
+    assert sorted(data["filename"] for name, data in events if name == "item") == ["a.wav", "b.wav"]
+    assert events[-1] == ("done", {"completed": 2, "failed": 0})
+
+
+def test_extract_zip_limits_each_member_and_total(tmp_path):
+    path = tmp_path / "clips.zip"
+    path.write_bytes(make_zip({"a.wav": b"x" * 80, "b.wav": b"x" * 80, "notes.txt": b"x" * 500}))
+
+    extracted = batch.extract_zip(str(path), 100, 1000, 10)
+    try:
+        assert [(name, upload.size) for name, upload in extracted] == [("a.wav", 80), ("b.wav", 80)]
+    finally:
+        speech.remove_batch_uploads(extracted)
+
+    with pytest.raises(UploadTooLarge) as excinfo:
+        batch.extract_zip(str(path), 50, 1000, 10)
+    assert excinfo.value.max_bytes == 50
+    with pytest.raises(UploadTooLarge) as excinfo:
+        batch.extract_zip(str(path), 100, 150, 10)
+    assert excinfo.value.max_bytes == 150
+
+
+def test_batch_zip_of_clips_under_per_file_limit(client, monkeypatch):
+    # 1件ずつは録音ごとの上限以下でも、合計は上回る zip
+    monkeypatch.setattr(speech, "MAX_UPLOAD_BYTES", 100)
+    monkeypatch.setattr(speech, "BATCH_MAX_BYTES", 1000)
+    archive = make_zip({"a.wav": b"x" * 80, "b.wav": b"x" * 80, "c.wav": b"x" * 80})
+    files = [("files", ("clips.zip", archive, "application/zip"))]
+    response = client.post("/api/analyze-speech/batch", files=files, data={"provider": "openai"})
+    assert response.status_code == 200
+    assert parse_events(response.text)[-1] == ("done", {"completed": 3, "failed": 0})
+
+    # zip 自体は小さくても、展開後の合計がボディ全体の上限を超えたら 413
+    monkeypatch.setattr(speech, "MAX_UPLOAD_BYTES", 1000)
+    monkeypatch.setattr(speech, "BATCH_MAX_BYTES", 2500)
+    archive = make_zip({"a.wav": b"x" * 900, "b.wav": b"x" * 900, "c.wav": b"x" * 900}, zipfile.ZIP_DEFLATED)
+    assert len(archive) < 1000
+    files = [("files", ("clips.zip", archive, "application/zip"))]
+    assert client.post("/api/analyze-speech/batch", files=files, data={"provider": "openai"}).status_code == 413
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from betterways.jobs import CallbackPolicy, InvalidCallbackURL, JobQueue, JobStore, QueueFull, check_callback_url
+
+
+def make_queue(tmp_path, handler, **kwargs) -> JobQueue:
+    return JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), handler, str(tmp_path / "storage"), **kwargs)
+
+
+def audio_file(tmp_path, name: str) -> str:
+    path = tmp_path / name
+    path.write_bytes(b"audio")
+    return str(path)
+
+
+async def wait_finished(queue: JobQueue, job_id: str, timeout: float = 5.0) -> dict:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = queue.get(job_id)
+        if job["status"] in ("completed", "failed"):
+            return job
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError(f"job {job_id} is still {job['status']}")
+        await asyncio.sleep(0.01)
+
+
+def test_worker_survives_failing_job(tmp_path):
+    async def handler(params):
+        if params["fail"]:
+            raise RuntimeError("boom")
+        return {"ok": True}
+
+    async def run():
+        queue = make_queue(tmp_path, handler, workers=1)
+        await queue.start()
+        try:
+            failed = queue.submit(audio_file(tmp_path, "a.wav"), {"fail": True})
+            completed = queue.submit(audio_file(tmp_path, "b.wav"), {"fail": False})
+            return await wait_finished(queue, failed), await wait_finished(queue, completed)
+        finally:
+            await queue.stop()
+
+    failed, completed = asyncio.run(run())
+    assert failed["status"] == "failed" and failed["error"] == "boom"
+    assert completed["status"] == "completed" and completed["result"] == {"ok": True}
+
+
+def test_worker_survives_malformed_callback(tmp_path):
+    async def handler(params):
+        return {"ok": True}
+
+    async def run():
+        # 受け付け時の検証を通らない URL でも、ワーカーは止まらない
+        queue = make_queue(tmp_path, handler, workers=1, callback_policy=CallbackPolicy(allow_private=True))
+        await queue.start()
+        try:
+            first = queue.submit(audio_file(tmp_path, "a.wav"), {}, callback_url="http://[::1")
+            second = queue.submit(audio_file(tmp_path, "b.wav"), {})
+            return await wait_finished(queue, first), await wait_finished(queue, second)
+        finally:
+            await queue.stop()
+
+    first, second = asyncio.run(run())
+    assert first["status"] == "completed"
+    assert second["status"] == "completed"
+
+
+def test_worker_survives_unexpected_notify_error(tmp_path):
+    async def handler(params):
+        return {"ok": True}
+
+    async def broken_notify(callback_url, payload):
+        raise RuntimeError("unexpected")
+
+    async def run():
+        queue = make_queue(tmp_path, handler, workers=1)
+        queue._notify = broken_notify
+        await queue.start()
+        try:
+            queue.submit(audio_file(tmp_path, "a.wav"), {}, callback_url="https://example.com/cb")
+            second = queue.submit(audio_file(tmp_path, "b.wav"), {})
+            return await wait_finished(queue, second)
+        finally:
+            await queue.stop()
+
+    assert asyncio.run(run())["status"] == "completed"
+
+
+def test_queue_full_has_retry_after(tmp_path):
+    async def handler(params):
+        await asyncio.sleep(10)
+
+    async def run():
+        queue = make_queue(tmp_path, handler, workers=1, max_queue=1)
+        # ワーカーは起動せず、待ち行列だけを埋める
+        queue._queue = asyncio.Queue()
+        queue.submit(audio_file(tmp_path, "a.wav"), {})
+        with pytest.raises(QueueFull) as excinfo:
+            queue.submit(audio_file(tmp_path, "b.wav"), {})
+        return excinfo.value.retry_after
+
+    assert asyncio.run(run()) >= 1
+
+
+@pytest.mark.parametrize("url", [
+    "http://[::1",
+    "ftp://example.com/cb",
+    "/relative/path",
+    "http://127.0.0.1/cb",
+    "http://localhost:8000/cb",
+    "http://10.0.0.5/cb",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::ffff:127.0.0.1]/cb",
+])
+def test_rejects_invalid_or_internal_callback(url):
+    with pytest.raises(InvalidCallbackURL):
+        asyncio.run(check_callback_url(url))
+
+
+def test_accepts_public_callback_and_allowlist():
+    asyncio.run(check_callback_url("https://93.184.216.34/cb"))
+    policy = CallbackPolicy(allowed_hosts=(".example.com",), allow_private=True)
+    asyncio.run(check_callback_url("https://hooks.example.com/cb", policy))
+    with pytest.raises(InvalidCallbackURL):
+        asyncio.run(check_callback_url("https://example.org/cb", policy))
+    # 開発用に内部ネットワーク宛てを許可できる
+    asyncio.run(check_callback_url("http://localhost:8000/cb", CallbackPolicy(allow_private=True)))
@@ -0,0 +1,33 @@
+import numpy as np
+import soundfile as sf
+
+from betterways.preprocess import prepare_audio
+from betterways.segmentation import SAMPLE_RATE
+
+
+def write_tone(path, seconds: float, silence: float):
+    """前後に silence 秒の無音を挟んだ正弦波"""
+    tone = 0.3 * np.sin(2 * np.pi * 220 * np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE)
+    gap = np.zeros(int(silence * SAMPLE_RATE))
+    sf.write(path, np.concatenate([gap, tone, gap]).astype(np.float32), SAMPLE_RATE, format=path.rsplit(".", 1)[-1].upper())
+
+
+def test_trimmed_audio_keeps_speech_bounds(tmp_path):
+    path = str(tmp_path / "speech.wav")
+    write_tone(path, seconds=2.0, silence=1.0)
+    audio = prepare_audio(path, "flac")
+    try:
+        assert audio.path != path
+        assert 0.5 < audio.start < 1.0 and 3.0 < audio.end < 3.5
+    finally:
+        audio.discard()
+
+
+def test_original_file_is_not_trimmed(tmp_path):
+    # 再エンコードしても小さくならない（元から圧縮済み）なら元のファイルを送るので、区間は録音全体
+    path = str(tmp_path / "speech.ogg")
+    write_tone(path, seconds=2.0, silence=1.0)
+    audio = prepare_audio(path, "flac")
+    assert audio.path == path
+    assert (audio.start, audio.end) == (0.0, audio.duration)
+    assert audio.report()["trimmed_seconds"] == 0
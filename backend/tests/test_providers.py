@@ -0,0 +1,30 @@
+from betterways.providers import GeminiProvider
+
+
+class FakeModel:
+    def start_chat(self, history):
+        return history
+
+
+def start_chat(system, history):
+    provider = GeminiProvider("test-key")
+    provider.model = FakeModel()
+    return provider._start_chat(system, history)
+
+
+def test_system_prompt_joins_first_user_turn():
+    history = [{"role": "user", "content": "こんにちは"}, {"role": "assistant", "content": "どうぞ"}]
+    assert start_chat("指示", history) == [
+        {"role": "user", "parts": ["指示", "こんにちは"]},
+        {"role": "model", "parts": ["どうぞ"]},
+    ]
+
+
+def test_system_prompt_is_never_in_model_turn():
+    # 応答から始まる履歴では、先頭に user のターンを足す
+    history = [{"role": "assistant", "content": "前回の回答"}, {"role": "user", "content": "続き"}]
+    assert start_chat("指示", history) == [
+        {"role": "user", "parts": ["指示"]},
+        {"role": "model", "parts": ["前回の回答"]},
+        {"role": "user", "parts": ["続き"]},
+    ]
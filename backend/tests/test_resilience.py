@@ -0,0 +1,204 @@
+import asyncio
+
+import pytest
+
+from betterways.resilience import (
+    CircuitBreaker,
+    CircuitOpen,
+    ResilienceSettings,
+    ResilientProvider,
+    breaker_for,
+    deadline,
+)
+
+
+class FakeProvider:
+    def __init__(self, name: str = "fake"):
+        self.name = name
+        self.calls = 0
+        self.generate_result = lambda: "ok"
+        self.chunks = ["a", "b"]
+        self.chunk_delay = 0.0
+
+    async def generate(self, prompt, system=None, history=None):
+        self.calls += 1
+        result = self.generate_result()
+        return await result if asyncio.iscoroutine(result) else result
+
+    async def stream(self, prompt, system=None, history=None):
+        self.calls += 1
+        for chunk in self.chunks:
+            await asyncio.sleep(self.chunk_delay)
+            yield chunk
+
+
+def settings(**kwargs) -> ResilienceSettings:
+    values = dict(max_attempts=1, base_delay=0.0, max_delay=0.0, timeout=5.0, breaker_failures=1, breaker_reset=0.05)
+    values.update(kwargs)
+    return ResilienceSettings(**values)
+
+
+def test_breaker_transitions(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    # 試しに通すのは1件だけ
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_breaker_reopens_when_trial_fails(clock):
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=10, clock=clock)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_released_trial_allows_another_attempt(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow() and not breaker.allow()
+    breaker.release_trial()
+    assert breaker.state == "half_open" and breaker.allow()
+
+
+def open_breaker(provider: FakeProvider, resilient: ResilientProvider):
+    async def fail():
+        raise TimeoutError()
+
+    provider.generate_result = fail
+    with pytest.raises(TimeoutError):
+        asyncio.run(resilient.generate("hi"))
+    assert breaker_for(provider, resilient.settings).state == "open"
+
+
+def test_cancelled_trial_does_not_stick():
+    provider = FakeProvider()
+    resilient = ResilientProvider(provider, settings=settings())
+    open_breaker(provider, resilient)
+
+    async def run():
+        await asyncio.sleep(0.06)
+        # half_open の試しの1件が、結果を出す前に取り消される
+        provider.generate_result = lambda: asyncio.sleep(10)
+        task = asyncio.ensure_future(resilient.generate("hi"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        provider.generate_result = lambda: "ok"
+        return await resilient.generate("hi")
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker_for(provider, resilient.settings).state == "closed"
+
+
+def test_abandoned_stream_trial_does_not_stick():
+    provider = FakeProvider()
+    resilient = ResilientProvider(provider, settings=settings())
+    open_breaker(provider, resilient)
+
+    async def run():
+        await asyncio.sleep(0.06)
+        # 最初の断片が届く前に読むのをやめる
+        provider.chunk_delay = 10
+        task = asyncio.ensure_future(anext(resilient.stream("hi")))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        provider.chunk_delay = 0
+        return [chunk async for chunk in resilient.stream("hi")]
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_open_breaker_rejects_stream():
+    provider = FakeProvider()
+    resilient = ResilientProvider(provider, settings=settings(breaker_reset=60))
+    open_breaker(provider, resilient)
+
+    async def run():
+        return [chunk async for chunk in resilient.stream("hi")]
+
+    with pytest.raises(CircuitOpen):
+        asyncio.run(run())
+
+
+def test_stream_times_out_between_chunks():
+    provider = FakeProvider()
+    provider.chunk_delay = 0.2
+    resilient = ResilientProvider(provider, settings=settings(timeout=0.05, breaker_failures=5))
+
+    async def run():
+        return [chunk async for chunk in resilient.stream("hi")]
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+
+
+def test_deadline_narrows_calls():
+    provider = FakeProvider()
+    provider.generate_result = lambda: asyncio.sleep(1)
+    resilient = ResilientProvider(provider, settings=settings(timeout=5, breaker_failures=5))
+
+    async def run():
+        with deadline(0.05):
+            await resilient.generate("hi")
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+
+
+def test_stream_does_not_back_off_past_deadline():
+    class SlowBackoff:
+        def uniform(self, low, high):
+            return high
+
+    class Failing(FakeProvider):
+        async def stream(self, prompt, system=None, history=None):
+            self.calls += 1
+            raise TimeoutError()
+            yield
+
+    provider = Failing()
+    resilient = ResilientProvider(
+        provider, settings=settings(max_attempts=5, base_delay=10, max_delay=10, breaker_failures=5), rng=SlowBackoff()
+    )
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with deadline(0.5):
+            with pytest.raises(TimeoutError):
+                async for _ in resilient.stream("hi"):
+                    pass
+        return loop.time() - started
+
+    # 次の試行までの待ちが期限を越えるので、待たずに諦める
+    assert asyncio.run(run()) < 0.4
+    assert provider.calls == 1
+
+
+def test_deadline_zero_is_unlimited():
+    provider = FakeProvider()
+    resilient = ResilientProvider(provider, settings=settings())
+
+    async def run():
+        with deadline(0):
+            return await resilient.generate("hi")
+
+    assert asyncio.run(run()) == "ok"
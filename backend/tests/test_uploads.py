@@ -0,0 +1,33 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from betterways.uploads import UploadSizeLimitMiddleware
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/analyze-speech")
+    @app.post("/api/analyze-speech/batch")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    # app.py と同じく、録音ごとの上限からバッチを外し、バッチにはボディ全体の上限を掛ける
+    app.add_middleware(
+        UploadSizeLimitMiddleware, max_bytes=1000, path_prefixes=["/api/analyze-speech"],
+        exclude_prefixes=["/api/analyze-speech/batch"],
+    )
+    app.add_middleware(UploadSizeLimitMiddleware, max_bytes=3000, path_prefixes=["/api/analyze-speech/batch"])
+    return app
+
+
+def test_per_file_limit():
+    client = TestClient(make_app())
+    assert client.post("/api/analyze-speech", content=b"x" * 1000).status_code == 200
+    assert client.post("/api/analyze-speech", content=b"x" * 1001).status_code == 413
+
+
+def test_batch_uses_its_own_limit():
+    client = TestClient(make_app())
+    assert client.post("/api/analyze-speech/batch", content=b"x" * 2000).json() == {"size": 2000}
+    assert client.post("/api/analyze-speech/batch", content=b"x" * 3001).status_code == 413